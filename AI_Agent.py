@@ -6,18 +6,39 @@ from langchain_core.tools import tool
 import os
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode
 from supabase import create_client, Client
+from supabase_coalescing import coalescing
+from tool_executor import ParallelToolNode, get_tool_executor
+from agent_graph import DIRECT_FINISH, after_tools, ainvoke_model, graph_node, invoke_model, prompt_for_mode, tools_for_mode, tools_within_budget
+from fast_path import FastPathRouter
+from intent_classifier import IntentResult, classify_intent
+from conversation_memory import TokenBudgetMemory, model_summarizer
+from model_router import RoutedChatModel
+from prompt_cache import prefix_cache
+from request_context import ChatRequest, ToolResultStash, count_llm_call, current_budget, current_supabase_client, memoized, request_scope, tool_result_scope
+from chat_stream import stream_chat
+from response_cache import response_cache
+from profile_cache import profile_cache
+from restaurant_catalog import RestaurantCatalog
+from restaurant_cards import CARD_IMAGE_FIELDS, restaurant_cards
+from speculative_prefetch import SpeculativePrefetcher, speculation_stats
+from tool_output import restaurants_for_llm
+from temporal_parser import TemporalResolution, resolve_relative_date, resolve_temporal_expressions
 from typing import cast
-from datetime import datetime, timedelta
+from datetime import datetime
 from dateutil import tz
 from availability_tools import (
     check_any_time_slots as av_check_any_time_slots,
     get_available_time_slots as av_get_available_time_slots,
     get_table_options_for_slot as av_get_table_options_for_slot,
+    prefetch_available_time_slots,
     search_time_range as av_search_time_range,
 )
+import asyncio
+import contextvars
 import json
+from concurrent.futures import Future
+from dataclasses import dataclass
 from typing import List
 
 load_dotenv()
@@ -28,7 +49,8 @@ key: str = os.environ.get("EXPO_PUBLIC_SUPABASE_ANON_KEY")
 supabase: Optional[Client] = None
 try:
     if url and key:
-        supabase = create_client(url, key)
+        # Identical concurrent reads share one network call
+        supabase = coalescing(create_client(url, key))
     else:
         print("Supabase env vars missing; tools will respond gracefully")
 except Exception as _e:
@@ -44,77 +66,34 @@ _LOCAL_TZ = tz.gettz(os.getenv("AVAILABILITY_TZ", "Asia/Beirut")) or tz.UTC
 
 def get_supabase_client() -> Optional[Client]:
     """Get the appropriate Supabase client (authenticated if available, otherwise global)"""
-    import threading
-    if hasattr(threading.current_thread(), 'supabase_client'):
-        return threading.current_thread().supabase_client
-    return supabase
-
-# Conversation memory system
-class ConversationMemory:
-    def __init__(self, max_history: int = 20):
-        """Initialize conversation memory with a maximum history limit."""
-        self.messages: List[BaseMessage] = []
-        self.max_history = max_history
-    
-    def add_message(self, message: BaseMessage):
-        """Add a message to the conversation history."""
-        self.messages.append(message)
-        # Keep only the most recent messages to prevent context overflow
-        if len(self.messages) > self.max_history:
-            self.messages = self.messages[-self.max_history:]
-    
-    def get_messages(self) -> List[BaseMessage]:
-        """Get all messages in the conversation history."""
-        return self.messages.copy()
-    
-    def clear(self):
-        """Clear the conversation history."""
-        self.messages.clear()
-    
-    def get_context_size(self) -> int:
-        """Get the number of messages in history."""
-        return len(self.messages)
+    request_client = current_supabase_client()
+    return request_client if request_client is not None else supabase
+
+# Conversation memory system: token-budgeted ring buffer with rolling summary
+class ConversationMemory(TokenBudgetMemory):
+    """Customer conversation memory; see conversation_memory.TokenBudgetMemory."""
 
 # Global conversation memory instance for interactive sessions
 conversation_memory = ConversationMemory()
 
-def create_conversation_memory(max_history: int = 20) -> ConversationMemory:
-    """Create a new conversation memory instance for external use."""
-    return ConversationMemory(max_history)
+def create_conversation_memory(max_history: int = 20, token_budget: Optional[int] = None) -> ConversationMemory:
+    """Create a new conversation memory instance for external use.
+    Set MEMORY_SUMMARIZER=model to compact old turns with the chat model instead of locally."""
+    summarizer = model_summarizer(base_llm.for_profile("memory_summary")) if os.getenv("MEMORY_SUMMARIZER") == "model" else None
+    return ConversationMemory(max_history, token_budget=token_budget, summarizer=summarizer)
 
 tools = []
 
 @tool
 def convertRelativeDate(relative_date: str) -> str:
-    """Convert relative dates like 'today', 'tomorrow', 'yesterday' to YYYY-MM-DD format.
+    """Convert relative dates like 'today', 'tomorrow', 'next Friday', 'in 3 days', 'this weekend' to YYYY-MM-DD format.
     Examples: 'today' -> '2025-08-14', 'tomorrow' -> '2025-08-15', 'next Monday' -> '2025-08-18'
-    Always use this tool when user mentions relative dates before calling availability tools."""
+    Only needed when the user message has no [Resolved date/time: ...] note for the date."""
     print(f"AI is converting relative date: {relative_date}")
     try:
-        now_local = datetime.now(_LOCAL_TZ)
-        today_local = now_local.date()
-        
-        relative_lower = relative_date.lower().strip()
-        
-        if relative_lower in ['today', 'tod', 'tonight']:
-            return today_local.strftime("%Y-%m-%d")
-        elif relative_lower in ['tomorrow', 'tmr', 'tmrw']:
-            return (today_local + timedelta(days=1)).strftime("%Y-%m-%d")
-        elif relative_lower in ['yesterday', 'yest']:
-            return (today_local - timedelta(days=1)).strftime("%Y-%m-%d")
-        elif relative_lower in ['day after tomorrow', 'overmorrow']:
-            return (today_local + timedelta(days=2)).strftime("%Y-%m-%d")
-        elif 'next week' in relative_lower:
-            return (today_local + timedelta(days=7)).strftime("%Y-%m-%d")
-        elif 'this weekend' in relative_lower:
-            # Find next Saturday
-            days_until_saturday = (5 - today_local.weekday()) % 7
-            if days_until_saturday == 0 and now_local.hour > 18:  # If it's Saturday evening, go to next Saturday
-                days_until_saturday = 7
-            return (today_local + timedelta(days=days_until_saturday)).strftime("%Y-%m-%d")
-        else:
-            # If not a recognized relative date, return as-is (might be already in YYYY-MM-DD format)
-            return relative_date
+        resolved = resolve_relative_date(relative_date, datetime.now(_LOCAL_TZ))
+        # If not a recognized relative date, return as-is (might be already in YYYY-MM-DD format)
+        return resolved or relative_date
             
     except Exception as e:
         print(f"Error converting relative date: {e}")
@@ -123,7 +102,8 @@ def convertRelativeDate(relative_date: str) -> str:
 
 tools.append(convertRelativeDate)
 
-system_prompt = """
+# System prompt sections; the full prompt and the compact per-intent profiles are built from these
+_PROMPT_INTRO = """
 You are a specialized restaurant assistant for Plate your name is DineMate, a restaurant reservation app.
 
 ## YOUR ROLE
@@ -141,7 +121,9 @@ You have access to comprehensive restaurant information:
 - Features: outdoor seating, parking, shisha availability
 - Opening hours and booking policies
 - Real-time availability data
+"""
 
+_PROMPT_RESPONSE_FORMAT = """
 ## RESPONSE FORMAT
 When showing restaurants to users, ALWAYS use this exact format:
 
@@ -155,15 +137,18 @@ When showing restaurants to users, ALWAYS use this exact format:
 I found some great Italian restaurants for you!
 RESTAURANTS_TO_SHOW: restaurant-1,restaurant-2,restaurant-3
 ```
+"""
 
+_PROMPT_RECOMMENDATION_RULES = """
 ## RESTAURANT RECOMMENDATION RULES
 - **ALWAYS** use database tools first - never guess or invent restaurant IDs
 - **ALWAYS** prioritize restaurants where ai_featured = true, then by highest average_rating
 - **LIMIT** to maximum 5 restaurant IDs
+- Search tools return a compact table: {"fields": [...], "rows": [[...]], "total": N}; read each row by the field names and use its "id" for RESTAURANTS_TO_SHOW
 - **CALL** finishedUsingTools after completing any tool usage
+"""
 
-## WORKFLOW GUIDELINES
-
+_PROMPT_DISCOVERY_WORKFLOW = """
 ### For Restaurant Discovery/Recommendations:
 1. Use appropriate search tool (by cuisine, name, featured, or advanced filters)
 2. **IF USER PROFILE PROVIDED:** Consider user's allergies, dietary restrictions, and favorite cuisines
@@ -178,19 +163,24 @@ RESTAURANTS_TO_SHOW: restaurant-1,restaurant-2,restaurant-3
 - Use preferred_party_size for availability queries if not specified by user
 - Mention user's favorite_cuisines in recommendations when relevant
 - Reference loyalty_points for special offers or tier-based suggestions
+"""
 
+_PROMPT_AVAILABILITY_WORKFLOW = """
 ### For Availability Questions:
-1. **FIRST:** Convert relative dates using convertRelativeDate tool
-   - "today", "tomorrow", "tonight" → YYYY-MM-DD format
+1. **FIRST:** Get the date in YYYY-MM-DD format
+   - If the user message ends with a [Resolved date/time: ...] note, use those dates and times directly
+   - Otherwise convert relative dates ("today", "tomorrow", "tonight") using convertRelativeDate tool
 2. **SECOND:** Find restaurant using getRestaurantsByName
 3. **THIRD:** Use availability tools with converted date:
    - checkAnyTimeSlots (yes/no availability)
-   - getAvailableTimeSlots (list specific times)
+   - getAvailableTimeSlots (available times as ranges, e.g. "18:00–21:30 every 15m")
    - getTableOptionsForSlot (table details for specific time)
    - searchTimeRange (explore time windows)
 4. **PARTY SIZE:** Use user's preferred_party_size from profile if available, otherwise assume 2 people (state this clearly)
 5. **FINISH:** Call finishedUsingTools
+"""
 
+_PROMPT_CONSTRAINTS = """
 ## STRICT CONSTRAINTS
 **SCOPE LIMITATIONS:**
 - ONLY answer restaurant, dining, and reservation questions
@@ -208,6 +198,44 @@ RESTAURANTS_TO_SHOW: restaurant-1,restaurant-2,restaurant-3
 - For direct responses (general service questions): respond without tools
 - Keep all responses focused on restaurant discovery and booking assistance
 """
+
+_PROMPT_COMPACT_CONSTRAINTS = """
+## CONSTRAINTS
+- ONLY answer restaurant, dining, and reservation questions; politely redirect anything else
+- Base answers on tool data only; NEVER fabricate restaurant IDs or information
+"""
+
+system_prompt = (
+    _PROMPT_INTRO
+    + _PROMPT_RESPONSE_FORMAT
+    + _PROMPT_RECOMMENDATION_RULES
+    + "\n## WORKFLOW GUIDELINES\n"
+    + _PROMPT_DISCOVERY_WORKFLOW
+    + _PROMPT_AVAILABILITY_WORKFLOW
+    + _PROMPT_CONSTRAINTS
+)
+
+discovery_prompt = (
+    "\nYou are DineMate, the restaurant assistant of the Plate reservation app. "
+    "Help the user discover restaurants that match their preferences using the search tools.\n"
+    + _PROMPT_RESPONSE_FORMAT
+    + _PROMPT_RECOMMENDATION_RULES
+    + _PROMPT_DISCOVERY_WORKFLOW
+    + _PROMPT_COMPACT_CONSTRAINTS
+)
+
+availability_prompt = (
+    "\nYou are DineMate, the restaurant assistant of the Plate reservation app. "
+    "Answer table availability questions for specific restaurants using the availability tools.\n"
+    + _PROMPT_AVAILABILITY_WORKFLOW
+    + _PROMPT_COMPACT_CONSTRAINTS
+)
+
+small_talk_prompt = """
+You are DineMate, the friendly restaurant assistant of the Plate reservation app.
+Reply briefly and warmly. You can help users find restaurants, explore cuisines, and check table availability; invite them to ask.
+Politely redirect non-restaurant topics. Never invent restaurant names or IDs.
+"""
 restaurants_table_columns:str = "id, name, description, address, tags, opening_time, closing_time, cuisine_type, price_range, average_rating, dietary_options, ambiance_tags, outdoor_seating, ai_featured"
 @tool
 def finishedUsingTools() -> str:
@@ -222,33 +250,41 @@ tools.append(finishedUsingTools)
 
 def fetch_user_profile(user_id: str, client: Optional[Client] = None) -> Optional[dict]:
     """Fetch user profile data externally (not as an AI tool).
-    Returns user profile dict or None if not found/error."""
+    Returns user profile dict or None if not found/error. Profiles are cached briefly (profile_cache)."""
     try:
         client_to_use = client if client else supabase
         if not client_to_use or not user_id or not user_id.strip():
             return None
-        
-        print(f"Fetching user profile for user_id: {user_id}")
-        result = (
-            client_to_use
-            .table("profiles")
-            .select("full_name, allergies, favorite_cuisines, dietary_restrictions, preferred_party_size, loyalty_points")
-            .eq("id", user_id.strip())
-            .execute()
-        )
-        
-        if not result.data or len(result.data) == 0:
-            print(f"No profile found for user_id: {user_id}")
-            return None
-        
-        user_profile = result.data[0]
-        print(f"Retrieved user profile: {user_profile}")
+        user_id = user_id.strip()
+        user_profile = profile_cache.get_or_fetch(user_id, client_to_use, lambda: _query_user_profile(user_id, client_to_use))
+        if user_profile:
+            print(f"Using profile for user_id {user_id} (fields: {', '.join(k for k, v in user_profile.items() if v)})")
         return user_profile
         
     except Exception as e:
         print(f"Error fetching user profile: {e}")
         return None
 
+def _query_user_profile(user_id: str, client: Client) -> Optional[dict]:
+    print(f"Fetching user profile for user_id: {user_id}")
+    result = (
+        client
+        .table("profiles")
+        .select("full_name, allergies, favorite_cuisines, dietary_restrictions, preferred_party_size, loyalty_points")
+        .eq("id", user_id)
+        .execute()
+    )
+    if not result.data:
+        print(f"No profile found for user_id: {user_id}")
+        return None
+    return result.data[0]
+
+def prefetch_user_profile(user_id: Optional[str], client: Optional[Client] = None) -> Optional[Future]:
+    """Start fetch_user_profile in the background; a later fetch for the same user joins it."""
+    if not user_id or not (client or supabase):
+        return None
+    return get_tool_executor().submit(contextvars.copy_context().run, fetch_user_profile, user_id, client)
+
 @tool
 def getAllCuisineTypes() -> str:
     """Return the unique cuisine types available in the application"""
@@ -298,7 +334,7 @@ def getRestaurantsByCuisineType(cuisineType: str) -> str:
             return f"No restaurants found with cuisine type: {cuisineType}"
         
         print(f"Found {len(restaurants)} restaurants")
-        return json.dumps(restaurants)
+        return restaurants_for_llm("getRestaurantsByCuisineType", restaurants)
     except Exception as e:
         print(f"Error fetching restaurants: {e}")
         return f"Error retrieving restaurants for cuisine type: {cuisineType}"
@@ -326,8 +362,8 @@ def getAllRestaurants() -> str:
 
         if not restaurants:
             return "No restaurants found"
-        print("the restaurants found are: "+str(restaurants))
-        return json.dumps(restaurants)
+        print(f"Found {len(restaurants)} restaurants")
+        return restaurants_for_llm("getAllRestaurants", restaurants)
     
     except Exception as e:
         print(f"Error fetching restaurants: {e}")
@@ -343,19 +379,22 @@ def getFeaturedRestaurants(limit: int = 10) -> str:
         if not supabase:
             return json.dumps([])
         lim = max(1, min(int(limit or 10), 100))
-        result = (
-            supabase
-            .table("restaurants")
-            .select(restaurants_table_columns)
-            .eq("ai_featured", True)
-            .order("average_rating", desc=True)
-            .limit(lim)
-            .execute()
-        )
-        restaurants = result.data
+        # Served from the in-memory catalog; query only if it couldn't load
+        restaurants = restaurant_catalog.top(lim, featured_only=True) if restaurant_catalog.rows() else None
+        if restaurants is None:
+            result = (
+                supabase
+                .table("restaurants")
+                .select(restaurants_table_columns)
+                .eq("ai_featured", True)
+                .order("average_rating", desc=True)
+                .limit(lim)
+                .execute()
+            )
+            restaurants = result.data
         if not restaurants:
             return json.dumps([])
-        return json.dumps(restaurants)
+        return restaurants_for_llm("getFeaturedRestaurants", restaurants, top_k=lim)
     except Exception as e:
         print(f"Error fetching featured restaurants: {e}")
         return json.dumps([])
@@ -370,35 +409,42 @@ def getRestaurantsByName(query: str) -> str:
     try:
         if not supabase:
             return json.dumps([])
-        pattern = f"%{q}%" if q else "%"
-        result = (
+        return restaurants_for_llm("getRestaurantsByName", _restaurants_by_name(q))
+    except Exception as e:
+        print(f"Error searching restaurants by name: {e}")
+        return json.dumps([])
+
+def _restaurants_by_name(q: str, speculative: bool = False) -> Optional[list]:
+    """getRestaurantsByName rows, looked up once per request (speculative prefetch shares it)."""
+    return memoized(("restaurants_by_name", q.lower()), lambda: _query_restaurants_by_name(q), speculative=speculative)
+
+def _query_restaurants_by_name(q: str) -> list:
+    pattern = f"%{q}%" if q else "%"
+    result = (
+        supabase
+        .table("restaurants")
+        .select(restaurants_table_columns)
+        .ilike("name", pattern)
+        .order("ai_featured", desc=True)
+        .order("average_rating", desc=True)
+        .limit(50)
+        .execute()
+    )
+    # If name search is too strict and empty, fallback to description search
+    restaurants = result.data or []
+    if not restaurants and q:
+        result_desc = (
             supabase
             .table("restaurants")
             .select(restaurants_table_columns)
-            .ilike("name", pattern)
+            .ilike("description", pattern)
             .order("ai_featured", desc=True)
             .order("average_rating", desc=True)
             .limit(50)
             .execute()
         )
-        # If name search is too strict and empty, fallback to description search
-        restaurants = result.data or []
-        if not restaurants and q:
-            result_desc = (
-                supabase
-                .table("restaurants")
-                .select(restaurants_table_columns)
-                .ilike("description", pattern)
-                .order("ai_featured", desc=True)
-                .order("average_rating", desc=True)
-                .limit(50)
-                .execute()
-            )
-            restaurants = result_desc.data or []
-        return json.dumps(restaurants)
-    except Exception as e:
-        print(f"Error searching restaurants by name: {e}")
-        return json.dumps([])
+        restaurants = result_desc.data or []
+    return restaurants
 
 tools.append(getRestaurantsByName)
 
@@ -406,7 +452,7 @@ tools.append(getRestaurantsByName)
 def searchRestaurantsAdvanced(filters_json: str) -> str:
     """Advanced restaurant search. Accepts a JSON string with optional fields: 
     {"cuisine":"italian","price_min":1,"price_max":3,"rating_min":4,"has_outdoor":true,"tags":["shisha","parking"],"ambiance":["romantic"]}
-    Returns a JSON list of restaurants sorted by featured then rating.
+    Returns restaurants sorted by featured then rating.
     """
     print(f"AI is running advanced restaurant search with filters: {filters_json}")
     try:
@@ -467,7 +513,7 @@ def searchRestaurantsAdvanced(filters_json: str) -> str:
             .execute()
         )
         items = result.data or []
-        return json.dumps(items)
+        return restaurants_for_llm("searchRestaurantsAdvanced", items)
     except Exception as e:
         print(f"Error in advanced search: {e}")
         return json.dumps([])
@@ -478,6 +524,9 @@ tools.append(searchRestaurantsAdvanced)
 # Availability tools (backend service key based)
 # -----------------------------
 
+# Slot encoding for getAvailableTimeSlots: "ranges" (compact, default) or "list" (one object per 15-minute slot)
+SLOT_ENCODING = os.getenv("AVAILABILITY_SLOT_ENCODING", "ranges")
+
 @tool
 def checkAnyTimeSlots(restaurant_id: str, date: str, party_size: int, user_id: Optional[str] = None) -> str:
     """Return {"available": bool} if at least one slot exists for the given date and party size."""
@@ -491,10 +540,10 @@ tools.append(checkAnyTimeSlots)
 
 @tool
 def getAvailableTimeSlots(restaurant_id: str, date: str, party_size: int, user_id: Optional[str] = None) -> str:
-    """Return a JSON list of {time: 'HH:MM', available: true} slots for the day."""
+    """Return the available slots for the day as {count, ranges}, e.g. ranges ["18:00–21:30 every 15m", "22:15"]."""
     try:
-        slots = av_get_available_time_slots(restaurant_id, date, int(party_size), user_id)
-        return json.dumps(slots)
+        slots = av_get_available_time_slots(restaurant_id, date, int(party_size), user_id, encoding=SLOT_ENCODING)
+        return json.dumps(slots, ensure_ascii=False)
     except Exception as e:
         return json.dumps({"error": str(e)})
 
@@ -523,32 +572,41 @@ def searchTimeRange(restaurant_id: str, date: str, start_time: str, end_time: st
 
 tools.append(searchTimeRange)
 
-# Initialize the model
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash", 
-    api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0
-)
-llm = llm.bind_tools(tools)
+# Initialize the model; each call goes to the model MODEL_ROUTES picks for its step (see model_router)
+def _gemini(model_name: str) -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=model_name, 
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0
+    )
+
+base_llm = RoutedChatModel(_gemini, agent="customer")
+
+def make_agent_node(bound_llm, prompt: str):
+    """Create the agent node for a tool-bound model and system prompt."""
+    def agent_node(state: AgentState) -> AgentState:
+        """Our agent node that processes messages and generates responses."""
+        messages = state["messages"]
+        
+        # Create the full prompt with system message and conversation
+        full_messages = [SystemMessage(content=prompt)] + messages
+        
+        print(f"Sending {len(full_messages)} messages to LLM")
+        
+        # Get response from the model
+        count_llm_call()
+        response = invoke_model(bound_llm, full_messages)
+        
+        # Return the updated state with the new message
+        return {"messages": [response]}
 
-def agent_node(state: AgentState) -> AgentState:
-    """Our agent node that processes messages and generates responses."""
-    messages = state["messages"]
-    
-    # Create the full prompt with system message and conversation
-    full_messages = [SystemMessage(content=system_prompt)] + messages
-    
-    print(f"Sending {len(full_messages)} messages to LLM")
-    
-    # Get response from the model
-    response = llm.invoke(full_messages)
-    
-    # print(f"LLM response type: {type(response)}")
-    # print(f"LLM response content: {response.content}")
-    # print(f"LLM tool calls: {response.tool_calls}")
-    
-    # Return the updated state with the new message
-    return {"messages": [response]}
+    async def aagent_node(state: AgentState) -> AgentState:
+        """agent_node for app.ainvoke(): the model call is awaited."""
+        full_messages = [SystemMessage(content=prompt)] + state["messages"]
+        count_llm_call()
+        return {"messages": [await ainvoke_model(bound_llm, full_messages)]}
+
+    return graph_node(agent_node, aagent_node, "agent")
 
 def should_continue(state: AgentState) -> str:
     """Determine whether to continue with tools or end the conversation"""
@@ -566,8 +624,10 @@ def should_continue(state: AgentState) -> str:
                 print("✅ AI called finishedUsingTools tool - ending")
                 return "end"
         
-        # If there are other tool calls, continue to tools
+        # If there are other tool calls, continue to tools (unless the request budget can't cover them)
         if tool_calls:
+            if not tools_within_budget(tool_calls):
+                return "end"
             print("🔧 AI has tool calls - continuing to tools")
             return "continue"
         
@@ -579,27 +639,114 @@ def should_continue(state: AgentState) -> str:
     print("🔄 Default case - continuing")
     return "continue"
 
-# Create the graph
-graph = StateGraph(AgentState)
-
-# Add nodes
-graph.add_node("agent", agent_node)
-graph.add_node("tools", ToolNode(tools))
-
-# Add edges
-graph.add_edge(START, "agent")
-graph.add_conditional_edges(
-    "agent",
-    should_continue,
-    {
-        "continue": "tools",
-        "end": END
-    }
+@dataclass(frozen=True)
+class AgentProfile:
+    """Prompt and tool subset bound for one class of customer intents (see intent_classifier)."""
+    name: str
+    prompt: str
+    tool_names: Optional[tuple] = None  # None binds every tool
+
+_SEARCH_TOOL_NAMES = (
+    "getAllCuisineTypes", "getRestaurantsByCuisineType", "getAllRestaurants", "getFeaturedRestaurants",
+    "getRestaurantsByName", "searchRestaurantsAdvanced", "finishedUsingTools",
+)
+_AVAILABILITY_TOOL_NAMES = (
+    "convertRelativeDate", "getRestaurantsByName", "checkAnyTimeSlots", "getAvailableTimeSlots",
+    "getTableOptionsForSlot", "searchTimeRange", "finishedUsingTools",
 )
-graph.add_edge("tools", "agent")
 
-# Compile the graph
-app = graph.compile()
+AGENT_PROFILES = {
+    "full": AgentProfile("full", system_prompt),
+    "discovery": AgentProfile("discovery", discovery_prompt, _SEARCH_TOOL_NAMES),
+    "availability": AgentProfile("availability", availability_prompt, _AVAILABILITY_TOOL_NAMES),
+    "small_talk": AgentProfile("small_talk", small_talk_prompt, ()),
+}
+
+def tools_for_profile(profile: AgentProfile, direct_finish: bool = DIRECT_FINISH) -> list:
+    """Return the tools bound for a profile in the given graph mode."""
+    selected = tools if profile.tool_names is None else [t for t in tools if t.name in profile.tool_names]
+    return tools_for_mode(selected, direct_finish)
+
+def create_agent_app(chat_model=None, direct_finish: bool = DIRECT_FINISH, profile: str = "full"):
+    """Compile the customer agent graph.
+    chat_model defaults to the routed Gemini models; direct_finish selects the graph mode (see agent_graph);
+    profile selects the prompt and tool subset from AGENT_PROFILES (and is a model route key)."""
+    agent_profile = AGENT_PROFILES[profile]
+    active_tools = tools_for_profile(agent_profile, direct_finish)
+    model = chat_model or base_llm
+    if isinstance(model, RoutedChatModel):
+        model = model.for_profile(profile)
+    bound_llm = model.bind_tools(active_tools) if active_tools else model
+
+    # Create the graph
+    graph = StateGraph(AgentState)
+
+    # Add nodes
+    graph.add_node("agent", make_agent_node(bound_llm, prompt_for_mode(agent_profile.prompt, direct_finish)))
+    tool_node = ParallelToolNode(active_tools)
+    graph.add_node("tools", graph_node(tool_node, tool_node.acall, "tools"))
+
+    # Add edges
+    graph.add_edge(START, "agent")
+    graph.add_conditional_edges(
+        "agent",
+        should_continue,
+        {
+            "continue": "tools",
+            "end": END
+        }
+    )
+    graph.add_conditional_edges(
+        "tools",
+        after_tools,
+        {
+            "continue": "agent",
+            "end": END
+        }
+    )
+
+    # Compile the graph
+    return graph.compile()
+
+llm = base_llm.bind_tools(tools_for_mode(tools))
+app = create_agent_app()
+
+# One compiled graph per intent profile; chat_with_bot picks one per request
+agent_apps = {name: (app if name == "full" else create_agent_app(profile=name)) for name in AGENT_PROFILES}
+
+# Profiles whose prompt + tools prefix reaches PROMPT_CACHE_MIN_TOKENS; the others are never prompt-cached
+PROMPT_CACHED_PROFILES = [name for name, profile in AGENT_PROFILES.items()
+                          if prefix_cache.cacheable(prompt_for_mode(profile.prompt, DIRECT_FINISH), tools_for_profile(profile))]
+if prefix_cache.enabled:
+    print(f"Prompt cache applies to profiles: {', '.join(PROMPT_CACHED_PROFILES) or 'none'} (others are under {prefix_cache.min_tokens} tokens)")
+
+# Deterministic handlers for simple intents, tried before the graph runs
+fast_path_router = FastPathRouter({t.name: t for t in tools}, now=lambda: datetime.now(_LOCAL_TZ))
+
+# Catalog rows keep the tool columns plus the card image columns (whichever exist)
+_CATALOG_FIELDS = [c.strip() for c in restaurants_table_columns.split(",")] + list(CARD_IMAGE_FIELDS)
+
+def _load_restaurant_catalog() -> list:
+    if not supabase:
+        return []
+    rows = supabase.table("restaurants").select("*").execute().data or []
+    return [{k: row[k] for k in _CATALOG_FIELDS if k in row} for row in rows]
+
+# In-memory restaurant rows, refreshed every CATALOG_TTL seconds
+restaurant_catalog = RestaurantCatalog(_load_restaurant_catalog)
+
+def restaurant_cards_for(ids: List[str]) -> List[dict]:
+    """Card payloads for RESTAURANTS_TO_SHOW IDs (include_cards), served from the catalog."""
+    def fetch_missing(missing: List[str]) -> list:
+        return supabase.table("restaurants").select("*").in_("id", missing).execute().data if supabase else []
+    return restaurant_cards(ids, restaurant_catalog.by_id(ids), fetch_missing)
+
+# Restaurant/availability lookups started while the first model call runs
+speculative_prefetcher = SpeculativePrefetcher(
+    restaurant_catalog,
+    lookup_by_name=lambda name: _restaurants_by_name(name, speculative=True),
+    lookup_time_slots=prefetch_available_time_slots,
+)
 
 def chat_with_bot(user_input: str, memory: Optional[ConversationMemory] = None, user_id: Optional[str] = None, authenticated_client: Optional[Client] = None, current_user: Optional[dict] = None) -> str:
     """
@@ -609,225 +756,312 @@ def chat_with_bot(user_input: str, memory: Optional[ConversationMemory] = None,
     If user_id is provided, pre-fetches user profile for personalization.
     If authenticated_client is provided, uses it for database operations with RLS.
     """
+    # Use authenticated client if provided, otherwise fall back to global supabase client
+    client_to_use = coalescing(authenticated_client) if authenticated_client else supabase
+    # Full tool payloads for this request (the model only sees the compact views), and the
+    # request's client/user, which follow it into the tool worker threads
+    with tool_result_scope() as tool_results, request_scope(client_to_use, current_user) as request:
+        try:
+            return _chat_with_bot(user_input, memory, user_id, client_to_use, current_user, tool_results)
+        finally:
+            _finish_request(request)
+
+def _finish_request(request: ChatRequest):
+    """Record the request's speculative lookups and log its model token usage."""
+    speculation_stats.record(request.memo)
+    tokens = request.tokens.snapshot()
+    if tokens["input_tokens"]:
+        print(f"Model tokens: {tokens['input_tokens']} input ({tokens['cached_input_tokens']} cached, "
+              f"{tokens['uncached_input_tokens']} uncached), {tokens['output_tokens']} output")
+
+def stream_chat_with_bot(user_input: str, memory: Optional[ConversationMemory] = None, user_id: Optional[str] = None, authenticated_client: Optional[Client] = None, current_user: Optional[dict] = None):
+    """Like chat_with_bot, but yields progress/tool/token events and a final "done" event (see chat_stream)."""
+    return stream_chat(lambda: chat_with_bot(user_input, memory, user_id, authenticated_client, current_user))
+
+# Answers built from these depend on live bookings (the classifier doesn't catch every availability question)
+_LIVE_AVAILABILITY_TOOLS = ("checkAnyTimeSlots", "getAvailableTimeSlots", "getTableOptionsForSlot", "searchTimeRange")
+
+def _has_history(memory: Optional[ConversationMemory]) -> bool:
+    """Earlier turns (or their summary) in memory; follow-ups then get the full profile."""
+    return memory is not None and (memory.get_context_size() > 0 or bool(memory.summary))
+
+def _cacheable(response: str, tool_results: ToolResultStash) -> bool:
+    """Whether a stateless answer may go into the response cache: not a fallback built after the
+    budget ran out or from failed/timed-out tools, and not live availability."""
+    if not response or response == _NO_RESPONSE:
+        return False
+    budget = current_budget()
+    if budget is not None and budget.exhausted:
+        return False
+    return not tool_results.had_failures and not tool_results.called_any(_LIVE_AVAILABILITY_TOOLS)
+
+def _chat_with_bot(user_input: str, memory: Optional[ConversationMemory], user_id: Optional[str], client_to_use: Optional[Client], current_user: Optional[dict], tool_results: ToolResultStash) -> str:
     try:
-        # Use authenticated client if provided, otherwise fall back to global supabase client
-        client_to_use = authenticated_client if authenticated_client else supabase
-        
-        # Store client in a thread-local variable so tools can access it
-        import threading
-        if not hasattr(threading.current_thread(), 'supabase_client'):
-            threading.current_thread().supabase_client = client_to_use
-        else:
-            threading.current_thread().supabase_client = client_to_use
-        
-        # Fetch user profile data if user_id provided
-        user_profile = None
-        if user_id and client_to_use:
-            user_profile = fetch_user_profile(user_id, client_to_use)
+        # Fetch user profile data if user_id provided, while the rest of the pre-LLM work runs
+        profile_future = prefetch_user_profile(user_id, client_to_use) if client_to_use else None
         
         # Log authentication status
         if current_user:
             print(f"Chat request from authenticated user: {current_user.get('email', 'unknown')} (ID: {current_user.get('id', 'unknown')})")
         else:
             print("Chat request from unauthenticated user")
-        
-        # Lightweight intent detection to nudge the LLM to use tools and include IDs
-        ui_lower = (user_input or "").lower()
-        discovery_triggers = [
-            "recommend", "suggest", "find", "show", "options", "restaurant", "places", "cuisine",
-            "near", "around", "best", "top", "where to",
-            "available", "availability", "slot", "slots", "time", "times", "book", "reserve", "reservation",
-            "today", "tonight", "tomorrow", "opening", "openings"
-        ]
-        should_nudge = any(t in ui_lower for t in discovery_triggers)
-
-        # Create profile context message if user profile is available
-        profile_message = None
-        if user_profile:
-            profile_info = []
-            if user_profile.get('full_name'):
-                profile_info.append(f"Name: {user_profile['full_name']}")
-            if user_profile.get('allergies') and user_profile['allergies']:
-                profile_info.append(f"Allergies: {', '.join(user_profile['allergies'])}")
-            if user_profile.get('favorite_cuisines') and user_profile['favorite_cuisines']:
-                profile_info.append(f"Favorite cuisines: {', '.join(user_profile['favorite_cuisines'])}")
-            if user_profile.get('dietary_restrictions') and user_profile['dietary_restrictions']:
-                profile_info.append(f"Dietary restrictions: {', '.join(user_profile['dietary_restrictions'])}")
-            if user_profile.get('preferred_party_size'):
-                profile_info.append(f"Preferred party size: {user_profile['preferred_party_size']}")
-            if user_profile.get('loyalty_points'):
-                profile_info.append(f"Loyalty points: {user_profile['loyalty_points']}")
+
+        # Compiled intent classification selects the agent profile and guidance
+        intent = classify_intent(user_input, has_history=_has_history(memory))
+        print(f"Detected intent: {intent.intent}")
+        # Resolve relative dates/times locally so the model doesn't need a convertRelativeDate turn
+        temporal = resolve_temporal_expressions(user_input, datetime.now(_LOCAL_TZ))
+
+        user_profile = profile_future.result() if profile_future else None
+
+        # Simple intents are answered directly from the tools without any LLM call
+        fast_result = fast_path_router.route(user_input, user_profile)
+        if fast_result:
+            if memory:
+                memory.add_message(HumanMessage(content=user_input))
+                memory.add_message(AIMessage(content=fast_result.response))
+            return fast_result.response
+
+        # Stateless requests are served from the response cache; identical in-flight misses share one agent run
+        if memory is None and response_cache.enabled:
+            ttl = response_cache.ttl_for(intent.is_availability)
+            if ttl > 0:
+                key = response_cache.key_for(user_input, user_profile, intent.intent, datetime.now(_LOCAL_TZ))
+                return response_cache.get_or_compute(
+                    key,
+                    lambda: _run_agent(user_input, memory, user_profile, intent, tool_results, temporal),
+                    ttl,
+                    cacheable=lambda response: _cacheable(response, tool_results),
+                )
+
+        return _run_agent(user_input, memory, user_profile, intent, tool_results, temporal)
             
-            if profile_info:
-                profile_message = SystemMessage(content=f"USER PROFILE: {' | '.join(profile_info)}")
+    except Exception as e:
+        print(f"Error running agent: {e}")
+        return f"Sorry, I encountered an error: {str(e)}"
 
-        # Create guiding message for tool usage
-        guiding_message = None
-        if should_nudge or user_profile:  # Create guidance if nudging needed OR user profile available
-            if user_profile:
-                guiding_message = SystemMessage(content=(
-                    "IMPORTANT: User profile data has been provided above. Use this information for personalized recommendations.\n"
-                    "For restaurant discovery: 1) Consider user's allergies, dietary restrictions, and favorite cuisines, 2) Call appropriate search tools, 3) Include up to 5 real IDs in 'RESTAURANTS_TO_SHOW:' format.\n"
-                    "For availability queries: 1) Use user's preferred party size from profile, 2) Use convertRelativeDate for relative dates, 3) Find restaurant via getRestaurantsByName, 4) Use availability tools.\n"
-                    "Always call finishedUsingTools when done."
-                ))
+async def achat_with_bot(user_input: str, memory: Optional[ConversationMemory] = None, user_id: Optional[str] = None, authenticated_client: Optional[Client] = None, current_user: Optional[dict] = None) -> str:
+    """
+    Async chat_with_bot for the ASGI app (asgi_app.py); same arguments and answers.
+    The model is awaited via app.ainvoke(); blocking Supabase work runs on worker threads.
+    """
+    client_to_use = coalescing(authenticated_client) if authenticated_client else supabase
+    with tool_result_scope() as tool_results, request_scope(client_to_use, current_user) as request:
+        try:
+            profile_task = asyncio.ensure_future(asyncio.to_thread(fetch_user_profile, user_id, client_to_use)) if user_id and client_to_use else None
+            
+            if current_user:
+                print(f"Chat request from authenticated user: {current_user.get('email', 'unknown')} (ID: {current_user.get('id', 'unknown')})")
             else:
-                guiding_message = SystemMessage(content=(
-                    "For this request, if it's about discovering restaurants: call the appropriate search tools and include up to 5 real IDs in a line starting with 'RESTAURANTS_TO_SHOW:'. Prioritize featured and highly-rated restaurants.\n"
-                    "If it's about availability for a specific restaurant: 1) FIRST use convertRelativeDate for any relative dates (today, tomorrow, etc.), 2) locate the restaurant via getRestaurantsByName, 3) use availability tools with the converted date. Assume party size 2 if unspecified; state assumptions. When done with tools, call finishedUsingTools."
-                ))
-
-        # Create user message
-        user_message = HumanMessage(content=user_input)
+                print("Chat request from unauthenticated user")
+
+            intent = classify_intent(user_input, has_history=_has_history(memory))
+            print(f"Detected intent: {intent.intent}")
+            temporal = resolve_temporal_expressions(user_input, datetime.now(_LOCAL_TZ))
+
+            user_profile = await profile_task if profile_task else None
+
+            fast_result = await asyncio.to_thread(fast_path_router.route, user_input, user_profile)
+            if fast_result:
+                if memory:
+                    memory.add_message(HumanMessage(content=user_input))
+                    memory.add_message(AIMessage(content=fast_result.response))
+                return fast_result.response
+
+            if memory is None and response_cache.enabled:
+                ttl = response_cache.ttl_for(intent.is_availability)
+                if ttl > 0:
+                    key = response_cache.key_for(user_input, user_profile, intent.intent, datetime.now(_LOCAL_TZ))
+                    return await response_cache.aget_or_compute(
+                        key,
+                        lambda: _arun_agent(user_input, memory, user_profile, intent, tool_results, temporal),
+                        ttl,
+                        cacheable=lambda response: _cacheable(response, tool_results),
+                    )
+
+            return await _arun_agent(user_input, memory, user_profile, intent, tool_results, temporal)
+
+        except Exception as e:
+            print(f"Error running agent: {e}")
+            return f"Sorry, I encountered an error: {str(e)}"
+        finally:
+            _finish_request(request)
+
+def _start_prefetch(user_input: str, user_profile: Optional[dict], temporal: Optional[TemporalResolution]):
+    """Look up named restaurants and their availability while the model thinks. Only called once the
+    fast path and the response cache have missed, so answers that need no model call start no lookups."""
+    if temporal is None:
+        temporal = resolve_temporal_expressions(user_input, datetime.now(_LOCAL_TZ))
+    speculative_prefetcher.start(user_input, temporal, user_profile)
+
+async def _arun_agent(user_input: str, memory: Optional[ConversationMemory], user_profile: Optional[dict], intent: IntentResult, tool_results: ToolResultStash, temporal: Optional[TemporalResolution] = None) -> str:
+    """Async _run_agent."""
+    _start_prefetch(user_input, user_profile, temporal)
+    current_input, user_message = _agent_input(user_input, memory, user_profile, intent, temporal)
+    result = await agent_apps.get(intent.intent, app).ainvoke(current_input)
+    # The RESTAURANTS_TO_SHOW fallback may query Supabase
+    return await asyncio.to_thread(_agent_response, result, user_message, memory, intent, tool_results)
+
+def _featured_ids(text: str, limit: int = 5) -> List[str]:
+    """IDs for the RESTAURANTS_TO_SHOW fallback from the precomputed catalog ranking:
+    featured restaurants (of the cuisine the message names, if any), else the best rated."""
+    cuisine = restaurant_catalog.cuisine_in(text)
+    for scope in ([cuisine] if cuisine else []) + [None]:
+        items = restaurant_catalog.top(limit, cuisine=scope, featured_only=True) or restaurant_catalog.top(limit, cuisine=scope)
+        if items:
+            return [str(x["id"]) for x in items][:limit]
+    return []
+
+_NO_RESPONSE = "I apologize, I couldn't generate a proper response. Please try again."
+
+def _run_agent(user_input: str, memory: Optional[ConversationMemory], user_profile: Optional[dict], intent: IntentResult, tool_results: ToolResultStash, temporal: Optional[TemporalResolution] = None) -> str:
+    """Run the agent profile graph for a classified request and post-process its answer."""
+    _start_prefetch(user_input, user_profile, temporal)
+    current_input, user_message = _agent_input(user_input, memory, user_profile, intent, temporal)
+    result = agent_apps.get(intent.intent, app).invoke(current_input)
+    return _agent_response(result, user_message, memory, intent, tool_results)
+
+def _agent_input(user_input: str, memory: Optional[ConversationMemory], user_profile: Optional[dict], intent: IntentResult, temporal: Optional[TemporalResolution] = None):
+    """Build the graph input for a request; returns (graph input, the user message to remember)."""
+    # Resolve relative dates/times locally so the model doesn't need a convertRelativeDate turn
+    if temporal is None:
+        temporal = resolve_temporal_expressions(user_input, datetime.now(_LOCAL_TZ))
+
+    # Create profile context message if user profile is available
+    profile_message = None
+    if user_profile:
+        profile_info = []
+        if user_profile.get('full_name'):
+            profile_info.append(f"Name: {user_profile['full_name']}")
+        if user_profile.get('allergies') and user_profile['allergies']:
+            profile_info.append(f"Allergies: {', '.join(user_profile['allergies'])}")
+        if user_profile.get('favorite_cuisines') and user_profile['favorite_cuisines']:
+            profile_info.append(f"Favorite cuisines: {', '.join(user_profile['favorite_cuisines'])}")
+        if user_profile.get('dietary_restrictions') and user_profile['dietary_restrictions']:
+            profile_info.append(f"Dietary restrictions: {', '.join(user_profile['dietary_restrictions'])}")
+        if user_profile.get('preferred_party_size'):
+            profile_info.append(f"Preferred party size: {user_profile['preferred_party_size']}")
+        if user_profile.get('loyalty_points'):
+            profile_info.append(f"Loyalty points: {user_profile['loyalty_points']}")
         
-        # Build message list based on whether we have conversation memory
-        messages_to_add = []
-        if profile_message:
-            messages_to_add.append(profile_message)
-        if guiding_message:
-            messages_to_add.append(guiding_message)
-        messages_to_add.append(user_message)
-        
-        if memory:
-            # Use conversation history
-            history_messages = memory.get_messages()
-            current_input = {"messages": history_messages + messages_to_add}
-        else:
-            # Stateless mode - just the current message with context
-            current_input = {"messages": messages_to_add}
-        
-        # Run the agent with the message(s)
-        result = app.invoke(current_input)
+        if profile_info:
+            profile_message = SystemMessage(content=f"USER PROFILE: {' | '.join(profile_info)}")
 
-        # Extract messages
-        ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
-        tool_messages = [msg for msg in result["messages"] if isinstance(msg, ToolMessage)]
-        
-        # Save conversation to memory if provided
-        if memory:
-            memory.add_message(user_message)
+    # Create guiding message for tool usage (only the parts relevant to the detected intent)
+    guiding_message = None
+    if intent.needs_tools or user_profile:  # Create guidance if nudging needed OR user profile available
+        guidance = []
+        if user_profile:
+            guidance.append("IMPORTANT: User profile data has been provided above. Use this information for personalized recommendations.")
+        if intent.intent in ("discovery", "full"):
+            if user_profile:
+                guidance.append("For restaurant discovery: 1) Consider user's allergies, dietary restrictions, and favorite cuisines, 2) Call appropriate search tools, 3) Include up to 5 real IDs in 'RESTAURANTS_TO_SHOW:' format.")
+            else:
+                guidance.append("For this request, if it's about discovering restaurants: call the appropriate search tools and include up to 5 real IDs in a line starting with 'RESTAURANTS_TO_SHOW:'. Prioritize featured and highly-rated restaurants.")
+        if intent.intent in ("availability", "full"):
+            if user_profile:
+                date_step = "Use the resolved dates noted in the message" if temporal.dates else "Use convertRelativeDate for relative dates"
+                guidance.append(f"For availability queries: 1) Use user's preferred party size from profile, 2) {date_step}, 3) Find restaurant via getRestaurantsByName, 4) Use availability tools.")
+            else:
+                date_step = "FIRST use the resolved dates noted in the message (no convertRelativeDate call needed)" if temporal.dates else "FIRST use convertRelativeDate for any relative dates (today, tomorrow, etc.)"
+                guidance.append(f"If it's about availability for a specific restaurant: 1) {date_step}, 2) locate the restaurant via getRestaurantsByName, 3) use availability tools with the converted date. Assume party size 2 if unspecified; state assumptions.")
+        if not DIRECT_FINISH and intent.needs_tools:
+            guidance.append("Always call finishedUsingTools when done.")
+        guiding_message = SystemMessage(content="\n".join(guidance))
+
+    # Create user message, annotated with any locally resolved dates/times
+    user_message = HumanMessage(content=f"{user_input}\n{temporal.annotation()}" if temporal else user_input)
+    
+    # Build message list based on whether we have conversation memory
+    messages_to_add = []
+    if profile_message:
+        messages_to_add.append(profile_message)
+    if guiding_message:
+        messages_to_add.append(guiding_message)
+    messages_to_add.append(user_message)
+    
+    if memory:
+        # Use conversation history
+        history_messages = memory.get_messages()
+        current_input = {"messages": history_messages + messages_to_add}
+    else:
+        # Stateless mode - just the current message with context
+        current_input = {"messages": messages_to_add}
+    return current_input, user_message
+
+def _agent_response(result: dict, user_message: HumanMessage, memory: Optional[ConversationMemory], intent: IntentResult, tool_results: ToolResultStash) -> str:
+    """Save the turn to memory and turn the graph result into the final answer (with restaurant IDs when relevant)."""
+    ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
+    answer = _final_answer(result, user_message, intent, tool_results)
+
+    # Save conversation to memory if provided
+    if memory:
+        memory.add_message(user_message)
+        budget = current_budget()
+        if budget is not None and budget.exhausted:
+            # The run stopped on its budget, so the last AI message may be an unanswered tool call
+            memory.add_message(AIMessage(content=answer))
+        elif ai_messages:
             # Add the AI's final response to memory
-            if ai_messages:
-                memory.add_message(ai_messages[-1])
-
-        # If we have a proper AI response, try to ensure IDs are present when intent suggests discovery
-        if ai_messages:
-            last_ai_message = ai_messages[-1]
-            if last_ai_message.content and last_ai_message.content.strip():
-                text_content = last_ai_message.content.strip()
-                if "RESTAURANTS_TO_SHOW:" not in text_content:
-                    # Better intent detection: only append restaurant IDs for actual discovery requests
-                    intent_text = (user_input or "").lower()
-                    
-                    # Availability-related queries (no restaurants needed)
-                    availability_markers = [
-                        "available", "availability", "slot", "slots", "time", "times", "book", "reserve", "reservation",
-                        "today", "tonight", "tomorrow", "opening", "openings"
-                    ]
-                    
-                    # Actual discovery/recommendation intents
-                    discovery_markers = [
-                        "recommend", "suggest", "find", "show", "options", "restaurant", "places", "cuisine",
-                        "near", "around", "best", "top", "where to", "looking for", "want to eat", "dinner",
-                        "lunch", "breakfast", "food", "italian", "chinese", "mexican", "indian", "japanese"
-                    ]
-                    
-                    # Greeting/general queries (no restaurants needed)
-                    greeting_markers = [
-                        "hi", "hello", "hey", "good morning", "good afternoon", "good evening",
-                        "how are you", "what can you do", "help", "thanks", "thank you", "bye", "goodbye"
-                    ]
-                    
-                    is_availability_query = any(t in intent_text for t in availability_markers)
-                    is_discovery_query = any(t in intent_text for t in discovery_markers)
-                    is_greeting_query = any(t in intent_text for t in greeting_markers)
-                    
-                    # Only append restaurant IDs for actual discovery queries
-                    if is_discovery_query and not is_availability_query and not is_greeting_query:
-                        try:
-                            if supabase:
-                                result = (
-                                    supabase
-                                    .table("restaurants")
-                                    .select(restaurants_table_columns)
-                                    .eq("ai_featured", True)
-                                    .order("average_rating", desc=True)
-                                    .limit(5)
-                                    .execute()
-                                )
-                                items = result.data or []
-                                if not items:
-                                    result = (
-                                        supabase
-                                        .table("restaurants")
-                                        .select(restaurants_table_columns)
-                                        .order("ai_featured", desc=True)
-                                        .order("average_rating", desc=True)
-                                        .limit(5)
-                                        .execute()
-                                    )
-                                    items = result.data or []
-                                ids = [str(x.get('id')) for x in items if isinstance(x, dict) and x.get('id')]
-                                ids = [i for i in ids if i][:5]
-                                if ids:
-                                    return text_content + "\nRESTAURANTS_TO_SHOW: " + ",".join(ids)
-                        except Exception:
-                            pass
-                return text_content
-
-        # Build a helpful fallback from tool outputs if available
-        try:
-            # Collect tool outputs by name when possible
-            tool_results_by_name = {}
-            for tool_msg in tool_messages:
-                tool_name = getattr(tool_msg, 'name', None)
-                if tool_name:
-                    tool_results_by_name[tool_name] = tool_msg.content
-
-            import json as _json
-
-            # Prefer any restaurant list; support multiple tool outputs
-            def _extract_ids(items_json: str) -> list[str]:
-                try:
-                    items = _json.loads(items_json)
-                    if isinstance(items, list) and items:
-                        ids = [str(x.get('id')) for x in items if isinstance(x, dict) and x.get('id')]
-                        return [i for i in ids if i]
-                except Exception:
-                    return []
-                return []
-
-            all_ids: list[str] = []
-            for content in tool_results_by_name.values():
-                all_ids.extend(_extract_ids(content))
-            # Deduplicate and limit
-            seen = set()
-            unique_ids = []
-            for _id in all_ids:
-                if _id not in seen:
-                    seen.add(_id)
-                    unique_ids.append(_id)
-            if unique_ids:
-                return "Here are some restaurants you might like.\nRESTAURANTS_TO_SHOW: " + ",".join(unique_ids[:5])
-
-            # Cuisines list fallback
-            cuisines = tool_results_by_name.get('getAllCuisineTypes')
-            if cuisines:
-                try:
-                    cu = _json.loads(cuisines)
-                    if isinstance(cu, list) and cu:
-                        return "Available cuisine types: " + ", ".join(map(str, cu[:10]))
-                except Exception:
-                    pass
-        except Exception:
-            pass
+            memory.add_message(ai_messages[-1])
+    return answer
+
+def _final_answer(result: dict, user_message: HumanMessage, intent: IntentResult, tool_results: ToolResultStash) -> str:
+    """The answer for a graph result: the model's last text, else a fallback built from the tool outputs."""
+    # Extract messages
+    ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
+    tool_messages = [msg for msg in result["messages"] if isinstance(msg, ToolMessage)]
+
+    # If we have a proper AI response, try to ensure IDs are present when intent suggests discovery
+    if ai_messages:
+        last_ai_message = ai_messages[-1]
+        if last_ai_message.content and last_ai_message.content.strip():
+            text_content = last_ai_message.content.strip()
+            if "RESTAURANTS_TO_SHOW:" not in text_content:
+                # Only append restaurant IDs for actual discovery queries
+                if intent.is_discovery and not intent.is_availability and not intent.is_greeting:
+                    # Prefer restaurants the tools actually returned for this request
+                    found_ids = tool_results.restaurant_ids(limit=5)
+                    if found_ids:
+                        return text_content + "\nRESTAURANTS_TO_SHOW: " + ",".join(found_ids)
+                    try:
+                        ids = _featured_ids(user_message.content, limit=5)
+                        if ids:
+                            return text_content + "\nRESTAURANTS_TO_SHOW: " + ",".join(ids)
+                    except Exception:
+                        pass
+            return text_content
+
+    # Build a helpful fallback from tool outputs if available
+    try:
+        # Collect tool outputs by name when possible
+        tool_results_by_name = {}
+        for tool_msg in tool_messages:
+            tool_name = getattr(tool_msg, 'name', None)
+            if tool_name:
+                tool_results_by_name[tool_name] = tool_msg.content
+
+        import json as _json
+
+        # Prefer any restaurant list; full rows are in the request stash (tool messages hold compact views)
+        unique_ids = tool_results.restaurant_ids()
+        if unique_ids:
+            return "Here are some restaurants you might like.\nRESTAURANTS_TO_SHOW: " + ",".join(unique_ids[:5])
+
+        # Cuisines list fallback
+        cuisines = tool_results_by_name.get('getAllCuisineTypes')
+        if cuisines:
+            try:
+                cu = _json.loads(cuisines)
+                if isinstance(cu, list) and cu:
+                    return "Available cuisine types: " + ", ".join(map(str, cu[:10]))
+            except Exception:
+                pass
+    except Exception:
+        pass
 
-        print("No AI messages found in result and no usable tool fallback")
-        return "I apologize, I couldn't generate a proper response. Please try again."
-            
-    except Exception as e:
-        print(f"Error running agent: {e}")
-        return f"Sorry, I encountered an error: {str(e)}"
+    print("No AI messages found in result and no usable tool fallback")
+    return _NO_RESPONSE
 
 # Interactive chat function for testing (kept for local development)
 def start_interactive_chat():
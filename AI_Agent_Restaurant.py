@@ -31,8 +31,17 @@ from langchain_core.tools import tool
 import os
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode
 from supabase import create_client, Client
+from supabase_coalescing import coalescing
+from tool_executor import ParallelToolNode
+from agent_graph import DIRECT_FINISH, after_tools, ainvoke_model, graph_node, invoke_model, prompt_for_mode, tools_for_mode, tools_within_budget
+from conversation_memory import TokenBudgetMemory, model_summarizer
+from model_router import RoutedChatModel
+from chat_stream import stream_chat
+from request_context import current_budget, current_request, current_supabase_client, request_scope
+from llm_scheduler import staff_priority
+from service_board import BOOKING_FIELDS, WAITLIST_FIELDS, ServiceBoard, parse_timestamp, project, service_boards
+import asyncio
 import json
 from datetime import datetime, timedelta, date, time as dt_time
 from collections import defaultdict
@@ -41,14 +50,26 @@ load_dotenv()
 url: str = os.environ.get("EXPO_PUBLIC_SUPABASE_URL")
 key: str = os.environ.get("EXPO_PUBLIC_SUPABASE_ANON_KEY")
 
-supabase: Client = create_client(url, key)
+# Identical concurrent reads share one network call
+supabase: Client = coalescing(create_client(url, key))
 
 def get_supabase_client() -> Optional[Client]:
     """Get the appropriate Supabase client (authenticated if available, otherwise global)"""
-    import threading
-    if hasattr(threading.current_thread(), 'supabase_client'):
-        return threading.current_thread().supabase_client
-    return supabase
+    request_client = current_supabase_client()
+    return request_client if request_client is not None else supabase
+
+def scoped_restaurant_id(restaurant_id: str) -> str:
+    """The restaurant this staff request is for; tools ignore a different ID from the model."""
+    request = current_request()
+    if request and request.restaurant_id and restaurant_id != request.restaurant_id:
+        print(f"Ignoring restaurant_id {restaurant_id}; this request is for restaurant {request.restaurant_id}")
+        return request.restaurant_id
+    return restaurant_id
+
+def service_board_for(restaurant_id: str) -> Optional[ServiceBoard]:
+    """The live service board for this restaurant as the request's staff user sees it; None means query directly."""
+    request = current_request()
+    return service_boards.get(restaurant_id, get_supabase_client(), request.user_id if request else None)
 
 class StaffAgentState(TypedDict):
     """State of the restaurant staff agent."""
@@ -150,19 +171,23 @@ tools.append(finishedUsingTools)
 @tool
 def getTodaysBookings(restaurant_id: str) -> str:
     """Get all bookings for today for a specific restaurant"""
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     try:
-        today = date.today()
-        start_of_day = datetime.combine(today, dt_time.min)
-        end_of_day = datetime.combine(today, dt_time.max)
-        
-        result = get_supabase_client().table("bookings").select("""
-            id, user_id, booking_time, party_size, status, special_requests, 
-            occasion, dietary_notes, guest_name, guest_email, guest_phone,
-            confirmation_code, checked_in_at, seated_at, 
-            profiles!bookings_user_id_fkey(full_name, phone_number, allergies, dietary_restrictions)
-        """).eq("restaurant_id", restaurant_id).gte("booking_time", start_of_day.isoformat()).lte("booking_time", end_of_day.isoformat()).order("booking_time").execute()
-        
-        bookings = result.data
+        board = service_board_for(restaurant_id)
+        if board is not None:
+            bookings = [project(b, BOOKING_FIELDS) for b in board.bookings()]
+        else:
+            today = date.today()
+            start_of_day = datetime.combine(today, dt_time.min)
+            end_of_day = datetime.combine(today, dt_time.max)
+
+            result = get_supabase_client().table("bookings").select("""
+                id, user_id, booking_time, party_size, status, special_requests, 
+                occasion, dietary_notes, guest_name, guest_email, guest_phone,
+                confirmation_code, checked_in_at, seated_at, 
+                profiles!bookings_user_id_fkey(full_name, phone_number, allergies, dietary_restrictions)
+            """).eq("restaurant_id", restaurant_id).gte("booking_time", start_of_day.isoformat()).lte("booking_time", end_of_day.isoformat()).order("booking_time").execute()
+            bookings = result.data
         if not bookings:
             return "No bookings found for today"
         
@@ -175,15 +200,20 @@ tools.append(getTodaysBookings)
 @tool
 def getAvailableTables(restaurant_id: str, desired_time: str = None, party_size: int = None) -> str:
     """Get available tables for a restaurant, optionally filtered by time and party size"""
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is checking available tables for restaurant: {restaurant_id}")
     try:
-        # Get all tables for the restaurant
-        tables_result = get_supabase_client().table("restaurant_tables").select("""
-            id, table_number, table_type, capacity, min_capacity, max_capacity, 
-            features, is_active, x_position, y_position
-        """).eq("restaurant_id", restaurant_id).eq("is_active", True).order("table_number").execute()
-        
-        tables = tables_result.data
+        board = service_board_for(restaurant_id)
+        if board is not None:
+            # Board rows also carry updated_at; keep the output as before
+            tables = [{k: v for k, v in t.items() if k != "updated_at"} for t in board.tables()]
+        else:
+            # Get all tables for the restaurant
+            tables_result = get_supabase_client().table("restaurant_tables").select("""
+                id, table_number, table_type, capacity, min_capacity, max_capacity, 
+                features, is_active, x_position, y_position
+            """).eq("restaurant_id", restaurant_id).eq("is_active", True).order("table_number").execute()
+            tables = tables_result.data
         if not tables:
             return "No tables found for this restaurant"
         
@@ -194,12 +224,17 @@ def getAvailableTables(restaurant_id: str, desired_time: str = None, party_size:
             start_time = booking_time - timedelta(hours=2)  # 2 hour window before
             end_time = booking_time + timedelta(hours=2)    # 2 hour window after
             
-            bookings_result = get_supabase_client().table("bookings").select("""
-                id, booking_time, party_size, status, booking_tables(table_id)
-            """).eq("restaurant_id", restaurant_id).gte("booking_time", start_time.isoformat()).lte("booking_time", end_time.isoformat()).in_("status", ["confirmed", "seated", "arrived"]).execute()
+            # The board has today's bookings; other days are queried
+            nearby = board.bookings_between(parse_timestamp(start_time.isoformat()), parse_timestamp(end_time.isoformat()),
+                                            {"confirmed", "seated", "arrived"}) if board is not None else None
+            if nearby is None:
+                bookings_result = get_supabase_client().table("bookings").select("""
+                    id, booking_time, party_size, status, booking_tables(table_id)
+                """).eq("restaurant_id", restaurant_id).gte("booking_time", start_time.isoformat()).lte("booking_time", end_time.isoformat()).in_("status", ["confirmed", "seated", "arrived"]).execute()
+                nearby = bookings_result.data
             
             booked_table_ids = set()
-            for booking in bookings_result.data:
+            for booking in nearby:
                 if booking.get("booking_tables"):
                     for bt in booking["booking_tables"]:
                         booked_table_ids.add(bt["table_id"])
@@ -233,6 +268,7 @@ tools.append(getAvailableTables)
 @tool
 def getCustomerHistory(customer_identifier: str, restaurant_id: str) -> str:
     """Get customer booking history and preferences. Use email, phone, or name to identify customer"""
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is looking up customer history: {customer_identifier}")
     try:
         # First try to find customer by different identifiers
@@ -297,6 +333,7 @@ tools.append(getCustomerHistory)
 @tool
 def getTableSuggestions(restaurant_id: str, party_size: int, customer_preferences: str = None, booking_time: str = None) -> str:
     """Get smart table suggestions based on party size and preferences"""
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is suggesting tables for party of {party_size}")
     try:
         # Get available tables
@@ -386,6 +423,7 @@ tools.append(getTableSuggestions)
 @tool
 def getRestaurantStats(restaurant_id: str, date_filter: str = "today") -> str:
     """Get restaurant operational statistics for today, week, or month"""
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is getting restaurant stats for: {date_filter}")
     try:
         today = date.today()
@@ -512,30 +550,34 @@ tools.append(checkBookingDetails)
 @tool
 def getWaitlist(restaurant_id: str, status: str = None) -> str:
     """Get current waitlist entries for a restaurant. Optionally filter by status (e.g., 'waiting')."""
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is fetching waitlist for restaurant: {restaurant_id}")
     try:
-        # Select known, schema-friendly columns
-        query = (
-            supabase
-            .table("waitlist")
-            .select("id, restaurant_id, party_size, status, joined_at, quoted_wait_minutes, priority, notified_at")
-            .eq("restaurant_id", restaurant_id)
-        )
-        if status:
-            query = query.eq("status", status)
-        try:
-            result = query.order("joined_at").execute()
-        except Exception:
-            # Fallback to all columns if specific list fails
-            result = (
-                supabase
+        board = service_board_for(restaurant_id)
+        if board is not None:
+            entries = [project(e, WAITLIST_FIELDS) for e in board.waitlist(status)]
+        else:
+            # Select known, schema-friendly columns
+            query = (
+                get_supabase_client()
                 .table("waitlist")
-                .select("*")
+                .select("id, restaurant_id, party_size, status, joined_at, quoted_wait_minutes, priority, notified_at")
                 .eq("restaurant_id", restaurant_id)
-                .execute()
             )
-
-        entries = result.data
+            if status:
+                query = query.eq("status", status)
+            try:
+                result = query.order("joined_at").execute()
+            except Exception:
+                # Fallback to all columns if specific list fails
+                result = (
+                    get_supabase_client()
+                    .table("waitlist")
+                    .select("*")
+                    .eq("restaurant_id", restaurant_id)
+                    .execute()
+                )
+            entries = result.data
         if not entries:
             return json.dumps({"count": 0, "entries": []})
 
@@ -549,21 +591,25 @@ tools.append(getWaitlist)
 @tool
 def getWaitlistStats(restaurant_id: str) -> str:
     """Get summary stats for the restaurant waitlist: counts by status, average quoted wait, next in line."""
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is computing waitlist stats for restaurant: {restaurant_id}")
     try:
-        # Fetch all current entries
-        try:
-            result = (
-                supabase
-                .table("waitlist")
-                .select("id, restaurant_id, party_size, status, joined_at, quoted_wait_minutes, priority, notified_at")
-                .eq("restaurant_id", restaurant_id)
-                .execute()
-            )
-        except Exception:
-            result = get_supabase_client().table("waitlist").select("*").eq("restaurant_id", restaurant_id).execute()
-
-        entries = result.data or []
+        board = service_board_for(restaurant_id)
+        if board is not None:
+            entries = [project(e, WAITLIST_FIELDS) for e in board.waitlist()]
+        else:
+            # Fetch all current entries
+            try:
+                result = (
+                    get_supabase_client()
+                    .table("waitlist")
+                    .select("id, restaurant_id, party_size, status, joined_at, quoted_wait_minutes, priority, notified_at")
+                    .eq("restaurant_id", restaurant_id)
+                    .execute()
+                )
+            except Exception:
+                result = get_supabase_client().table("waitlist").select("*").eq("restaurant_id", restaurant_id).execute()
+            entries = result.data or []
 
         # Aggregate
         status_counts = defaultdict(int)
@@ -611,21 +657,25 @@ tools.append(getWaitlistStats)
 @tool
 def estimateWaitTime(restaurant_id: str, party_size: int) -> str:
     """Estimate wait time (minutes) for a given party size using current waitlist data."""
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is estimating wait time for party of {party_size} at restaurant: {restaurant_id}")
     try:
-        # Load waitlist
-        try:
-            wl_result = (
-                supabase
-                .table("waitlist")
-                .select("id, party_size, status, joined_at, quoted_wait_minutes, priority")
-                .eq("restaurant_id", restaurant_id)
-                .execute()
-            )
-        except Exception:
-            wl_result = get_supabase_client().table("waitlist").select("*").eq("restaurant_id", restaurant_id).execute()
-
-        entries = wl_result.data or []
+        board = service_board_for(restaurant_id)
+        if board is not None:
+            entries = board.waitlist()
+        else:
+            # Load waitlist
+            try:
+                wl_result = (
+                    get_supabase_client()
+                    .table("waitlist")
+                    .select("id, party_size, status, joined_at, quoted_wait_minutes, priority")
+                    .eq("restaurant_id", restaurant_id)
+                    .execute()
+                )
+            except Exception:
+                wl_result = get_supabase_client().table("waitlist").select("*").eq("restaurant_id", restaurant_id).execute()
+            entries = wl_result.data or []
 
         # Consider only active/waiting entries
         active_statuses = {"waiting", "notified", "queued", "pending"}
@@ -662,6 +712,7 @@ def getOptimalTableRecommendations(restaurant_id: str, party_size: int, booking_
     - "19:00" for today at 7 PM 
     - Full ISO format "2024-08-27T19:00:00"
     """
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is getting optimal table recommendations for party of {party_size}")
     try:
         # Handle different time formats
@@ -745,6 +796,7 @@ def getTableCombinationsNow(restaurant_id: str, party_size: int) -> str:
     Get table combination recommendations for a party right now.
     Specifically designed for immediate seating needs when staff say "right now" or "current".
     """
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is getting immediate table combinations for party of {party_size}")
     try:
         # Use current time
@@ -812,6 +864,7 @@ def validateTableCombination(restaurant_id: str, table_ids: str, party_size: int
     Uses the validate_table_combination database function.
     table_ids should be a comma-separated string of table IDs.
     """
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is validating table combination: {table_ids}")
     try:
         # Convert comma-separated string to list
@@ -848,6 +901,7 @@ def getTableAvailabilityReport(restaurant_id: str, date: str) -> str:
     Get hourly table availability report for a specific date.
     Uses the get_table_availability_by_hour database function.
     """
+    restaurant_id = scoped_restaurant_id(restaurant_id)
     print(f"Staff AI is generating table availability report for {date}")
     try:
         # Call the get_table_availability_by_hour database function
@@ -878,28 +932,39 @@ def getTableAvailabilityReport(restaurant_id: str, date: str) -> str:
 
 tools.append(getTableAvailabilityReport)
 
-# Initialize the model
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash", 
-    api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.2
-)
-llm = llm.bind_tools(tools)
-
-def staff_agent_node(state: StaffAgentState) -> StaffAgentState:
-    """Our staff agent node that processes messages and generates responses.""" 
-    messages = state["messages"]
-    
-    # Create the full prompt with system message and conversation
-    full_messages = [SystemMessage(content=system_prompt)] + messages
-    
-    print(f"Sending {len(full_messages)} messages to Staff LLM")
-    
-    # Get response from the model
-    response = llm.invoke(full_messages)
-    
-    # Return the updated state with the new message
-    return {"messages": [response]}
+# Initialize the model; each call goes to the model MODEL_ROUTES picks for its step (see model_router)
+def _gemini(model_name: str) -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=model_name, 
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0.2
+    )
+
+base_llm = RoutedChatModel(_gemini, agent="staff")
+
+def make_staff_agent_node(bound_llm, prompt: str):
+    """Create the staff agent node for a tool-bound model and system prompt."""
+    def staff_agent_node(state: StaffAgentState) -> StaffAgentState:
+        """Our staff agent node that processes messages and generates responses.""" 
+        messages = state["messages"]
+        
+        # Create the full prompt with system message and conversation
+        full_messages = [SystemMessage(content=prompt)] + messages
+        
+        print(f"Sending {len(full_messages)} messages to Staff LLM")
+        
+        # Get response from the model
+        response = invoke_model(bound_llm, full_messages)
+        
+        # Return the updated state with the new message
+        return {"messages": [response]}
+
+    async def astaff_agent_node(state: StaffAgentState) -> StaffAgentState:
+        """staff_agent_node for staff_app.ainvoke(): the model call is awaited."""
+        full_messages = [SystemMessage(content=prompt)] + state["messages"]
+        return {"messages": [await ainvoke_model(bound_llm, full_messages)]}
+
+    return graph_node(staff_agent_node, astaff_agent_node, "staff_agent")
 
 def should_continue(state: StaffAgentState) -> str:
     """Determine whether to continue with tools or end the conversation"""
@@ -909,6 +974,10 @@ def should_continue(state: StaffAgentState) -> str:
         tool_calls = getattr(last_message, 'tool_calls', []) or []
         print(f"Staff AI tool calls found: {len(tool_calls)}")
         
+        # Stop once the request budget can't cover the tool calls
+        if tool_calls and not tools_within_budget(tool_calls):
+            return "end"
+        
         # If there are tool calls, check if finishedUsingTools was called
         for call in tool_calls:
             print(f"Staff AI tool call: {call}")
@@ -930,378 +999,403 @@ def should_continue(state: StaffAgentState) -> str:
     print("🔄 Staff AI default case - continuing")
     return "continue"
 
-# Create the graph
-staff_graph = StateGraph(StaffAgentState)
-
-# Add nodes
-staff_graph.add_node("staff_agent", staff_agent_node)
-staff_graph.add_node("tools", ToolNode(tools))
-
-# Add edges
-staff_graph.add_edge(START, "staff_agent")
-staff_graph.add_conditional_edges(
-    "staff_agent",
-    should_continue,
-    {
-        "continue": "tools",
-        "end": END
-    }
-)
-staff_graph.add_edge("tools", "staff_agent")
-
-# Compile the graph
-staff_app = staff_graph.compile()
-
-# Conversation memory system for staff agent
-class StaffConversationMemory:
-    def __init__(self, max_history: int = 20):
-        """Initialize conversation memory with a maximum history limit."""
-        self.messages = []
-        self.max_history = max_history
-    
-    def add_message(self, message: BaseMessage):
-        """Add a message to the conversation history."""
-        self.messages.append(message)
-        # Keep only the most recent messages to prevent context overflow
-        if len(self.messages) > self.max_history:
-            self.messages = self.messages[-self.max_history:]
-    
-    def get_messages(self):
-        """Get all messages in the conversation history."""
-        return self.messages.copy()
-    
-    def clear(self):
-        """Clear the conversation history."""
-        self.messages.clear()
-    
-    def get_context_size(self) -> int:
-        """Get the number of messages in history."""
-        return len(self.messages)
+def create_staff_app(chat_model=None, direct_finish: bool = DIRECT_FINISH):
+    """Compile the staff agent graph.
+    chat_model defaults to the routed Gemini models; direct_finish selects the graph mode (see agent_graph)."""
+    active_tools = tools_for_mode(tools, direct_finish)
+    bound_llm = (chat_model or base_llm).bind_tools(active_tools)
+
+    # Create the graph
+    staff_graph = StateGraph(StaffAgentState)
+
+    # Add nodes
+    staff_graph.add_node("staff_agent", make_staff_agent_node(bound_llm, prompt_for_mode(system_prompt, direct_finish)))
+    tool_node = ParallelToolNode(active_tools)
+    staff_graph.add_node("tools", graph_node(tool_node, tool_node.acall, "tools"))
+
+    # Add edges
+    staff_graph.add_edge(START, "staff_agent")
+    staff_graph.add_conditional_edges(
+        "staff_agent",
+        should_continue,
+        {
+            "continue": "tools",
+            "end": END
+        }
+    )
+    staff_graph.add_conditional_edges(
+        "tools",
+        after_tools,
+        {
+            "continue": "staff_agent",
+            "end": END
+        }
+    )
 
-def create_staff_conversation_memory(max_history: int = 20):
-    """Create a new conversation memory instance for staff agent."""
-    return StaffConversationMemory(max_history)
+    # Compile the graph
+    return staff_graph.compile()
 
-def chat_with_staff_bot(user_input: str, restaurant_id: str = None, memory=None, authenticated_client=None, current_user=None) -> str:
+llm = base_llm.bind_tools(tools_for_mode(tools))
+staff_app = create_staff_app()
+
+# Conversation memory system for staff agent: token-budgeted ring buffer with rolling summary
+class StaffConversationMemory(TokenBudgetMemory):
+    """Staff conversation memory; see conversation_memory.TokenBudgetMemory."""
+
+def create_staff_conversation_memory(max_history: int = 20, token_budget: Optional[int] = None):
+    """Create a new conversation memory instance for staff agent.
+    Set MEMORY_SUMMARIZER=model to compact old turns with the chat model instead of locally."""
+    summarizer = model_summarizer(base_llm.for_profile("memory_summary")) if os.getenv("MEMORY_SUMMARIZER") == "model" else None
+    return StaffConversationMemory(max_history, token_budget=token_budget, summarizer=summarizer)
+
+def chat_with_staff_bot(user_input: str, restaurant_id: str = None, memory=None, authenticated_client=None, current_user=None, priority: Optional[str] = None) -> str:
     """
     Function to chat with the restaurant staff bot. 
     Supports conversation memory for contextual responses.
     Now supports authenticated Supabase client for RLS compliance.
+    priority is the model-queue class (llm_scheduler); by default STAFF only for a verified current_user.
     """
+    # The authenticated client, user and restaurant apply to this request only (tools read them via request_scope)
+    client_to_use = coalescing(authenticated_client) if authenticated_client else supabase
     try:
-        # Store original global client and replace with authenticated one if provided
-        global supabase
-        original_client = supabase
-        if authenticated_client:
-            supabase = authenticated_client
-        
-        try:
-            # Enhance the user input with restaurant context if provided
-            if restaurant_id:
-                enhanced_input = f"[Restaurant ID: {restaurant_id}] {user_input}"
-            else:
-                enhanced_input = user_input
-            
-            # Create user message
-            user_message = HumanMessage(content=enhanced_input)
-            
-            # Build message list based on whether we have conversation memory
-            if memory:
-                # Use conversation history
-                history_messages = memory.get_messages()
-                current_input = {"messages": history_messages + [user_message]}
-            else:
-                # Stateless mode - just the current message
-                current_input = {"messages": [user_message]}
+        with request_scope(client_to_use, current_user, restaurant_id, priority=priority or staff_priority(current_user)):
+            current_input, user_message = _staff_input(user_input, restaurant_id, memory)
             
             # Run the staff agent
             result = staff_app.invoke(current_input)
+            return _staff_response(result, user_message, memory)
             
-            # Look for AI messages and tool results
-            ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
-            tool_messages = [msg for msg in result["messages"] if isinstance(msg, ToolMessage)]
-            
-            print(f"Found {len(ai_messages)} AI messages and {len(tool_messages)} tool messages")
-            
-            # If we have tool results but no proper AI response, create one
-            if tool_messages and ai_messages:
-                last_ai_message = ai_messages[-1]
-                
-                # Check if the last AI message has content
-                if last_ai_message.content and last_ai_message.content.strip():
-                    final_response = last_ai_message.content
-                    
-                    # Save conversation to memory if provided
-                    if memory:
-                        memory.add_message(user_message)
-                        memory.add_message(last_ai_message)
-                    
-                    return final_response
-            
-            # If no content but we have tool results, generate a response based on tool data
-            # Collect tool outputs by name
-            tool_results_by_name = {}
-            for tool_msg in tool_messages:
-                tool_name = getattr(tool_msg, 'name', None)
-                if tool_name:
-                    tool_results_by_name[tool_name] = tool_msg.content
-
-            # 1) Today's bookings summary
-            booking_tool_result = tool_results_by_name.get('getTodaysBookings')
-            if booking_tool_result:
-                if booking_tool_result == "No bookings found for today":
-                    return "No bookings scheduled for today."
-                try:
-                    bookings = json.loads(booking_tool_result)
-                    if isinstance(bookings, list):
-                        count = len(bookings)
-                        response = f"You have {count} booking{'s' if count != 1 else ''} for today:\n\n"
-                        for i, booking in enumerate(bookings, 1):
-                            time = booking.get('booking_time', '').split('T')[1][:5] if 'T' in booking.get('booking_time', '') else 'Unknown time'
-                            guest = booking.get('guest_name', 'Unknown guest')
-                            party = booking.get('party_size', 'Unknown size')
-                            status = booking.get('status', 'Unknown status')
-                            response += f"{i}. {guest} - {party} people at {time} ({status})\n"
-                        return response.strip()
-                except Exception:
-                    return "You have bookings for today, but I couldn't parse the details properly."
-
-            # 2) Available tables summary
-            available_tables_result = tool_results_by_name.get('getAvailableTables')
-            if available_tables_result:
-                try:
-                    data = json.loads(available_tables_result)
-                    if 'available_tables' in data:
-                        available = data.get('available_tables', [])
-                        count = len(available)
-                        requested_time = data.get('requested_time')
-                        party_size = data.get('requested_party_size')
-                        header = f"Found {count} suitable table{'s' if count != 1 else ''}"
-                        if party_size:
-                            header += f" for party of {party_size}"
-                        if requested_time:
-                            header += f" at {requested_time}"
-                        header += ":\n"
-                        details = []
-                        for t in available[:5]:
-                            details.append(f"- Table {t.get('table_number', '?')} ({t.get('table_type', 'standard')}), seats {t.get('capacity', '?')}")
-                        return (header + ("\n".join(details) if details else "")).strip()
-                    elif 'all_tables' in data:
-                        total = data.get('total_tables', 0)
-                        sample = data.get('all_tables', [])[:5]
-                        lines = [f"There are {total} active tables:"]
-                        for t in sample:
-                            lines.append(f"- Table {t.get('table_number', '?')} ({t.get('table_type', 'standard')}), capacity {t.get('min_capacity', '?')}-{t.get('max_capacity', '?')}")
-                        return "\n".join(lines).strip()
-                except Exception:
-                    pass
-
-            # 3) Optimal table recommendations (new advanced system)
-            optimal_rec_result = tool_results_by_name.get('getOptimalTableRecommendations')
-            if optimal_rec_result:
-                try:
-                    data = json.loads(optimal_rec_result)
-                    if data.get('status') == 'success':
-                        party = data.get('party_size')
-                        tables = data.get('recommended_tables', [])
-                        combo = data.get('requires_combination', False)
-                        capacity = data.get('total_capacity', 0)
-                        
-                        combo_text = " (table combination)" if combo else ""
-                        lines = [f"Optimal recommendation for party of {party}{combo_text}:"]
-                        for t in tables:
-                            lines.append(f"- Table {t.get('table_number', '?')} ({t.get('table_type', 'standard')}, seats {t.get('capacity', '?')})")
-                        lines.append(f"Total capacity: {capacity}")
-                        return "\n".join(lines).strip()
-                    else:
-                        return data.get('message', 'No suitable tables available')
-                except Exception:
-                    pass
-
-            # 3.5) Immediate table combinations (for "right now" requests)
-            immediate_combo_result = tool_results_by_name.get('getTableCombinationsNow')
-            if immediate_combo_result:
-                try:
-                    data = json.loads(immediate_combo_result)
-                    if data.get('status') == 'success':
-                        party = data.get('party_size')
-                        tables = data.get('recommended_tables', [])
-                        combo = data.get('requires_combination', False)
-                        capacity = data.get('total_capacity', 0)
-                        setup = data.get('setup_instructions', '')
-                        
-                        combo_text = " (table combination needed)" if combo else ""
-                        lines = [f"🔄 Immediate seating for party of {party}{combo_text}:"]
-                        for t in tables:
-                            lines.append(f"- Table {t.get('table_number', '?')} ({t.get('table_type', 'standard')}, seats {t.get('capacity', '?')})")
-                        lines.append(f"Total capacity: {capacity}")
-                        if setup:
-                            lines.append(f"Setup: {setup}")
-                        return "\n".join(lines).strip()
-                    else:
-                        return data.get('message', 'No suitable table combinations available right now')
-                except Exception:
-                    pass
-
-            # 4) Table suggestions (legacy system)
-            suggestions_result = tool_results_by_name.get('getTableSuggestions')
-            if suggestions_result:
-                try:
-                    data = json.loads(suggestions_result)
-                    party = data.get('party_size')
-                    suggestions = data.get('individual_suggestions', [])
-                    lines = [f"Top table suggestions for party of {party}:"]
-                    for s in suggestions[:5]:
-                        rec = s.get('recommendation')
-                        if rec:
-                            lines.append(f"- {rec}")
-                    return "\n".join(lines).strip()
-                except Exception:
-                    pass
-
-            # 5) Customer history
-            history_result = tool_results_by_name.get('getCustomerHistory')
-            if history_result:
-                try:
-                    data = json.loads(history_result)
-                    info = data.get('summary', {})
-                    total_visits = info.get('total_visits', 0)
-                    vip = info.get('vip_status', False)
-                    avg_party = info.get('average_party', 0)
-                    return f"Customer summary: {total_visits} total visits, average party size {avg_party}. VIP: {'Yes' if vip else 'No'}."
-                except Exception:
-                    pass
-
-            # 6) Booking details
-            booking_details_result = tool_results_by_name.get('checkBookingDetails')
-            if booking_details_result:
-                try:
-                    data = json.loads(booking_details_result)
-                    booking = data.get('booking_info', {})
+    except Exception as e:
+        print(f"Error running staff agent: {e}")
+        return f"Sorry, I encountered an error: {str(e)}"
+
+def _staff_input(user_input: str, restaurant_id: str = None, memory=None):
+    """Build the staff graph input; returns (graph input, the user message to remember)."""
+    # Enhance the user input with restaurant context if provided
+    if restaurant_id:
+        enhanced_input = f"[Restaurant ID: {restaurant_id}] {user_input}"
+    else:
+        enhanced_input = user_input
+    
+    # Create user message
+    user_message = HumanMessage(content=enhanced_input)
+    
+    # Build message list based on whether we have conversation memory
+    if memory:
+        # Use conversation history
+        history_messages = memory.get_messages()
+        current_input = {"messages": history_messages + [user_message]}
+    else:
+        # Stateless mode - just the current message
+        current_input = {"messages": [user_message]}
+    return current_input, user_message
+
+_BUDGET_EXHAUSTED_RESPONSE = "I couldn't finish looking that up within this request's limits. Please try again, or ask about one thing at a time."
+
+def _staff_response(result: dict, user_message: HumanMessage, memory=None) -> str:
+    """Save the turn to memory and turn the staff graph result into the final answer."""
+    ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
+    budget = current_budget()
+    stopped = budget is not None and bool(budget.exhausted)
+    answer = _staff_final_answer(result, stopped)
+
+    # Save conversation to memory if provided
+    if memory:
+        memory.add_message(user_message)
+        if stopped:
+            # The run stopped on its budget, so the last AI message may be an unanswered tool call
+            memory.add_message(AIMessage(content=answer))
+        elif ai_messages:
+            memory.add_message(ai_messages[-1])
+    return answer
+
+def _staff_final_answer(result: dict, stopped: bool = False) -> str:
+    """The answer for a staff graph result: the model's last text, else a summary of the tool outputs.
+
+    When the run stopped on its budget the last AI message is a tool call, not an answer, so
+    only the tool outputs (or the budget message) are used.
+    """
+    # Look for AI messages and tool results
+    ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
+    tool_messages = [msg for msg in result["messages"] if isinstance(msg, ToolMessage)]
+    
+    print(f"Found {len(ai_messages)} AI messages and {len(tool_messages)} tool messages")
+    
+    # If we have tool results but no proper AI response, create one
+    if tool_messages and ai_messages and not stopped:
+        last_ai_message = ai_messages[-1]
+        
+        # Check if the last AI message has content
+        if last_ai_message.content and last_ai_message.content.strip():
+            return last_ai_message.content
+    
+    # If no content but we have tool results, generate a response based on tool data
+    # Collect tool outputs by name
+    tool_results_by_name = {}
+    for tool_msg in tool_messages:
+        tool_name = getattr(tool_msg, 'name', None)
+        if tool_name:
+            tool_results_by_name[tool_name] = tool_msg.content
+
+    # 1) Today's bookings summary
+    booking_tool_result = tool_results_by_name.get('getTodaysBookings')
+    if booking_tool_result:
+        if booking_tool_result == "No bookings found for today":
+            return "No bookings scheduled for today."
+        try:
+            bookings = json.loads(booking_tool_result)
+            if isinstance(bookings, list):
+                count = len(bookings)
+                response = f"You have {count} booking{'s' if count != 1 else ''} for today:\n\n"
+                for i, booking in enumerate(bookings, 1):
+                    time = booking.get('booking_time', '').split('T')[1][:5] if 'T' in booking.get('booking_time', '') else 'Unknown time'
                     guest = booking.get('guest_name', 'Unknown guest')
-                    party = booking.get('party_size', 'Unknown')
-                    time = booking.get('booking_time', 'Unknown time')
+                    party = booking.get('party_size', 'Unknown size')
                     status = booking.get('status', 'Unknown status')
-                    return f"Booking details: {guest}, party of {party} at {time} ({status})."
-                except Exception:
-                    pass
-
-            # 7) Restaurant stats
-            stats_result = tool_results_by_name.get('getRestaurantStats')
-            if stats_result:
-                try:
-                    stats = json.loads(stats_result)
-                    total = stats.get('total_bookings', 0)
-                    covers = stats.get('total_covers', 0)
-                    peak = stats.get('peak_hour')
-                    peak_text = f", peak hour {peak.get('hour')}:00 with {peak.get('covers')} covers" if peak else ""
-                    return f"Today's stats: {total} bookings, {covers} covers{peak_text}."
-                except Exception:
-                    pass
-
-            # 8) Waitlist entries
-            waitlist_result = tool_results_by_name.get('getWaitlist')
-            if waitlist_result:
-                try:
-                    data = json.loads(waitlist_result)
-                    count = data.get('count', 0)
-                    entries = data.get('entries', [])
-                    if count == 0:
-                        return "No one is currently on the waitlist."
-                    first = entries[0] if entries else {}
-                    size = first.get('party_size', '?')
-                    return f"Waitlist: {count} part{'ies' if count != 1 else 'y'} waiting. Next up: party of {size}."
-                except Exception:
-                    pass
-
-            # 9) Waitlist stats
-            waitlist_stats_result = tool_results_by_name.get('getWaitlistStats')
-            if waitlist_stats_result:
-                try:
-                    data = json.loads(waitlist_stats_result)
-                    total_waiting = data.get('total_waiting', 0)
-                    next_up = data.get('next_up') or {}
-                    size = next_up.get('party_size', 'N/A') if isinstance(next_up, dict) else 'N/A'
-                    avg = data.get('average_quoted_wait_minutes')
-                    avg_text = f", avg quoted {avg} min" if avg is not None else ""
-                    return f"Waitlist: {total_waiting} active{avg_text}. Next up: party of {size}."
-                except Exception:
-                    pass
-
-            # 10) Wait time estimate
-            wait_est_result = tool_results_by_name.get('estimateWaitTime')
-            if wait_est_result:
-                try:
-                    data = json.loads(wait_est_result)
-                    est = data.get('estimated_wait_minutes')
-                    size = data.get('party_size')
-                    if est is not None:
-                        return f"Estimated wait for party of {size}: ~{est} minutes."
-                except Exception:
-                    pass
-
-            # 11) Table combination validation
-            validation_result = tool_results_by_name.get('validateTableCombination')
-            if validation_result:
-                try:
-                    data = json.loads(validation_result)
-                    is_valid = data.get('is_valid', False)
-                    capacity = data.get('total_capacity', 0)
-                    message = data.get('validation_message', '')
-                    party_size = data.get('party_size', 0)
-                    valid_text = "✅ Valid" if is_valid else "❌ Invalid"
-                    return f"{valid_text} table combination for party of {party_size}. Total capacity: {capacity}. {message}"
-                except Exception:
-                    pass
-
-            # 12) Availability report
-            report_result = tool_results_by_name.get('getTableAvailabilityReport')
-            if report_result:
-                try:
-                    data = json.loads(report_result)
-                    date = data.get('date', 'Unknown date')
-                    hourly = data.get('hourly_availability', [])
-                    summary = data.get('summary', {})
-                    peak_hours = summary.get('peak_hours', [])
-                    quiet_hours = summary.get('quiet_hours', [])
-                    
-                    lines = [f"Table availability report for {date}:"]
-                    if peak_hours:
-                        peak_times = [f"{h.get('hour', '?')}:00" for h in peak_hours[:3]]
-                        lines.append(f"Peak hours: {', '.join(peak_times)}")
-                    if quiet_hours:
-                        quiet_times = [f"{h.get('hour', '?')}:00" for h in quiet_hours[:3]]
-                        lines.append(f"Quiet hours: {', '.join(quiet_times)}")
-                    
-                    return "\n".join(lines).strip()
-                except Exception:
-                    pass
-            
-            # Fallback to last AI message content
-            if ai_messages:
-                last_ai_message = ai_messages[-1]
-                final_response = last_ai_message.content or "I apologize, but I couldn't generate a proper response. Please try again."
-                
-                # Save conversation to memory if provided
-                if memory:
-                    memory.add_message(user_message)
-                    memory.add_message(last_ai_message)
+                    response += f"{i}. {guest} - {party} people at {time} ({status})\n"
+                return response.strip()
+        except Exception:
+            return "You have bookings for today, but I couldn't parse the details properly."
+
+    # 2) Available tables summary
+    available_tables_result = tool_results_by_name.get('getAvailableTables')
+    if available_tables_result:
+        try:
+            data = json.loads(available_tables_result)
+            if 'available_tables' in data:
+                available = data.get('available_tables', [])
+                count = len(available)
+                requested_time = data.get('requested_time')
+                party_size = data.get('requested_party_size')
+                header = f"Found {count} suitable table{'s' if count != 1 else ''}"
+                if party_size:
+                    header += f" for party of {party_size}"
+                if requested_time:
+                    header += f" at {requested_time}"
+                header += ":\n"
+                details = []
+                for t in available[:5]:
+                    details.append(f"- Table {t.get('table_number', '?')} ({t.get('table_type', 'standard')}), seats {t.get('capacity', '?')}")
+                return (header + ("\n".join(details) if details else "")).strip()
+            elif 'all_tables' in data:
+                total = data.get('total_tables', 0)
+                sample = data.get('all_tables', [])[:5]
+                lines = [f"There are {total} active tables:"]
+                for t in sample:
+                    lines.append(f"- Table {t.get('table_number', '?')} ({t.get('table_type', 'standard')}), capacity {t.get('min_capacity', '?')}-{t.get('max_capacity', '?')}")
+                return "\n".join(lines).strip()
+        except Exception:
+            pass
+
+    # 3) Optimal table recommendations (new advanced system)
+    optimal_rec_result = tool_results_by_name.get('getOptimalTableRecommendations')
+    if optimal_rec_result:
+        try:
+            data = json.loads(optimal_rec_result)
+            if data.get('status') == 'success':
+                party = data.get('party_size')
+                tables = data.get('recommended_tables', [])
+                combo = data.get('requires_combination', False)
+                capacity = data.get('total_capacity', 0)
                 
-                return final_response
+                combo_text = " (table combination)" if combo else ""
+                lines = [f"Optimal recommendation for party of {party}{combo_text}:"]
+                for t in tables:
+                    lines.append(f"- Table {t.get('table_number', '?')} ({t.get('table_type', 'standard')}, seats {t.get('capacity', '?')})")
+                lines.append(f"Total capacity: {capacity}")
+                return "\n".join(lines).strip()
             else:
-                print("No AI messages found in result")
-                return "Sorry, I couldn't process your request."
+                return data.get('message', 'No suitable tables available')
+        except Exception:
+            pass
+
+    # 3.5) Immediate table combinations (for "right now" requests)
+    immediate_combo_result = tool_results_by_name.get('getTableCombinationsNow')
+    if immediate_combo_result:
+        try:
+            data = json.loads(immediate_combo_result)
+            if data.get('status') == 'success':
+                party = data.get('party_size')
+                tables = data.get('recommended_tables', [])
+                combo = data.get('requires_combination', False)
+                capacity = data.get('total_capacity', 0)
+                setup = data.get('setup_instructions', '')
                 
-        finally:
-            # Always restore the original client
-            supabase = original_client
+                combo_text = " (table combination needed)" if combo else ""
+                lines = [f"🔄 Immediate seating for party of {party}{combo_text}:"]
+                for t in tables:
+                    lines.append(f"- Table {t.get('table_number', '?')} ({t.get('table_type', 'standard')}, seats {t.get('capacity', '?')})")
+                lines.append(f"Total capacity: {capacity}")
+                if setup:
+                    lines.append(f"Setup: {setup}")
+                return "\n".join(lines).strip()
+            else:
+                return data.get('message', 'No suitable table combinations available right now')
+        except Exception:
+            pass
+
+    # 4) Table suggestions (legacy system)
+    suggestions_result = tool_results_by_name.get('getTableSuggestions')
+    if suggestions_result:
+        try:
+            data = json.loads(suggestions_result)
+            party = data.get('party_size')
+            suggestions = data.get('individual_suggestions', [])
+            lines = [f"Top table suggestions for party of {party}:"]
+            for s in suggestions[:5]:
+                rec = s.get('recommendation')
+                if rec:
+                    lines.append(f"- {rec}")
+            return "\n".join(lines).strip()
+        except Exception:
+            pass
+
+    # 5) Customer history
+    history_result = tool_results_by_name.get('getCustomerHistory')
+    if history_result:
+        try:
+            data = json.loads(history_result)
+            info = data.get('summary', {})
+            total_visits = info.get('total_visits', 0)
+            vip = info.get('vip_status', False)
+            avg_party = info.get('average_party', 0)
+            return f"Customer summary: {total_visits} total visits, average party size {avg_party}. VIP: {'Yes' if vip else 'No'}."
+        except Exception:
+            pass
+
+    # 6) Booking details
+    booking_details_result = tool_results_by_name.get('checkBookingDetails')
+    if booking_details_result:
+        try:
+            data = json.loads(booking_details_result)
+            booking = data.get('booking_info', {})
+            guest = booking.get('guest_name', 'Unknown guest')
+            party = booking.get('party_size', 'Unknown')
+            time = booking.get('booking_time', 'Unknown time')
+            status = booking.get('status', 'Unknown status')
+            return f"Booking details: {guest}, party of {party} at {time} ({status})."
+        except Exception:
+            pass
+
+    # 7) Restaurant stats
+    stats_result = tool_results_by_name.get('getRestaurantStats')
+    if stats_result:
+        try:
+            stats = json.loads(stats_result)
+            total = stats.get('total_bookings', 0)
+            covers = stats.get('total_covers', 0)
+            peak = stats.get('peak_hour')
+            peak_text = f", peak hour {peak.get('hour')}:00 with {peak.get('covers')} covers" if peak else ""
+            return f"Today's stats: {total} bookings, {covers} covers{peak_text}."
+        except Exception:
+            pass
+
+    # 8) Waitlist entries
+    waitlist_result = tool_results_by_name.get('getWaitlist')
+    if waitlist_result:
+        try:
+            data = json.loads(waitlist_result)
+            count = data.get('count', 0)
+            entries = data.get('entries', [])
+            if count == 0:
+                return "No one is currently on the waitlist."
+            first = entries[0] if entries else {}
+            size = first.get('party_size', '?')
+            return f"Waitlist: {count} part{'ies' if count != 1 else 'y'} waiting. Next up: party of {size}."
+        except Exception:
+            pass
+
+    # 9) Waitlist stats
+    waitlist_stats_result = tool_results_by_name.get('getWaitlistStats')
+    if waitlist_stats_result:
+        try:
+            data = json.loads(waitlist_stats_result)
+            total_waiting = data.get('total_waiting', 0)
+            next_up = data.get('next_up') or {}
+            size = next_up.get('party_size', 'N/A') if isinstance(next_up, dict) else 'N/A'
+            avg = data.get('average_quoted_wait_minutes')
+            avg_text = f", avg quoted {avg} min" if avg is not None else ""
+            return f"Waitlist: {total_waiting} active{avg_text}. Next up: party of {size}."
+        except Exception:
+            pass
+
+    # 10) Wait time estimate
+    wait_est_result = tool_results_by_name.get('estimateWaitTime')
+    if wait_est_result:
+        try:
+            data = json.loads(wait_est_result)
+            est = data.get('estimated_wait_minutes')
+            size = data.get('party_size')
+            if est is not None:
+                return f"Estimated wait for party of {size}: ~{est} minutes."
+        except Exception:
+            pass
+
+    # 11) Table combination validation
+    validation_result = tool_results_by_name.get('validateTableCombination')
+    if validation_result:
+        try:
+            data = json.loads(validation_result)
+            is_valid = data.get('is_valid', False)
+            capacity = data.get('total_capacity', 0)
+            message = data.get('validation_message', '')
+            party_size = data.get('party_size', 0)
+            valid_text = "✅ Valid" if is_valid else "❌ Invalid"
+            return f"{valid_text} table combination for party of {party_size}. Total capacity: {capacity}. {message}"
+        except Exception:
+            pass
+
+    # 12) Availability report
+    report_result = tool_results_by_name.get('getTableAvailabilityReport')
+    if report_result:
+        try:
+            data = json.loads(report_result)
+            date = data.get('date', 'Unknown date')
+            hourly = data.get('hourly_availability', [])
+            summary = data.get('summary', {})
+            peak_hours = summary.get('peak_hours', [])
+            quiet_hours = summary.get('quiet_hours', [])
             
-    except Exception as e:
-        # Ensure we restore the original client even if there's an error
-        if 'original_client' in locals():
-            supabase = original_client
-        print(f"Error running staff agent: {e}")
-        return f"Sorry, I encountered an error: {str(e)}"
+            lines = [f"Table availability report for {date}:"]
+            if peak_hours:
+                peak_times = [f"{h.get('hour', '?')}:00" for h in peak_hours[:3]]
+                lines.append(f"Peak hours: {', '.join(peak_times)}")
+            if quiet_hours:
+                quiet_times = [f"{h.get('hour', '?')}:00" for h in quiet_hours[:3]]
+                lines.append(f"Quiet hours: {', '.join(quiet_times)}")
+            
+            return "\n".join(lines).strip()
+        except Exception:
+            pass
+    
+    if stopped:
+        return _BUDGET_EXHAUSTED_RESPONSE
+
+    # Fallback to last AI message content
+    if ai_messages:
+        return ai_messages[-1].content or "I apologize, but I couldn't generate a proper response. Please try again."
+    else:
+        print("No AI messages found in result")
+        return "Sorry, I couldn't process your request."
+
+async def achat_with_staff_bot(user_input: str, restaurant_id: str = None, memory=None, authenticated_client=None, current_user=None, priority: Optional[str] = None) -> str:
+    """
+    Async chat_with_staff_bot for the ASGI app (asgi_app.py); same arguments and answers.
+    The model is awaited instead of blocking a thread.
+    """
+    client_to_use = coalescing(authenticated_client) if authenticated_client else supabase
+    with request_scope(client_to_use, current_user, restaurant_id, priority=priority or staff_priority(current_user)):
+        try:
+            current_input, user_message = _staff_input(user_input, restaurant_id, memory)
+            result = await staff_app.ainvoke(current_input)
+            return _staff_response(result, user_message, memory)
+        except Exception as e:
+            print(f"Error running staff agent: {e}")
+            return f"Sorry, I encountered an error: {str(e)}"
+
+def stream_chat_with_staff_bot(user_input: str, restaurant_id: str = None, memory=None, authenticated_client=None, current_user=None, priority: Optional[str] = None):
+    """Like chat_with_staff_bot, but yields progress/tool/token events and a final "done" event (see chat_stream)."""
+    return stream_chat(lambda: chat_with_staff_bot(user_input, restaurant_id, memory, authenticated_client, current_user, priority), parse_restaurants=False)
 
 # Interactive chat function for testing
 def start_staff_interactive_chat():
@@ -0,0 +1,172 @@
+"""
+Graph mode helpers shared by the customer and staff agents.
+
+Two termination modes are supported:
+- "direct" (default): the first AIMessage with content and no tool calls ends
+  the run. finishedUsingTools is never bound, which saves a full LLM round trip
+  per request that used tools.
+- "finish_tool": legacy behaviour, the model signals completion by calling
+  finishedUsingTools.
+
+Both graphs also stop early once the request's step budget
+(request_context.RequestBudget) is spent: tools_within_budget() ends the run
+instead of executing tool calls the budget can't cover, and after_tools()
+ends it instead of another model call. The agents then answer from the tool
+results so far.
+
+Env:
+  AGENT_GRAPH_MODE=direct | finish_tool
+"""
+
+import os
+import re
+from typing import Any, Awaitable, Callable, List
+
+from langchain_core.messages import AIMessage, BaseMessageChunk
+from langchain_core.messages.utils import message_chunk_to_message
+from langchain_core.runnables import RunnableLambda
+
+from llm_scheduler import ANONYMOUS, llm_scheduler
+from request_context import current_budget, current_request, emit_event, streaming_requested
+
+FINISH_TOOL_NAME = "finishedUsingTools"
+
+AGENT_GRAPH_MODE = os.getenv("AGENT_GRAPH_MODE", "direct").strip().lower()
+DIRECT_FINISH = AGENT_GRAPH_MODE != "finish_tool"
+
+_NUMBERED_STEP = re.compile(r"^(\s*)(\d+)\.")
+
+DIRECT_FINISH_RULE = """
+**COMPLETING A REQUEST:**
+- Use tools to gather the data you need, then reply with your final answer as plain text
+- Your first reply without tool calls ends the request, so only reply once you have what you need
+"""
+
+
+def tools_for_mode(tools: List[Any], direct_finish: bool = DIRECT_FINISH) -> List[Any]:
+    """Return the tools to bind for the given mode (drops finishedUsingTools in direct mode)."""
+    if not direct_finish:
+        return list(tools)
+    return [t for t in tools if getattr(t, "name", None) != FINISH_TOOL_NAME]
+
+
+def prompt_for_mode(prompt: str, direct_finish: bool = DIRECT_FINISH) -> str:
+    """Return the system prompt for the given mode.
+
+    In direct mode every line that instructs the model to call finishedUsingTools
+    is removed (renumbering the rest of its numbered list) and a short
+    completion rule is appended instead.
+    """
+    if not direct_finish:
+        return prompt
+    lines: List[str] = []
+    removed_steps = 0
+    for line in prompt.splitlines():
+        numbered = _NUMBERED_STEP.match(line)
+        if FINISH_TOOL_NAME in line:
+            if numbered:
+                removed_steps += 1
+            continue
+        if not line.strip():
+            removed_steps = 0
+        elif numbered and removed_steps:
+            line = f"{numbered.group(1)}{int(numbered.group(2)) - removed_steps}.{line[numbered.end():]}"
+        lines.append(line)
+    return "\n".join(lines).rstrip() + "\n" + DIRECT_FINISH_RULE
+
+
+def _chunk_text(chunk: Any) -> str:
+    content = getattr(chunk, "content", "")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+def _budget_exhausted(budget: Any) -> None:
+    print(f"Request budget exhausted ({budget.exhausted}: {budget.llm_calls} model calls, {budget.tool_calls} tool calls); "
+          "answering from the tool results so far")
+
+
+def tools_within_budget(tool_calls: List[dict]) -> bool:
+    """False when the request's budget can't cover these tool calls; the graph then ends."""
+    budget = current_budget()
+    if budget is None or budget.allows_tool_calls(len(tool_calls)):
+        return True
+    _budget_exhausted(budget)
+    return False
+
+
+def after_tools(state: dict) -> str:
+    """Edge after the tool node: "continue" to the model, or "end" once the budget allows no further model call."""
+    budget = current_budget()
+    if budget is None or budget.allows_llm_call():
+        return "continue"
+    _budget_exhausted(budget)
+    return "end"
+
+
+def _charge_llm_call():
+    budget = current_budget()
+    if budget is not None:
+        budget.charge(llm_calls=1)
+
+
+def _priority() -> str:
+    request = current_request()
+    return request.priority if request else ANONYMOUS
+
+
+def invoke_model(bound_llm: Any, messages: List[Any]) -> Any:
+    """Invoke the model for an agent node, in a slot from the shared llm_scheduler.
+
+    While serving a streaming request the model is streamed instead and every
+    text chunk is forwarded as a "token" event; the merged message is returned
+    so the graph sees the same AIMessage either way.
+    """
+    _charge_llm_call()
+    with llm_scheduler.slot(_priority()):
+        return _invoke_model(bound_llm, messages)
+
+
+def _invoke_model(bound_llm: Any, messages: List[Any]) -> Any:
+    if not (streaming_requested() and hasattr(bound_llm, "stream")):
+        return bound_llm.invoke(messages)
+    emit_event("llm_start")
+    merged = None
+    for chunk in bound_llm.stream(messages):
+        text = _chunk_text(chunk)
+        if text:
+            emit_event("token", text=text)
+        merged = chunk if merged is None else merged + chunk
+    emit_event("llm_end")
+    if merged is None:
+        return AIMessage(content="")
+    return message_chunk_to_message(merged) if isinstance(merged, BaseMessageChunk) else merged
+
+
+async def ainvoke_model(bound_llm: Any, messages: List[Any]) -> Any:
+    """Async invoke_model: awaits the model (astream while streaming) instead of blocking a thread."""
+    _charge_llm_call()
+    async with llm_scheduler.aslot(_priority()):
+        return await _ainvoke_model(bound_llm, messages)
+
+
+async def _ainvoke_model(bound_llm: Any, messages: List[Any]) -> Any:
+    if not (streaming_requested() and hasattr(bound_llm, "astream")):
+        return await bound_llm.ainvoke(messages)
+    emit_event("llm_start")
+    merged = None
+    async for chunk in bound_llm.astream(messages):
+        text = _chunk_text(chunk)
+        if text:
+            emit_event("token", text=text)
+        merged = chunk if merged is None else merged + chunk
+    emit_event("llm_end")
+    if merged is None:
+        return AIMessage(content="")
+    return message_chunk_to_message(merged) if isinstance(merged, BaseMessageChunk) else merged
+
+
+def graph_node(func: Callable[[dict], dict], afunc: Callable[[dict], Awaitable[dict]], name: str) -> RunnableLambda:
+    """Graph node that runs func under app.invoke() and afunc under app.ainvoke()."""
+    return RunnableLambda(func, afunc=afunc, name=name)
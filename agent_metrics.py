@@ -0,0 +1,81 @@
+"""
+Lightweight in-process metrics for the AI agents.
+
+Records call counts and latency per key (tool name, model name, ...) so the
+API can expose them through the admin stats endpoint, plus a cheap token
+estimator used for prompt-size accounting.
+"""
+
+import threading
+from typing import Dict, Optional
+
+# Rough chars-per-token ratio for Gemini/English text; good enough for relative comparisons
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimate the token count of a piece of text."""
+    if not text:
+        return 0
+    return max(1, len(text) // _CHARS_PER_TOKEN)
+
+
+class LatencyStats:
+    """Running latency statistics for a single key."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float, ok: bool = True, timed_out: bool = False):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if timed_out:
+            self.timeouts += 1
+        elif not ok:
+            self.errors += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0,
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe collection of LatencyStats keyed by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, LatencyStats] = {}
+
+    def record(self, name: str, elapsed_ms: float, ok: bool = True, timed_out: bool = False):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = LatencyStats()
+            stats.record(elapsed_ms, ok=ok, timed_out=timed_out)
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            stats = self._stats.get(name)
+            return stats.snapshot() if stats else None
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# Shared registry for tool executions (both agents)
+tool_metrics = MetricsRegistry()
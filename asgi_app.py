@@ -0,0 +1,300 @@
+"""
+Async (ASGI) serving path for the chat endpoints.
+
+Serves /api/chat and /api/staff/chat with the same request/response contract
+as flask_api_ai.py, but each request is a coroutine: the model calls are
+awaited through app.ainvoke() (achat_with_bot / achat_with_staff_bot), so a
+request waiting on Gemini doesn't hold a worker thread. Supabase work (profile
+fetch, tools, sessions) is still synchronous and runs on worker threads.
+
+Run:
+  uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+
+The Flask app stays the default deployment (vercel.json); everything except
+the two chat endpoints and /api/health is only served there. The chat
+endpoints get the same per-IP rate limits as on Flask (CHAT_RATE_LIMIT,
+STAFF_CHAT_RATE_LIMIT), counted in memory per process like flask_limiter's
+memory:// storage.
+"""
+
+import asyncio
+import logging
+
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from chat_stream import split_restaurants
+from flask_api_ai import (
+    AI_AVAILABLE,
+    CHAT_RATE_LIMIT,
+    SERVER_SESSIONS_DEFAULT,
+    STAFF_AI_AVAILABLE,
+    STAFF_CHAT_RATE_LIMIT,
+    create_authenticated_supabase_client,
+    get_user_from_token,
+    invalid_session_body,
+    is_allowed_user_agent,
+    memory_from_history,
+    open_server_session,
+    overloaded_body,
+    session_conflict_body,
+    server_session_id,
+    session_store,
+)
+from llm_scheduler import ANONYMOUS, AUTHENTICATED, Overloaded, llm_scheduler, staff_priority
+from session_store import InvalidSession, SessionConflict
+
+if AI_AVAILABLE:
+    from AI_Agent import achat_with_bot, create_conversation_memory, prefetch_user_profile, restaurant_cards_for
+if STAFF_AI_AVAILABLE:
+    from AI_Agent_Restaurant import achat_with_staff_bot, create_staff_conversation_memory
+
+logger = logging.getLogger(__name__)
+
+_SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Referrer-Policy': 'strict-origin-when-cross-origin',
+    'Content-Security-Policy': "default-src 'self'; script-src 'none'; object-src 'none';",
+}
+
+
+def _json(body, status=200):
+    return JSONResponse(body, status_code=status, headers=_SECURITY_HEADERS)
+
+
+def _error(message, status, **extra):
+    return _json({'error': message, 'status': 'error', **extra}, status)
+
+
+# flask_limiter's default strategy, on the same `limits` package
+_rate_limiter = FixedWindowRateLimiter(MemoryStorage())
+_CHAT_LIMIT = parse(CHAT_RATE_LIMIT)
+_STAFF_CHAT_LIMIT = parse(STAFF_CHAT_RATE_LIMIT)
+
+
+def _rate_limited(request: Request, limit):
+    """429 like Flask's ratelimit_handler when the client IP is over limit on this route, else None"""
+    remote_address = request.client.host if request.client else '127.0.0.1'
+    if _rate_limiter.hit(limit, request.url.path, remote_address):
+        return None
+    logger.warning(f"Rate limit {limit} exceeded by {remote_address} on {request.url.path}")
+    return JSONResponse({
+        'error': 'Rate limit exceeded',
+        'message': 'Too many requests. Please wait before making another request.',
+        'status': 'error'
+    }, status_code=429, headers={**_SECURITY_HEADERS, 'Retry-After': '60', 'X-RateLimit-Limit': str(limit), 'X-RateLimit-Remaining': '0'})
+
+
+def _shed(priority):
+    """503 with Retry-After when the model queue is too deep for this priority (see llm_scheduler), else None"""
+    try:
+        llm_scheduler.admit(priority)
+    except Overloaded as e:
+        logger.warning(f"{e}; retry after {e.retry_after}s")
+        return JSONResponse(overloaded_body(e), status_code=503, headers={**_SECURITY_HEADERS, 'Retry-After': str(e.retry_after)})
+    return None
+
+
+async def _authenticate(request: Request):
+    """Return (jwt_token, authenticated_client, current_user) for the Authorization header; current_user is None for a token that fails verification"""
+    auth_header = request.headers.get('Authorization', '')
+    jwt_token = auth_header.split(' ')[1] if auth_header.startswith('Bearer ') else None
+    if not jwt_token:
+        return None, None, None
+    # Signature check (or a JWKS fetch) is blocking work; keep it off the event loop
+    current_user = await asyncio.to_thread(get_user_from_token, jwt_token)
+    if not current_user:
+        return jwt_token, None, None
+    authenticated_client = await asyncio.to_thread(create_authenticated_supabase_client, jwt_token)
+    return jwt_token, authenticated_client, current_user
+
+
+async def _open_memory(scope, data, session_id, current_user, create_memory):
+    """Conversation memory for the request: (memory, session_key, session_version, session_id);
+    raises SessionConflict or InvalidSession. Server sessions may get a newly issued session_id."""
+    if bool(data.get('server_session', SERVER_SESSIONS_DEFAULT)):
+        session_id = server_session_id(scope, data.get('session_id'), current_user)
+        memory, session_key, session_version = await asyncio.to_thread(open_server_session, scope, session_id, current_user, data, create_memory)
+        return memory, session_key, session_version, session_id
+    conversation_history = data.get('conversation_history', [])
+    if conversation_history and isinstance(conversation_history, list):
+        try:
+            return memory_from_history(conversation_history, create_memory), None, None, session_id
+        except Exception as e:
+            logger.warning(f"Failed to process conversation history: {e}")
+    return None, None, None, session_id
+
+
+async def _read_message(request: Request):
+    """Return (data, message) or an error response"""
+    if not is_allowed_user_agent(request.headers.get('User-Agent', '')):
+        return None, _error('Invalid request source', 403)
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not data or 'message' not in data:
+        return None, _error('Message is required', 400)
+    message = data['message'].strip()
+    if not message:
+        return None, _error('Message cannot be empty', 400)
+    return data, message
+
+
+async def health(request: Request):
+    return _json({
+        'status': 'healthy',
+        'message': 'Restaurant AI Agent API is running (ASGI)',
+        'ai_available': AI_AVAILABLE,
+        'staff_ai_available': STAFF_AI_AVAILABLE
+    })
+
+
+async def chat(request: Request):
+    """Async /api/chat; same request and response bodies as the Flask endpoint."""
+    limited = _rate_limited(request, _CHAT_LIMIT)
+    if limited:
+        return limited
+    try:
+        if not AI_AVAILABLE:
+            return _error('AI functionality not available', 503, message='Please check environment variables and dependencies')
+        data, user_message = await _read_message(request)
+        if data is None:
+            return user_message
+
+        session_id = data.get('session_id', 'default')
+        user_id = data.get('user_id')
+        jwt_token, authenticated_client, current_user = await _authenticate(request)
+        if jwt_token and not current_user:
+            return _error('Invalid or expired token', 401)
+        shed = _shed(AUTHENTICATED if current_user else ANONYMOUS)
+        if shed:
+            return shed
+        logger.info(f"Received message from session {session_id} (user: {user_id}): {user_message}")
+        # Load the profile while the session is restored; achat_with_bot joins the fetch
+        prefetch_user_profile(user_id, authenticated_client)
+
+        try:
+            memory, session_key, session_version, session_id = await _open_memory(
+                'customer', data, session_id, current_user, create_conversation_memory)
+        except InvalidSession as e:
+            return _json(invalid_session_body(e), 400)
+        except SessionConflict as e:
+            return _json(session_conflict_body(session_id, e), 409)
+
+        ai_response = await achat_with_bot(
+            user_message,
+            memory=memory,
+            user_id=user_id,
+            authenticated_client=authenticated_client,
+            current_user=current_user
+        )
+
+        if session_key:
+            try:
+                session_version = await asyncio.to_thread(session_store.save, session_key, memory.export_state(), session_version)
+            except SessionConflict as e:
+                return _json(session_conflict_body(session_id, e, ai_response), 409)
+
+        response_text, restaurants_to_show = split_restaurants(ai_response)
+        response_body = {
+            'response': response_text,
+            'restaurants_to_show': restaurants_to_show,
+            'session_id': session_id,
+            'user_id': user_id,
+            'authenticated': jwt_token is not None,
+            'status': 'success'
+        }
+        if session_key:
+            response_body['session_version'] = session_version
+        if data.get('include_cards'):
+            response_body['restaurant_cards'] = await asyncio.to_thread(restaurant_cards_for, restaurants_to_show)
+        return _json(response_body)
+
+    except Exception as e:
+        logger.error(f"Error in async chat endpoint: {str(e)}")
+        return _error('Internal server error', 500, message=str(e))
+
+
+async def staff_chat(request: Request):
+    """Async /api/staff/chat; same request and response bodies as the Flask endpoint."""
+    limited = _rate_limited(request, _STAFF_CHAT_LIMIT)
+    if limited:
+        return limited
+    try:
+        if not STAFF_AI_AVAILABLE:
+            return _error('Staff AI functionality not available', 503, message='Please check environment variables and dependencies')
+        data, user_message = await _read_message(request)
+        if data is None:
+            return user_message
+
+        restaurant_id = data.get('restaurant_id')
+        session_id = data.get('session_id', 'staff_default')
+        user_id = data.get('user_id')
+        jwt_token, authenticated_client, current_user = await _authenticate(request)
+        if jwt_token and not current_user:
+            return _error('Invalid or expired token', 401)
+        # Only a verified staff member gets STAFF priority (never shed)
+        priority = staff_priority(current_user)
+        shed = _shed(priority)
+        if shed:
+            return shed
+        logger.info(f"Received staff message from session {session_id}: {user_message}")
+
+        try:
+            memory, session_key, session_version, session_id = await _open_memory(
+                'staff', data, session_id, current_user, create_staff_conversation_memory)
+        except InvalidSession as e:
+            return _json(invalid_session_body(e), 400)
+        except SessionConflict as e:
+            return _json(session_conflict_body(session_id, e), 409)
+
+        staff_response = await achat_with_staff_bot(
+            user_message,
+            restaurant_id,
+            memory=memory,
+            authenticated_client=authenticated_client,
+            current_user=current_user,
+            priority=priority
+        )
+
+        if session_key:
+            try:
+                session_version = await asyncio.to_thread(session_store.save, session_key, memory.export_state(), session_version)
+            except SessionConflict as e:
+                return _json(session_conflict_body(session_id, e, staff_response), 409)
+
+        response_body = {
+            'response': staff_response,
+            'session_id': session_id,
+            'restaurant_id': restaurant_id,
+            'user_id': user_id,
+            'authenticated': jwt_token is not None,
+            'status': 'success'
+        }
+        if session_key:
+            response_body['session_version'] = session_version
+        return _json(response_body)
+
+    except Exception as e:
+        logger.error(f"Error in async staff chat endpoint: {str(e)}")
+        return _error('Internal server error', 500, message=str(e))
+
+
+app = Starlette(
+    routes=[
+        Route('/api/health', health, methods=['GET']),
+        Route('/api/chat', chat, methods=['POST']),
+        Route('/api/staff/chat', staff_chat, methods=['POST']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+)
@@ -15,6 +15,9 @@ from typing import Any, Dict, List, Optional
 from dateutil import tz
 from supabase import create_client, Client
 
+from request_context import current_request, memoized, remaining_time
+from supabase_coalescing import coalescing
+
 # Timezone handling
 _LOCAL_TZ = tz.gettz(os.getenv("AVAILABILITY_TZ", "Asia/Beirut")) or tz.UTC
 
@@ -31,7 +34,10 @@ class Table:
 
 _SUPABASE: Optional[Client] = None
 
+SLOT_STEP_MINUTES = 15
+
 def _get_supabase() -> Client:
+	# Availability must see every booking, so this stays the backend client rather than the request's RLS client
 	global _SUPABASE
 	if _SUPABASE is not None:
 		return _SUPABASE
@@ -39,7 +45,7 @@ def _get_supabase() -> Client:
 	key = os.environ.get("SUPABASE_SERVICE_KEY") or os.environ.get("EXPO_PUBLIC_SUPABASE_ANON_KEY") or os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY")
 	if not (url and key):
 		raise RuntimeError("Supabase credentials missing")
-	_SUPABASE = create_client(url, key)
+	_SUPABASE = coalescing(create_client(url, key))
 	return _SUPABASE
 
 def _parse_date(d: Any) -> date_cls:
@@ -190,7 +196,7 @@ def _generate_15_minute_slots(sb: Client, restaurant_id: str, d: date_cls, open_
 		while minutes <= close_total - buffer_minutes:
 			h, m = divmod(minutes, 60)
 			slots.append(f"{str(h).zfill(2)}:{str(m).zfill(2)}")
-			minutes += 15
+			minutes += SLOT_STEP_MINUTES
 	except Exception:
 		_log_exception("_generate_15_minute_slots")
 	return slots
@@ -259,65 +265,117 @@ def _quick_availability_check(sb: Client, restaurant_id: str, start_dt_local: da
 		_log_exception("_quick_availability_check")
 		return False
 
-def get_available_time_slots(restaurant_id: str, date: Any, party_size: int, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+def _hhmm_to_minutes(hhmm: str) -> int:
+	h, m = [int(x) for x in _normalize_time_str(hhmm).split(":")]
+	return h * 60 + m
+
+def encode_slot_ranges(slots: List[Dict[str, Any]], step_minutes: int = SLOT_STEP_MINUTES) -> Dict[str, Any]:
+	"""Collapse consecutive available slots into ranges: {"count": 15, "ranges": ["18:00–21:30 every 15m", "22:15"]}."""
+	times = sorted({s["time"] for s in slots if s.get("available")}, key=_hhmm_to_minutes)
+	ranges: List[str] = []
+	start = prev = None
+	for hhmm in times + [None]:
+		if hhmm is not None and prev is not None and _hhmm_to_minutes(hhmm) - _hhmm_to_minutes(prev) == step_minutes:
+			prev = hhmm
+			continue
+		if start is not None:
+			ranges.append(start if start == prev else f"{start}–{prev} every {step_minutes}m")
+		start = prev = hhmm
+	return {"count": len(times), "ranges": ranges}
+
+def expand_slot_ranges(encoded: Dict[str, Any]) -> List[Dict[str, Any]]:
+	"""Inverse of encode_slot_ranges: back to [{"time": "HH:MM", "available": True}, ...]."""
+	slots: List[Dict[str, Any]] = []
+	for item in encoded.get("ranges", []):
+		if "–" not in item:
+			slots.append({"time": item, "available": True})
+			continue
+		span, _, every = item.partition(" every ")
+		start, end = span.split("–")
+		step = int(every.rstrip("m") or SLOT_STEP_MINUTES)
+		for minutes in range(_hhmm_to_minutes(start), _hhmm_to_minutes(end) + 1, step):
+			h, m = divmod(minutes, 60)
+			slots.append({"time": f"{str(h).zfill(2)}:{str(m).zfill(2)}", "available": True})
+	return slots
+
+def get_available_time_slots(restaurant_id: str, date: Any, party_size: int, user_id: Optional[str] = None, encoding: str = "list") -> Any:
+	"""Available slots for the day. encoding="list" returns [{"time", "available"}, ...];
+	encoding="ranges" returns encode_slot_ranges() output."""
+	if encoding == "ranges":
+		return encode_slot_ranges(get_available_time_slots(restaurant_id, date, party_size, user_id))
+	return _available_time_slots(restaurant_id, date, party_size, user_id)
+
+def prefetch_available_time_slots(restaurant_id: str, date: Any, party_size: int) -> None:
+	"""Compute the slots into the request memo ahead of the tool call that will ask for them."""
+	_available_time_slots(restaurant_id, date, party_size, None, speculative=True)
+
+def _available_time_slots(restaurant_id: str, date: Any, party_size: int, user_id: Optional[str], speculative: bool = False) -> Any:
+	# VIP booking windows apply to the chat request's authenticated user unless another user is given
+	request = current_request()
+	user_id = user_id or (request.user_id if request else None)
 	try:
-		sb = _get_supabase()
 		d = _parse_date(date)
 		party_size = int(party_size)
+		# Computed once per request: a speculative prefetch and the later tool calls share it
+		key = ("available_time_slots", restaurant_id, d.isoformat(), party_size, user_id)
+		return memoized(key, lambda: _compute_available_time_slots(restaurant_id, d, party_size, user_id), speculative=speculative)
+	except Exception:
+		_log_exception("get_available_time_slots")
+		return []
 
-		cfg = _get_restaurant_config(sb, restaurant_id)
-
-		today_local = datetime.now(_LOCAL_TZ).date()
-		days_diff = (d - today_local).days
-		max_days = int(cfg.get("booking_window_days") or 30)
-
-		if user_id:
-			try:
-				vip = (
-					sb.table("restaurant_vip_users")
-					.select("extended_booking_days")
-					.eq("restaurant_id", restaurant_id)
-					.eq("user_id", user_id)
-					.gte("valid_until", datetime.utcnow().isoformat())
-					.single()
-					.execute()
-				)
-				if vip and getattr(vip, "data", None) and vip.data.get("extended_booking_days"):
-					max_days = int(vip.data["extended_booking_days"])
-			except Exception:
-				_log_exception("VIP lookup")
+def _compute_available_time_slots(restaurant_id: str, d: date_cls, party_size: int, user_id: Optional[str]) -> List[Dict[str, Any]]:
+	sb = _get_supabase()
+
+	cfg = _get_restaurant_config(sb, restaurant_id)
+
+	today_local = datetime.now(_LOCAL_TZ).date()
+	days_diff = (d - today_local).days
+	max_days = int(cfg.get("booking_window_days") or 30)
+
+	if user_id:
+		try:
+			vip = (
+				sb.table("restaurant_vip_users")
+				.select("extended_booking_days")
+				.eq("restaurant_id", restaurant_id)
+				.eq("user_id", user_id)
+				.gte("valid_until", datetime.utcnow().isoformat())
+				.single()
+				.execute()
+			)
+			if vip and getattr(vip, "data", None) and vip.data.get("extended_booking_days"):
+				max_days = int(vip.data["extended_booking_days"])
+		except Exception:
+			_log_exception("VIP lookup")
 
-		if days_diff > max_days:
-			return []
+	if days_diff > max_days:
+		return []
 
-		oh = _get_operating_hours_for_date(cfg, d)
-		if oh["isClosed"] or len(oh["shifts"]) == 0:
-			return []
+	oh = _get_operating_hours_for_date(cfg, d)
+	if oh["isClosed"] or len(oh["shifts"]) == 0:
+		return []
 
-		base: List[str] = []
-		for shift in oh["shifts"]:
-			base.extend(_generate_15_minute_slots(sb, restaurant_id, d, shift["openTime"], shift["closeTime"], party_size))
-		unique_slots = sorted(list({t for t in base}))
+	base: List[str] = []
+	for shift in oh["shifts"]:
+		base.extend(_generate_15_minute_slots(sb, restaurant_id, d, shift["openTime"], shift["closeTime"], party_size))
+	unique_slots = sorted(list({t for t in base}))
 
-		results: List[Dict[str, Any]] = []
-		turn_time_for_slot: Optional[int] = None
-		now_local = datetime.now(_LOCAL_TZ)
+	results: List[Dict[str, Any]] = []
+	turn_time_for_slot: Optional[int] = None
+	now_local = datetime.now(_LOCAL_TZ)
 
-		for hhmm in unique_slots:
-			start_dt_local = _combine_local(d, hhmm)
-			if start_dt_local < now_local:
-				continue
-			if turn_time_for_slot is None:
-				turn_time_for_slot = _get_turn_time_for_party(sb, restaurant_id, party_size, start_dt_local)
-			end_dt_local = start_dt_local + timedelta(minutes=turn_time_for_slot)
+	for hhmm in unique_slots:
+		start_dt_local = _combine_local(d, hhmm)
+		if start_dt_local < now_local:
+			continue
+		if turn_time_for_slot is None:
+			turn_time_for_slot = _get_turn_time_for_party(sb, restaurant_id, party_size, start_dt_local)
+		end_dt_local = start_dt_local + timedelta(minutes=turn_time_for_slot)
 
-			if _quick_availability_check(sb, restaurant_id, start_dt_local, end_dt_local, party_size):
-				results.append({"time": hhmm, "available": True})
+		if _quick_availability_check(sb, restaurant_id, start_dt_local, end_dt_local, party_size):
+			results.append({"time": hhmm, "available": True})
 
-		return results
-	except Exception:
-		_log_exception("get_available_time_slots")
-		return []
+	return results
 
 def get_table_options_for_slot(restaurant_id: str, date: Any, time_hhmm: str, party_size: int) -> Optional[Dict[str, Any]]:
 	try:
@@ -438,6 +496,10 @@ def search_time_range(restaurant_id: str, date: Any, start_time: str, end_time:
 		d = _parse_date(date)
 		results: List[Dict[str, Any]] = []
 		for s in in_range:
+			remaining = remaining_time()
+			if remaining is not None and remaining <= 0:
+				# Past the request deadline: return the slots checked so far
+				break
 			opts = get_table_options_for_slot(restaurant_id, d, s["time"], int(party_size))
 			if not opts:
 				continue
@@ -0,0 +1,1818 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the customer and staff agents.
+
+Runs the real LangGraph graphs and tools against a scripted fake LLM and an
+in-memory Supabase stand-in, so no API keys or network access are needed.
+
+Usage:
+  python benchmark_agents.py llm-calls      # LLM calls per request, finish_tool vs direct graph mode
+  python benchmark_agents.py tokens         # Input tokens per customer profile and per request
+  python benchmark_agents.py tool-output    # Full vs compact restaurant tool output size per tool
+  python benchmark_agents.py response-cache # LLM calls for repeated stateless requests, with/without the cache
+  python benchmark_agents.py coalescing     # Supabase round trips for concurrent identical reads, with/without coalescing
+  python benchmark_agents.py streaming      # Time to first event/token vs full response, blocking vs SSE streaming
+  python benchmark_agents.py async-load     # 50/200/500 concurrent chats: thread-per-request vs asyncio (ainvoke)
+  python benchmark_agents.py isolation      # Concurrent customer + staff requests never use another request's client/restaurant
+  python benchmark_agents.py client-pool    # Authenticated client setup time and TCP connections: create_client per request vs pool
+  python benchmark_agents.py jwt            # JWT verification cost per request, verify every time vs cached claims
+  python benchmark_agents.py profile        # Profile fetch per request: serial vs prefetched vs cached
+  python benchmark_agents.py speculative    # Availability question latency with/without speculative restaurant/slot prefetch
+  python benchmark_agents.py featured       # RESTAURANTS_TO_SHOW fallback: featured queries per answer vs precomputed catalog ranking
+  python benchmark_agents.py cards          # Follow-up requests after a discovery answer: IDs only vs include_cards
+  python benchmark_agents.py routing        # Model calls, latency and tokens per model: one model vs tiered routing
+  python benchmark_agents.py budget         # Runaway tool loop: unbounded vs per-request step budget vs deadline
+  python benchmark_agents.py prompt-cache   # Cached vs uncached input tokens per request, prefix caching off vs simulated
+  python benchmark_agents.py scheduler      # Staff vs customer latency in a burst: FIFO vs priority vs priority + shedding
+  python benchmark_agents.py service-board  # Staff tool calls during service: a query per call vs the live service board
+  python benchmark_agents.py temporal       # Local date/time resolution: each phrase's resolved value vs the expected one
+  python benchmark_agents.py intents        # Intent profile per message vs the expected one (restricted profiles only when safe)
+  python benchmark_agents.py tool-timeout   # Tool calls queued behind a busy pool: timeouts charged to the tool vs to the request
+  python benchmark_agents.py memory         # Conversation memory compaction: history starts with a user turn, no orphaned tool calls
+"""
+
+import argparse
+import asyncio
+import contextlib
+import copy
+import io
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from agent_metrics import estimate_tokens
+
+
+# -----------------------------
+# Fake LLM
+# -----------------------------
+
+class ScriptedFakeLLM:
+    """Deterministic stand-in for the Gemini chat model.
+
+    plan is a list of steps; each step is a list of (tool_name, args) calls the
+    model emits in one AIMessage. Once the plan is exhausted the model behaves
+    like Gemini following the prompt: after using tools it calls finishedUsingTools
+    if that tool is bound (and hasn't been called yet), otherwise it answers with
+    final_answer.
+    """
+
+    def __init__(self, plan: List[List[tuple]], final_answer: str, latency: float = 0.0, token_latency: float = 0.0):
+        self.plan = plan
+        self.final_answer = final_answer
+        self.latency = latency
+        self.token_latency = token_latency
+        self.bound_tool_names: List[str] = []
+        self.tool_schema_tokens = 0
+        # Shared by every bound copy so one instance can back several graphs
+        self.stats = {"calls": 0, "input_tokens": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def calls(self) -> int:
+        return self.stats["calls"]
+
+    @property
+    def input_tokens(self) -> int:
+        return self.stats["input_tokens"]
+
+    def bind_tools(self, tools: List[Any]) -> "ScriptedFakeLLM":
+        bound = copy.copy(self)
+        bound.bound_tool_names = [t.name for t in tools]
+        bound.tool_schema_tokens = tool_schema_tokens(tools)
+        return bound
+
+    def invoke(self, messages: List[Any]) -> AIMessage:
+        message = self._respond(messages)
+        # A blocking call returns only once the whole answer has been generated
+        time.sleep(self._generation_seconds(message))
+        return message
+
+    async def ainvoke(self, messages: List[Any]) -> AIMessage:
+        message = self._respond(messages)
+        await asyncio.sleep(self._generation_seconds(message))
+        return message
+
+    def _generation_seconds(self, message: AIMessage) -> float:
+        words = len(message.content.split(" ")) if message.content else 0
+        return self.latency + self.token_latency * words
+
+    def _respond(self, messages: List[Any]) -> AIMessage:
+        message = self._next_message(messages)
+        input_tokens = self.tool_schema_tokens + sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(message.content) + sum(estimate_tokens(json.dumps(c["args"])) for c in message.tool_calls)
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["input_tokens"] += input_tokens
+        # Reported like Gemini's usage metadata, for model_router's accounting
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        return message
+
+    def _next_message(self, messages: List[Any]) -> AIMessage:
+
+        # Only look at the current turn (after the last human message)
+        last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        turn = [m for m in messages[last_human + 1:] if isinstance(m, AIMessage)]
+        tool_steps = [m for m in turn if m.tool_calls and m.tool_calls[0]["name"] != "finishedUsingTools"]
+        finished = any(c["name"] == "finishedUsingTools" for m in turn for c in m.tool_calls)
+
+        if len(tool_steps) < len(self.plan):
+            step = self.plan[len(tool_steps)]
+            return AIMessage(content="", tool_calls=[
+                {"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:8]}"} for name, args in step
+            ])
+        if self.plan and "finishedUsingTools" in self.bound_tool_names and not finished:
+            return AIMessage(content="", tool_calls=[
+                {"name": "finishedUsingTools", "args": {}, "id": f"call_{uuid.uuid4().hex[:8]}"}
+            ])
+        return AIMessage(content=self.final_answer)
+
+    def stream(self, messages: List[Any]):
+        """Like invoke, but text answers arrive word by word (tool calls arrive whole)."""
+        message = self._respond(messages)
+        time.sleep(self.latency)
+        if message.tool_calls or not message.content:
+            yield message
+            return
+        words = message.content.split(" ")
+        for n, word in enumerate(words):
+            time.sleep(self.token_latency)
+            yield AIMessageChunk(content=word if n == len(words) - 1 else word + " ")
+
+    async def astream(self, messages: List[Any]):
+        message = self._respond(messages)
+        await asyncio.sleep(self.latency)
+        if message.tool_calls or not message.content:
+            yield message
+            return
+        words = message.content.split(" ")
+        for n, word in enumerate(words):
+            await asyncio.sleep(self.token_latency)
+            yield AIMessageChunk(content=word if n == len(words) - 1 else word + " ")
+
+
+def tool_schema_tokens(tools: List[Any]) -> int:
+    """Estimate the tokens spent on the function declarations of bound tools."""
+    return sum(estimate_tokens(json.dumps(convert_to_openai_tool(t))) for t in tools)
+
+
+# -----------------------------
+# Fake Supabase
+# -----------------------------
+
+class _FakeResult:
+    def __init__(self, data: Any):
+        self.data = data
+
+
+class _FakeQuery:
+    """Accepts any postgrest-style builder chain and returns canned rows on execute()."""
+
+    def __init__(self, client: "FakeSupabaseClient", name: str, is_rpc: bool = False, params: Optional[dict] = None):
+        self.client = client
+        self.name = name
+        self.is_rpc = is_rpc
+        self.params = params or {}
+        self.filters: List[tuple] = []
+        self._single = False
+
+    def __getattr__(self, method: str):
+        def chain(*args, **kwargs):
+            self.filters.append((method, args))
+            return self
+        return chain
+
+    def single(self):
+        self._single = True
+        return self
+
+    def execute(self) -> _FakeResult:
+        self.client.executed += 1
+        self.client.executed_by_table[self.name] = self.client.executed_by_table.get(self.name, 0) + 1
+        self.client.restaurant_filters.extend(args[1] for method, args in self.filters if method == "eq" and args[:1] == ("restaurant_id",))
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        if self.is_rpc:
+            return _FakeResult(self.client.rpc_results.get(self.name))
+        rows = list(self.client.tables.get(self.name, []))
+        if self.name == "bookings":
+            # The booking_tables(table_id) embed, joined like PostgREST would
+            links = self.client.tables.get("booking_tables", [])
+            rows = [{**r, "booking_tables": [{"table_id": l["table_id"]} for l in links if l["booking_id"] == r["id"]]} for r in rows]
+        for method, args in self.filters:
+            if method == "eq" and len(args) == 2:
+                rows = [r for r in rows if args[0] not in r or r[args[0]] == args[1]]
+            elif method == "gte" and args[:1] == ("updated_at",):
+                # Delta polls (service_board); other range filters are ignored
+                rows = [r for r in rows if str(r.get("updated_at", "")) >= str(args[1])]
+            elif method == "ilike" and len(args) == 2:
+                needle = str(args[1]).strip("%").lower()
+                rows = [r for r in rows if needle in str(r.get(args[0], "")).lower()]
+            elif method == "limit" and args:
+                rows = rows[:int(args[0])]
+        if self._single:
+            return _FakeResult(rows[0] if rows else None)
+        return _FakeResult(rows)
+
+
+class FakeSupabaseClient:
+    """In-memory Supabase stand-in with a small restaurant catalog."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.executed = 0
+        self.executed_by_table: Dict[str, int] = {}
+        self.restaurant_filters: List[str] = []
+        today = datetime.now().date()
+        self.tables: Dict[str, List[dict]] = {
+            "restaurants": [
+                {"id": "r-emsherif", "name": "Em Sherif", "description": "Refined Lebanese cuisine with a set menu", "address": "Ashrafieh, Beirut",
+                 "tags": ["parking"], "opening_time": "12:00", "closing_time": "23:59", "cuisine_type": "Lebanese", "price_range": 4,
+                 "average_rating": 4.8, "dietary_options": ["vegetarian"], "ambiance_tags": ["elegant"], "outdoor_seating": False,
+                 "ai_featured": True, "booking_window_days": 30},
+                {"id": "r-leonardo", "name": "Leonardo", "description": "Wood-fired pizza and handmade pasta", "address": "Mar Mikhael, Beirut",
+                 "tags": ["outdoor"], "opening_time": "12:00", "closing_time": "23:00", "cuisine_type": "Italian", "price_range": 2,
+                 "average_rating": 4.5, "dietary_options": ["vegetarian"], "ambiance_tags": ["casual"], "outdoor_seating": True,
+                 "ai_featured": True, "booking_window_days": 30},
+                {"id": "r-sushico", "name": "Sushi Co", "description": "Omakase counter and classic rolls", "address": "Downtown, Beirut",
+                 "tags": [], "opening_time": "18:00", "closing_time": "23:30", "cuisine_type": "Japanese", "price_range": 3,
+                 "average_rating": 4.4, "dietary_options": [], "ambiance_tags": ["modern"], "outdoor_seating": False,
+                 "ai_featured": False, "booking_window_days": 30},
+            ],
+            "restaurant_hours": [
+                {"restaurant_id": rid, "day_of_week": day, "is_open": True, "open_time": "18:00", "close_time": "23:00"}
+                for rid in ("r-emsherif", "r-leonardo", "r-sushico")
+                for day in ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+            ],
+            "restaurant_special_hours": [],
+            "restaurant_closures": [],
+            "restaurant_tables": [
+                {"id": f"t-{n}", "restaurant_id": "r-emsherif", "table_number": str(n), "table_type": "standard", "capacity": cap,
+                 "min_capacity": 1, "max_capacity": cap, "features": [], "is_active": True, "is_combinable": True,
+                 "priority_score": 0, "x_position": 0, "y_position": 0}
+                for n, cap in ((1, 2), (2, 4), (3, 4), (4, 6))
+            ],
+            "bookings": [
+                {"id": "b-1", "user_id": None, "booking_time": f"{today}T19:00:00", "party_size": 4, "status": "confirmed",
+                 "special_requests": None, "occasion": None, "dietary_notes": None, "guest_name": "Rami Haddad", "guest_email": None,
+                 "guest_phone": None, "confirmation_code": "ABC123", "checked_in_at": None, "seated_at": None, "profiles": None,
+                 "created_at": f"{today}T10:00:00"},
+            ],
+            "booking_tables": [{"booking_id": "b-1", "table_id": "t-2"}],
+            "waitlist": [],
+            "profiles": [],
+        }
+        self.rpc_results: Dict[str, Any] = {
+            "get_turn_time": 90,
+            "quick_availability_check": True,
+            "get_available_tables": [{"table_id": "t-2", "table_number": "2", "capacity": 4, "table_type": "standard"}],
+            "check_booking_overlap": None,
+            "suggest_optimal_tables": [{"table_ids": ["t-2"], "total_capacity": 4, "requires_combination": False}],
+        }
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def from_(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _FakeQuery:
+        return _FakeQuery(self, name, is_rpc=True, params=params)
+
+
+def install_fake_backends(fake_db: Any):
+    """Point every module-level Supabase client at the fake."""
+    import AI_Agent
+    import AI_Agent_Restaurant
+    import availability_tools
+
+    AI_Agent.supabase = fake_db
+    AI_Agent_Restaurant.supabase = fake_db
+    availability_tools._SUPABASE = fake_db
+
+
+# -----------------------------
+# Scenarios
+# -----------------------------
+
+def _tomorrow() -> str:
+    return (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+CUSTOMER_SCENARIOS = [
+    ("greeting", "hello!", [], "Hi! I'm DineMate. What are you in the mood for?"),
+    ("discovery", "best italian places", [[("getRestaurantsByCuisineType", {"cuisineType": "italian"})]],
+     "Leonardo is a great pick.\nRESTAURANTS_TO_SHOW: r-leonardo"),
+    ("availability", "is Em Sherif free tomorrow for 4", [
+        [("convertRelativeDate", {"relative_date": "tomorrow"})],
+        [("getRestaurantsByName", {"query": "Em Sherif"})],
+        [("checkAnyTimeSlots", {"restaurant_id": "r-emsherif", "date": _tomorrow(), "party_size": 4})],
+    ], "Yes, Em Sherif has tables for 4 tomorrow evening."),
+]
+
+STAFF_SCENARIOS = [
+    ("todays_bookings", "how many bookings today?", [[("getTodaysBookings", {"restaurant_id": "r-emsherif"})]],
+     "You have 1 booking today: Rami Haddad, party of 4 at 19:00."),
+    ("table_recommendation", "best table for 4 at 19:00", [[
+        ("getOptimalTableRecommendations", {"restaurant_id": "r-emsherif", "party_size": 4, "booking_time": "19:00"}),
+        ("getAvailableTables", {"restaurant_id": "r-emsherif"}),
+    ]], "Table 2 (4 seats) is the best fit."),
+]
+
+
+def _run_quietly(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+@contextlib.contextmanager
+def shortcuts_disabled():
+    """Send every customer message through the graph (the fast path and the response cache would answer some without an LLM call)."""
+    import AI_Agent
+
+    original_route = AI_Agent.fast_path_router.route
+    original_cache_enabled = AI_Agent.response_cache.enabled
+    AI_Agent.fast_path_router.route = lambda *args, **kwargs: None
+    AI_Agent.response_cache.enabled = False
+    try:
+        yield
+    finally:
+        AI_Agent.fast_path_router.route = original_route
+        AI_Agent.response_cache.enabled = original_cache_enabled
+
+
+@contextlib.contextmanager
+def unbounded_llm_calls():
+    """Lift the model-call scheduler's concurrency cap (for benchmarks of the serving model rather than the Gemini quota)."""
+    import agent_graph
+    from llm_scheduler import LLMScheduler
+
+    original = agent_graph.llm_scheduler
+    agent_graph.llm_scheduler = LLMScheduler(max_concurrent=0)
+    try:
+        yield
+    finally:
+        agent_graph.llm_scheduler = original
+
+
+@contextlib.contextmanager
+def patched_customer_agent(fake_llm: ScriptedFakeLLM, direct_finish: bool = True, profiles: bool = True):
+    """Swap the customer agent graphs for ones backed by fake_llm.
+    With profiles=False every intent runs the full prompt and tool set."""
+    import AI_Agent
+
+    original = AI_Agent.agent_apps
+    full = _run_quietly(AI_Agent.create_agent_app, fake_llm, direct_finish=direct_finish)
+    AI_Agent.agent_apps = {
+        name: full if (name == "full" or not profiles) else _run_quietly(AI_Agent.create_agent_app, fake_llm, direct_finish=direct_finish, profile=name)
+        for name in AI_Agent.AGENT_PROFILES
+    }
+    try:
+        yield
+    finally:
+        AI_Agent.agent_apps = original
+
+
+def benchmark_llm_calls(latency: float = 0.0) -> List[dict]:
+    """Count LLM calls per request for each scenario in both graph modes.
+
+    In finish_tool mode the scripted model behaves like Gemini following the old
+    prompt: after its data tools it emits a bare finishedUsingTools call.
+    """
+    import AI_Agent
+    import AI_Agent_Restaurant
+
+    fake_db = FakeSupabaseClient()
+    install_fake_backends(fake_db)
+    rows = []
+    for agent, scenarios in (("customer", CUSTOMER_SCENARIOS), ("staff", STAFF_SCENARIOS)):
+        for name, message, plan, answer in scenarios:
+            row = {"agent": agent, "scenario": name}
+            for mode, direct in (("finish_tool", False), ("direct", True)):
+                fake_llm = ScriptedFakeLLM(plan, answer, latency=latency)
+                start = time.perf_counter()
+                if agent == "customer":
+                    with shortcuts_disabled(), patched_customer_agent(fake_llm, direct_finish=direct, profiles=False):
+                        response = _run_quietly(AI_Agent.chat_with_bot, message, authenticated_client=fake_db)
+                else:
+                    app = _run_quietly(AI_Agent_Restaurant.create_staff_app, fake_llm, direct_finish=direct)
+                    original_app, AI_Agent_Restaurant.staff_app = AI_Agent_Restaurant.staff_app, app
+                    try:
+                        response = _run_quietly(AI_Agent_Restaurant.chat_with_staff_bot, message, "r-emsherif", authenticated_client=fake_db)
+                    finally:
+                        AI_Agent_Restaurant.staff_app = original_app
+                row[f"{mode}_llm_calls"] = fake_llm.calls
+                # False when the reply was rebuilt from tool output because the model's last message had no text
+                row[f"{mode}_model_answer"] = response.startswith(answer.split("\n")[0])
+                row[f"{mode}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            rows.append(row)
+    return rows
+
+
+def benchmark_tokens() -> List[dict]:
+    """Input tokens per customer profile (static prefix) and per request (all LLM calls)."""
+    import AI_Agent
+    from agent_graph import prompt_for_mode
+
+    rows = []
+    full_profile = AI_Agent.AGENT_PROFILES["full"]
+    full_prefix = estimate_tokens(prompt_for_mode(full_profile.prompt)) + tool_schema_tokens(AI_Agent.tools_for_profile(full_profile))
+    for name, profile in AI_Agent.AGENT_PROFILES.items():
+        prompt_tokens = estimate_tokens(prompt_for_mode(profile.prompt))
+        bound_tools = AI_Agent.tools_for_profile(profile)
+        schema_tokens = tool_schema_tokens(bound_tools)
+        rows.append({
+            "kind": "profile",
+            "name": name,
+            "tools": len(bound_tools),
+            "prompt_tokens": prompt_tokens,
+            "tool_schema_tokens": schema_tokens,
+            "prefix_tokens": prompt_tokens + schema_tokens,
+            "vs_full": f"{(prompt_tokens + schema_tokens) / full_prefix:.0%}",
+        })
+
+    fake_db = FakeSupabaseClient()
+    install_fake_backends(fake_db)
+    with shortcuts_disabled():
+        for name, message, plan, answer in CUSTOMER_SCENARIOS:
+            row = {"kind": "request", "name": name}
+            for label, profiles in (("full", False), ("profiled", True)):
+                fake_llm = ScriptedFakeLLM(plan, answer)
+                with patched_customer_agent(fake_llm, profiles=profiles):
+                    _run_quietly(AI_Agent.chat_with_bot, message, authenticated_client=fake_db)
+                row[f"{label}_input_tokens"] = fake_llm.input_tokens
+            row["vs_full"] = f"{row['profiled_input_tokens'] / row['full_input_tokens']:.0%}"
+            rows.append(row)
+    return rows
+
+
+def benchmark_response_cache(latency: float = 0.2, concurrency: int = 8) -> List[dict]:
+    """LLM calls for bursts of identical stateless discovery requests, with and without the response cache."""
+    import AI_Agent
+    from concurrent.futures import ThreadPoolExecutor
+
+    _, message, plan, answer = CUSTOMER_SCENARIOS[1]
+    fake_db = FakeSupabaseClient()
+    install_fake_backends(fake_db)
+    rows = []
+    for label, enabled in (("no_cache", False), ("cache", True)):
+        AI_Agent.response_cache.clear()
+        original_enabled = AI_Agent.response_cache.enabled
+        AI_Agent.response_cache.enabled = enabled
+        fake_llm = ScriptedFakeLLM(plan, answer, latency=latency)
+        start = time.perf_counter()
+        try:
+            with patched_customer_agent(fake_llm), contextlib.redirect_stdout(io.StringIO()):
+                # A concurrent burst (coalesced into one run) followed by the same number of repeats (cache hits)
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    list(pool.map(lambda _: AI_Agent.chat_with_bot(message, authenticated_client=fake_db), range(concurrency)))
+                for _ in range(concurrency):
+                    AI_Agent.chat_with_bot(message, authenticated_client=fake_db)
+        finally:
+            AI_Agent.response_cache.enabled = original_enabled
+        rows.append({"mode": label, "requests": 2 * concurrency, "llm_calls": fake_llm.calls,
+                     "ms": round((time.perf_counter() - start) * 1000, 1)})
+    rows[-1].update({k: v for k, v in AI_Agent.response_cache.snapshot().items() if k in ("hits", "coalesced", "saved_llm_calls")})
+
+    # An availability question the keyword classifier files under "full": its live answer must not be stored
+    availability_message = "can I get a table at Em Sherif on the 20th?"
+    intent = AI_Agent.classify_intent(availability_message)
+    plan = [[("getRestaurantsByName", {"query": "Em Sherif"})],
+            [("checkAnyTimeSlots", {"restaurant_id": "r-emsherif", "date": _tomorrow(), "party_size": 2})]]
+    fake_llm = ScriptedFakeLLM(plan, "Em Sherif has tables from 19:00.")
+    AI_Agent.response_cache.clear()
+    stores_before = AI_Agent.response_cache.snapshot()["stores"]
+    with shortcuts_disabled(), patched_customer_agent(fake_llm):
+        AI_Agent.response_cache.enabled = True
+        for _ in range(2):
+            _run_quietly(AI_Agent.chat_with_bot, availability_message, authenticated_client=fake_db)
+    rows.append({"mode": f"availability_as_{intent.intent}", "requests": 2, "llm_calls": fake_llm.calls,
+                 "stores": AI_Agent.response_cache.snapshot()["stores"] - stores_before})
+
+    # Fallback answers must not be stored either: a run stopped by its budget, and one whose tool failed
+    import request_context
+    original_budget = request_context.RequestBudget
+    fallbacks = {
+        "budget_stopped": ([[("getRestaurantsByCuisineType", {"cuisineType": "italian"})]] * 10,
+                           {"max_llm_calls": 2, "max_tool_calls": 0, "deadline_seconds": 0}),
+        "tool_failed": ([[("getRestaurantsByNam", {"query": "italian"})]], None),
+    }
+    for label, (fallback_plan, limits) in fallbacks.items():
+        fake_llm = ScriptedFakeLLM(fallback_plan, answer)
+        AI_Agent.response_cache.clear()
+        stores_before = AI_Agent.response_cache.snapshot()["stores"]
+        try:
+            if limits:
+                request_context.RequestBudget = lambda: original_budget(**limits)
+            with shortcuts_disabled(), patched_customer_agent(fake_llm):
+                AI_Agent.response_cache.enabled = True
+                for _ in range(2):
+                    _run_quietly(AI_Agent.chat_with_bot, message, authenticated_client=fake_db)
+        finally:
+            request_context.RequestBudget = original_budget
+        rows.append({"mode": label, "requests": 2, "llm_calls": fake_llm.calls,
+                     "stores": AI_Agent.response_cache.snapshot()["stores"] - stores_before})
+
+    # Two users whose profiles differ only in name and loyalty points must not share an entry
+    alice = {"full_name": "Alice", "loyalty_points": 120, "allergies": ["nuts"], "favorite_cuisines": ["Italian"]}
+    bob = {**alice, "full_name": "Bob", "loyalty_points": 0}
+    now = datetime.now()
+    rows.append({"mode": "profile_keys", "requests": 2,
+                 "distinct_keys": AI_Agent.response_cache.key_for(message, alice, "discovery", now) != AI_Agent.response_cache.key_for(message, bob, "discovery", now)})
+    return rows
+
+
+def benchmark_coalescing(latency: float = 0.05, concurrency: int = 16) -> List[dict]:
+    """Supabase round trips for concurrent identical tool calls, with and without query coalescing.
+
+    Only calls that still reach PostgREST belong here; getFeaturedRestaurants is served from the catalog and makes none.
+    """
+    import AI_Agent
+    import availability_tools
+    from concurrent.futures import ThreadPoolExecutor
+    from supabase_coalescing import coalescing, coalescing_stats
+
+    calls = [
+        ("by_cuisine", lambda: AI_Agent.getRestaurantsByCuisineType.invoke({"cuisineType": "Italian"})),
+        ("time_slots", lambda: availability_tools.get_available_time_slots("r-emsherif", _tomorrow(), 4)),
+    ]
+    rows = []
+    for name, call in calls:
+        row = {"call": name, "concurrent_requests": concurrency}
+        for label, wrap in (("plain", False), ("coalesced", True)):
+            fake_db = FakeSupabaseClient(latency=latency)
+            install_fake_backends(coalescing(fake_db) if wrap else fake_db)
+            coalescing_stats.reset()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(lambda _: call(), range(concurrency)))
+            row[f"{label}_queries"] = fake_db.executed
+            row[f"{label}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        row["coalesced"] = coalescing_stats.snapshot()["coalesced"]
+        rows.append(row)
+    rows.append(_coalescing_token_check(concurrency))
+    return rows
+
+
+def _coalescing_token_check(concurrency: int) -> dict:
+    """The same query under two users' tokens at once, through real Supabase clients: each caller must get
+    the result its own token returned (the coalescing key includes the Authorization header postgrest.auth() sets)."""
+    from concurrent.futures import ThreadPoolExecutor
+    from supabase import create_client
+    from supabase_coalescing import coalescing
+
+    server = _CountingPostgrestServer(echo_auth=True, delay=0.1)
+    tokens = ["token-alice", "token-bob"]
+    clients = []
+    for token in tokens:
+        client = create_client(server.url, "anon-key")
+        client.postgrest.auth(token)
+        clients.append(coalescing(client))
+
+    def query(n: int):
+        return n % 2, clients[n % 2].table("bookings").select("*").eq("status", "confirmed").execute().data
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(query, range(concurrency)))
+    finally:
+        server.close()
+    foreign = sum(1 for n, data in results if data[0]["authorization"] != f"Bearer {tokens[n]}")
+    return {"call": "two_tokens_same_query", "concurrent_requests": concurrency, "coalesced_queries": server.requests,
+            "foreign_results": foreign, "isolated": foreign == 0}
+
+
+def benchmark_streaming(latency: float = 0.3, token_latency: float = 0.02) -> List[dict]:
+    """Time to the first event, first token and full answer for blocking vs streaming customer requests."""
+    import AI_Agent
+
+    fake_db = FakeSupabaseClient()
+    install_fake_backends(fake_db)
+    rows = []
+    with shortcuts_disabled():
+        for name, message, plan, answer in CUSTOMER_SCENARIOS:
+            row = {"name": name}
+            fake_llm = ScriptedFakeLLM(plan, answer, latency=latency, token_latency=token_latency)
+            with patched_customer_agent(fake_llm):
+                start = time.perf_counter()
+                _run_quietly(AI_Agent.chat_with_bot, message, authenticated_client=fake_db)
+                row["blocking_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+                start = time.perf_counter()
+                first_event = first_token = None
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for event in AI_Agent.stream_chat_with_bot(message, authenticated_client=fake_db):
+                        elapsed = round((time.perf_counter() - start) * 1000, 1)
+                        if first_event is None and event["event"] == "progress":
+                            first_event = elapsed
+                        if first_token is None and event["event"] == "token":
+                            first_token = elapsed
+                row.update({"first_progress_ms": first_event, "first_token_ms": first_token,
+                            "stream_done_ms": round((time.perf_counter() - start) * 1000, 1)})
+            rows.append(row)
+    return rows
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class _ThreadSampler:
+    """Records the peak number of live threads while active."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def benchmark_async_load(latency: float = 0.5, db_latency: float = 0.01, threads: int = 32,
+                         levels: tuple = (50, 200, 500)) -> List[dict]:
+    """Wall time and per-request latency for N concurrent customer chats.
+
+    "threads" is the Flask model: chat_with_bot on a pool of `threads` request
+    threads (a gunicorn worker's thread cap). "async" is the ASGI model:
+    achat_with_bot coroutines on one event loop, model calls awaited.
+    """
+    import AI_Agent
+    from concurrent.futures import ThreadPoolExecutor
+
+    _, message, plan, answer = CUSTOMER_SCENARIOS[1]
+    fake_db = FakeSupabaseClient(latency=db_latency)
+    install_fake_backends(fake_db)
+    rows = []
+
+    # Every request arrives at `start`; latency includes time spent queued for a request thread
+    def timed_sync(start: float) -> float:
+        AI_Agent.chat_with_bot(message, authenticated_client=fake_db)
+        return time.perf_counter() - start
+
+    async def timed_async(start: float) -> float:
+        await AI_Agent.achat_with_bot(message, authenticated_client=fake_db)
+        return time.perf_counter() - start
+
+    async def run_async(concurrency: int, start: float) -> List[float]:
+        return await asyncio.gather(*(timed_async(start) for _ in range(concurrency)))
+
+    with shortcuts_disabled(), unbounded_llm_calls():
+        for concurrency in levels:
+            for mode in ("threads", "async"):
+                fake_llm = ScriptedFakeLLM(plan, answer, latency=latency)
+                with patched_customer_agent(fake_llm), contextlib.redirect_stdout(io.StringIO()), _ThreadSampler() as sampler:
+                    start = time.perf_counter()
+                    if mode == "threads":
+                        with ThreadPoolExecutor(max_workers=threads) as pool:
+                            durations = list(pool.map(timed_sync, [start] * concurrency))
+                    else:
+                        durations = asyncio.run(run_async(concurrency, start))
+                    wall = time.perf_counter() - start
+                rows.append({
+                    "concurrency": concurrency,
+                    "mode": f"threads({threads})" if mode == "threads" else "async",
+                    "wall_s": round(wall, 2),
+                    "req_per_s": round(concurrency / wall, 1),
+                    "p50_ms": round(_percentile(durations, 0.5) * 1000),
+                    "p95_ms": round(_percentile(durations, 0.95) * 1000),
+                    "peak_threads": sampler.peak,
+                    "llm_calls": fake_llm.calls,
+                })
+    return rows
+
+
+def benchmark_isolation(requests: int = 48, latency: float = 0.02) -> List[dict]:
+    """Run concurrent customer and staff requests, each with its own client (and restaurant for staff),
+    and check no query ran on another request's client or for another request's restaurant."""
+    import AI_Agent
+    import AI_Agent_Restaurant
+    from concurrent.futures import ThreadPoolExecutor
+
+    _, customer_message, customer_plan, customer_answer = CUSTOMER_SCENARIOS[1]
+    _, staff_message, staff_plan, staff_answer = STAFF_SCENARIOS[0]
+    shared_db = FakeSupabaseClient()
+    install_fake_backends(shared_db)
+    # The restaurant catalog is process-wide public data on the shared client; load it up front
+    _run_quietly(AI_Agent.restaurant_catalog.rows)
+    rows = []
+    with shortcuts_disabled(), patched_customer_agent(ScriptedFakeLLM(customer_plan, customer_answer, latency=latency)):
+        original_staff_app = AI_Agent_Restaurant.staff_app
+        # The scripted staff model always names r-emsherif; each request's own restaurant must win
+        AI_Agent_Restaurant.staff_app = _run_quietly(AI_Agent_Restaurant.create_staff_app, ScriptedFakeLLM(staff_plan, staff_answer, latency=latency))
+        try:
+            for mode in ("threads", "async"):
+                clients = [FakeSupabaseClient() for _ in range(requests)]
+                shared_before = shared_db.executed
+
+                def call(n: int):
+                    if n % 2:
+                        return AI_Agent_Restaurant.chat_with_staff_bot(staff_message, f"r-staff-{n}", authenticated_client=clients[n])
+                    return AI_Agent.chat_with_bot(customer_message, authenticated_client=clients[n])
+
+                async def acall(n: int):
+                    if n % 2:
+                        return await AI_Agent_Restaurant.achat_with_staff_bot(staff_message, f"r-staff-{n}", authenticated_client=clients[n])
+                    return await AI_Agent.achat_with_bot(customer_message, authenticated_client=clients[n])
+
+                async def run_async():
+                    return await asyncio.gather(*(acall(n) for n in range(requests)))
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if mode == "threads":
+                        with ThreadPoolExecutor(max_workers=16) as pool:
+                            list(pool.map(call, range(requests)))
+                    else:
+                        asyncio.run(run_async())
+
+                foreign_restaurants = sum(
+                    1 for n, client in enumerate(clients) if n % 2
+                    for rid in client.restaurant_filters if rid != f"r-staff-{n}"
+                )
+                rows.append({
+                    "mode": mode,
+                    "requests": requests,
+                    "requests_without_own_client_queries": sum(1 for client in clients if client.executed == 0),
+                    "shared_client_queries": shared_db.executed - shared_before,
+                    "foreign_restaurant_queries": foreign_restaurants,
+                    "isolated": all(client.executed for client in clients) and shared_db.executed == shared_before and not foreign_restaurants,
+                })
+        finally:
+            AI_Agent_Restaurant.staff_app = original_staff_app
+    return rows
+
+
+class _CountingPostgrestServer:
+    """Local HTTP/1.1 keep-alive server answering every PostgREST call with [] (or `body`) and counting TCP connections and requests.
+
+    With echo_auth the body is [{"authorization": <the request's Authorization header>}]; delay holds each reply that long.
+    """
+
+    def __init__(self, body: bytes = b"[]", echo_auth: bool = False, delay: float = 0.0):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                with server.lock:
+                    server.requests += 1
+                if delay:
+                    time.sleep(delay)
+                reply = json.dumps([{"authorization": self.headers.get("Authorization")}]).encode() if echo_auth else body
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            do_GET = do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def benchmark_client_pool(requests: int = 200, users: int = 20) -> List[dict]:
+    """Per-request authenticated client setup and TCP connections, create_client() vs SupabaseClientPool.
+
+    Each request builds (or looks up) the client for one of `users` JWTs and runs one query
+    against a local PostgREST stand-in.
+    """
+    import jwt
+    from supabase import create_client
+    from supabase_pool import SupabaseClientPool
+
+    tokens = [jwt.encode({"sub": f"user-{n}", "exp": int(time.time()) + 3600}, "benchmark-secret-benchmark-secret") for n in range(users)]
+    rows = []
+    for mode in ("create_client", "pool"):
+        server = _CountingPostgrestServer()
+        pool = SupabaseClientPool(server.url, "anon-key") if mode == "pool" else None
+        setup_seconds = 0.0
+        start = time.perf_counter()
+        for n in range(requests):
+            token = tokens[n % users]
+            setup_start = time.perf_counter()
+            if pool:
+                client = pool.client_for(token)
+            else:
+                client = create_client(server.url, "anon-key")
+                client.postgrest.auth(token)
+            setup_seconds += time.perf_counter() - setup_start
+            client.table("restaurants").select("id").limit(1).execute()
+        wall = time.perf_counter() - start
+        rows.append({
+            "mode": mode,
+            "requests": requests,
+            "distinct_tokens": users,
+            "avg_setup_ms": round(setup_seconds / requests * 1000, 3),
+            "tcp_connections": server.connections,
+            "total_ms": round(wall * 1000, 1),
+        })
+        if pool:
+            pool.close()
+        server.close()
+    rows.append(_client_pool_token_check())
+    return rows
+
+
+def _client_pool_token_check(concurrency: int = 8) -> dict:
+    """Two users' views queried concurrently through one pool: every request must carry its own
+    token's Authorization header even though the views share the pool's connections."""
+    from concurrent.futures import ThreadPoolExecutor
+    from supabase_pool import SupabaseClientPool
+
+    server = _CountingPostgrestServer(echo_auth=True, delay=0.1)
+    pool = SupabaseClientPool(server.url, "anon-key")
+    tokens = ["token-alice", "token-bob"]
+
+    def query(n: int):
+        return n % 2, pool.client_for(tokens[n % 2]).table("bookings").select("*").execute().data
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(query, range(concurrency * 4)))
+    finally:
+        pool.close()
+        server.close()
+    foreign = sum(1 for n, data in results if data[0]["authorization"] != f"Bearer {tokens[n]}")
+    return {"mode": "pool_two_tokens_concurrent", "requests": len(results), "distinct_tokens": len(tokens),
+            "tcp_connections": server.connections, "foreign_headers": foreign, "isolated": foreign == 0}
+
+
+def benchmark_jwt(requests: int = 2000, users: int = 20) -> List[dict]:
+    """JWT verification cost per request: verify every time vs claims cached until exp.
+
+    HS256 tokens use the project secret; RS256 tokens are checked against a JWKS served
+    locally (jwks_fetches counts how often it was downloaded). Also checks that expired,
+    tampered and wrong-audience tokens are rejected.
+    """
+    import jwt
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from jwt_auth import InvalidToken, TokenVerifier
+
+    secret = "benchmark-secret-benchmark-secret"
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    public_jwk.update({"kid": "bench-key", "alg": "RS256", "use": "sig"})
+    jwks_server = _CountingPostgrestServer(body=json.dumps({"keys": [public_jwk]}).encode())
+    jwks_url = f"{jwks_server.url}/auth/v1/.well-known/jwks.json"
+
+    def claims(n: int, **overrides) -> dict:
+        return {"sub": f"user-{n}", "email": f"user{n}@example.com", "aud": "authenticated",
+                "role": "authenticated", "exp": int(time.time()) + 3600, **overrides}
+
+    signers = {
+        "HS256": lambda c: jwt.encode(c, secret, algorithm="HS256"),
+        "RS256": lambda c: jwt.encode(c, private_key, algorithm="RS256", headers={"kid": "bench-key"}),
+    }
+    rows = []
+    for algorithm, sign in signers.items():
+        tokens = [sign(claims(n)) for n in range(users)]
+        valid = sign(claims(0))
+        bad_tokens = {
+            "expired": sign(claims(0, exp=int(time.time()) - 60)),
+            "tampered": valid[:-4] + ("AAAA" if not valid.endswith("AAAA") else "BBBB"),
+            "wrong_audience": sign(claims(0, aud="someone-else")),
+        }
+        for cached in (False, True):
+            verifier = TokenVerifier(secret=secret, jwks_url=jwks_url, verify=True,
+                                     max_tokens=users if cached else 0)
+            fetches_before = jwks_server.requests
+            start = time.perf_counter()
+            for n in range(requests):
+                verifier.claims(tokens[n % users])
+            wall = time.perf_counter() - start
+            rejected = []
+            for name, token in bad_tokens.items():
+                try:
+                    verifier.claims(token)
+                except InvalidToken:
+                    rejected.append(name)
+            stats = verifier.snapshot()
+            rows.append({
+                "algorithm": algorithm,
+                "mode": "cached" if cached else "verify_every_time",
+                "requests": requests,
+                "avg_us": round(wall / requests * 1e6, 1),
+                "signature_checks": stats["verified"],
+                "cache_hits": stats["hits"],
+                "jwks_fetches": jwks_server.requests - fetches_before,
+                "rejects_bad_tokens": len(rejected) == len(bad_tokens),
+            })
+    jwks_server.close()
+    return rows
+
+
+def benchmark_profile(requests: int = 20, db_latency: float = 0.03, restore_latency: float = 0.03) -> List[dict]:
+    """Pre-LLM profile cost for repeated requests from one user.
+
+    Each request restores its conversation (restore_latency, like a session store read)
+    and then chats; the profile query costs db_latency. "serial" fetches the profile
+    after the restore with no cache; "prefetch" starts it before the restore but the
+    profile changes before every request (invalidated, so each request still queries);
+    "cached" serves repeats from the profile cache. Also checks that invalidate()
+    forces a fresh read.
+    """
+    import AI_Agent
+    from profile_cache import ProfileCache
+
+    user_id = "u-profile"
+    fake_db = FakeSupabaseClient(latency=db_latency)
+    fake_db.tables["profiles"] = [{"id": user_id, "full_name": "Maya Khoury", "allergies": ["peanuts"], "favorite_cuisines": ["Italian"],
+                                   "dietary_restrictions": [], "preferred_party_size": 2, "loyalty_points": 120}]
+    install_fake_backends(fake_db)
+    plan, answer = CUSTOMER_SCENARIOS[1][2], CUSTOMER_SCENARIOS[1][3]
+    rows = []
+    original_cache = AI_Agent.profile_cache
+    for mode in ("serial", "prefetch", "cached"):
+        AI_Agent.profile_cache = ProfileCache(ttl=0 if mode == "serial" else 60)
+        fake_db.executed_by_table.clear()
+        fake_llm = ScriptedFakeLLM(plan, answer)
+        latencies = []
+        with shortcuts_disabled(), patched_customer_agent(fake_llm):
+            for _ in range(requests):
+                if mode == "prefetch":
+                    AI_Agent.profile_cache.invalidate(user_id)
+                start = time.perf_counter()
+                if mode != "serial":
+                    AI_Agent.prefetch_user_profile(user_id, fake_db)
+                time.sleep(restore_latency)
+                _run_quietly(AI_Agent.chat_with_bot, "best italian places", user_id=user_id, authenticated_client=fake_db)
+                latencies.append(time.perf_counter() - start)
+            row = {
+                "mode": mode,
+                "requests": requests,
+                "profile_queries": fake_db.executed_by_table.get("profiles", 0),
+                "avg_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+            }
+            if mode == "cached":
+                AI_Agent.profile_cache.invalidate(user_id)
+                _run_quietly(AI_Agent.chat_with_bot, "best italian places", user_id=user_id, authenticated_client=fake_db)
+                row["refetched_after_invalidate"] = fake_db.executed_by_table.get("profiles", 0) == row["profile_queries"] + 1
+        rows.append(row)
+    AI_Agent.profile_cache = original_cache
+    return rows
+
+
+def benchmark_speculative(latency: float = 0.3, db_latency: float = 0.03, requests: int = 5) -> List[dict]:
+    """Availability question latency with and without speculative prefetch.
+
+    The scripted model looks the restaurant up, then asks for time slots; with
+    prefetch on, both lookups start while the first model call is running. The last
+    rows check no prefetch starts for a fast-path answer or a response cache hit.
+    """
+    import AI_Agent
+
+    message = "is Em Sherif free tomorrow for 4"
+    plan = [
+        [("getRestaurantsByName", {"query": "Em Sherif"})],
+        [("getAvailableTimeSlots", {"restaurant_id": "r-emsherif", "date": _tomorrow(), "party_size": 4})],
+    ]
+    answer = "Yes, Em Sherif has tables for 4 tomorrow evening."
+    fake_db = FakeSupabaseClient(latency=db_latency)
+    install_fake_backends(fake_db)
+    _run_quietly(AI_Agent.restaurant_catalog.rows)
+    rows = []
+    for enabled in (False, True):
+        AI_Agent.speculative_prefetcher.enabled = enabled
+        fake_llm = ScriptedFakeLLM(plan, answer, latency=latency)
+        before = AI_Agent.speculation_stats.snapshot()
+        executed_before = fake_db.executed
+        timings = []
+        with shortcuts_disabled(), patched_customer_agent(fake_llm):
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = _run_quietly(AI_Agent.chat_with_bot, message, authenticated_client=fake_db)
+                timings.append(time.perf_counter() - start)
+        after = AI_Agent.speculation_stats.snapshot()
+        rows.append({
+            "mode": "speculative" if enabled else "serial",
+            "requests": requests,
+            "avg_ms": round(sum(timings) / len(timings) * 1000, 1),
+            "db_queries_per_request": round((fake_db.executed - executed_before) / requests, 1),
+            "speculative_lookups": after["lookups"] - before["lookups"],
+            "used_by_tools": after["used"] - before["used"],
+            "model_answer": response == answer,
+        })
+    AI_Agent.speculative_prefetcher.enabled = True
+    rows.extend(_prefetch_without_model_call(fake_db))
+    return rows
+
+
+def _prefetch_without_model_call(fake_db: "FakeSupabaseClient") -> List[dict]:
+    """Prefetches started for answers that need no model call: the fast path and a response cache hit."""
+    import AI_Agent
+
+    starts = []
+    original_start = AI_Agent.speculative_prefetcher.start
+    AI_Agent.speculative_prefetcher.start = lambda *args, **kwargs: starts.append(args[0]) or original_start(*args, **kwargs)
+    rows = []
+    try:
+        fast_message = "is Em Sherif available tomorrow for 2"
+        fake_llm = ScriptedFakeLLM([], "unused")
+        with patched_customer_agent(fake_llm):
+            _run_quietly(AI_Agent.chat_with_bot, fast_message, authenticated_client=fake_db)
+        rows.append({"mode": "fast_path", "requests": 1, "llm_calls": fake_llm.calls, "prefetch_starts": starts.count(fast_message)})
+
+        cached_message = "tell me about Em Sherif"
+        fake_llm = ScriptedFakeLLM([[("getRestaurantsByName", {"query": "Em Sherif"})]], "Em Sherif serves refined Lebanese food.")
+        AI_Agent.response_cache.invalidate_catalog()
+        with patched_customer_agent(fake_llm):
+            for _ in range(2):
+                _run_quietly(AI_Agent.chat_with_bot, cached_message, authenticated_client=fake_db)
+        rows.append({"mode": "cache_hit", "requests": 2, "llm_calls": fake_llm.calls, "prefetch_starts": starts.count(cached_message)})
+    finally:
+        AI_Agent.speculative_prefetcher.start = original_start
+    return rows
+
+
+def benchmark_routing(flash_latency: float = 0.4, lite_latency: float = 0.15) -> List[dict]:
+    """Customer scenarios on one model vs tiered routing (post-tool answers and small talk on the lite model).
+
+    Both models are scripted fakes with different per-call latency; model calls,
+    latency and tokens come from model_router's per-model accounting.
+    """
+    import AI_Agent
+    from model_router import ModelMetrics, RoutedChatModel
+
+    fake_db = FakeSupabaseClient()
+    install_fake_backends(fake_db)
+    latencies = {"gemini-2.5-flash": flash_latency, "gemini-2.5-flash-lite": lite_latency}
+    policies = {"single": {}, "tiered": {"after_tools": "gemini-2.5-flash-lite", "small_talk": "gemini-2.5-flash-lite"}}
+    rows = []
+    with shortcuts_disabled():
+        for name, message, plan, answer in CUSTOMER_SCENARIOS:
+            for policy, routes in policies.items():
+                metrics = ModelMetrics()
+                model = RoutedChatModel(lambda model_name: ScriptedFakeLLM(plan, answer, latency=latencies[model_name]),
+                                        default_model="gemini-2.5-flash", routes=routes, metrics=metrics)
+                start = time.perf_counter()
+                with patched_customer_agent(model):
+                    response = _run_quietly(AI_Agent.chat_with_bot, message, authenticated_client=fake_db)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                usage = metrics.snapshot()
+                rows.append({
+                    "scenario": name,
+                    "policy": policy,
+                    "model_calls": ", ".join(f"{m.replace('gemini-2.5-', '')}:{u['count']}" for m, u in sorted(usage.items())),
+                    "input_tokens": ", ".join(f"{m.replace('gemini-2.5-', '')}:{u['input_tokens']}" for m, u in sorted(usage.items())),
+                    "model_ms": round(sum(u["avg_ms"] * u["count"] for u in usage.values()), 1),
+                    "total_ms": round(elapsed_ms, 1),
+                    "same_answer": response.startswith(answer.split("\n")[0]),
+                })
+    return rows
+
+
+def benchmark_budget(latency: float = 0.1) -> List[dict]:
+    """A model that calls a tool 40 times before answering: unbounded loop vs step budget vs wall-clock deadline.
+
+    The staff row stops on the tool budget mid tool call, then sends a second turn on the same memory.
+    """
+    import AI_Agent
+    import request_context
+
+    fake_db = FakeSupabaseClient()
+    install_fake_backends(fake_db)
+    runaway_plan = [[("getRestaurantsByCuisineType", {"cuisineType": "italian"})]] * 40
+    budgets = {
+        "unbounded": {"max_llm_calls": 0, "max_tool_calls": 0, "deadline_seconds": 0},
+        "step_budget": {"max_llm_calls": 8, "max_tool_calls": 16, "deadline_seconds": 0},
+        "deadline": {"max_llm_calls": 0, "max_tool_calls": 0, "deadline_seconds": 0.5},
+    }
+    original_budget = request_context.RequestBudget
+    rows = []
+    for mode, limits in budgets.items():
+        created = []
+        request_context.RequestBudget = lambda: created.append(original_budget(**limits)) or created[-1]
+        fake_llm = ScriptedFakeLLM(runaway_plan, "unused", latency=latency)
+        try:
+            start = time.perf_counter()
+            with shortcuts_disabled(), patched_customer_agent(fake_llm):
+                response = _run_quietly(AI_Agent.chat_with_bot, "best italian places", authenticated_client=fake_db)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        finally:
+            request_context.RequestBudget = original_budget
+        budget = created[-1]
+        rows.append({
+            "mode": mode,
+            "llm_calls": fake_llm.calls,
+            "tool_calls": budget.tool_calls,
+            "stopped_by": budget.exhausted or "-",
+            "ms": round(elapsed_ms, 1),
+            "answer": response.replace("\n", " | ")[:70],
+        })
+    # Only a tool-call limit, so the run stops on a tool call it can't execute
+    rows.append(_staff_budget_check({"max_llm_calls": 0, "max_tool_calls": 5, "deadline_seconds": 0}, latency))
+    return rows
+
+
+class _StrictFakeLLM(ScriptedFakeLLM):
+    """Rejects a history holding a tool call without its result, like Gemini does."""
+
+    def _next_message(self, messages: List[Any]) -> AIMessage:
+        if _dangling_tool_calls(messages):
+            raise ValueError("function call turn is not followed by a function response turn")
+        return super()._next_message(messages)
+
+
+def _dangling_tool_calls(messages: List[Any]) -> int:
+    answered = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    return sum(1 for m in messages if isinstance(m, AIMessage) for c in m.tool_calls if c["id"] not in answered)
+
+
+def _staff_budget_check(limits: dict, latency: float) -> dict:
+    """A staff turn that runs out of budget mid tool call, then a second turn on the same memory."""
+    import AI_Agent_Restaurant
+    import request_context
+
+    fake_db = FakeSupabaseClient()
+    install_fake_backends(fake_db)
+    memory = AI_Agent_Restaurant.create_staff_conversation_memory()
+    runaway_plan = [[("getTodaysBookings", {"restaurant_id": "r-emsherif"})]] * 40
+    original_app, original_budget = AI_Agent_Restaurant.staff_app, request_context.RequestBudget
+    created = []
+    try:
+        fake_llm = _StrictFakeLLM(runaway_plan, "unused", latency=latency)
+        AI_Agent_Restaurant.staff_app = _run_quietly(AI_Agent_Restaurant.create_staff_app, fake_llm)
+        request_context.RequestBudget = lambda: created.append(original_budget(**limits)) or created[-1]
+        start = time.perf_counter()
+        response = _run_quietly(AI_Agent_Restaurant.chat_with_staff_bot, "who is booked today?", "r-emsherif", memory=memory, authenticated_client=fake_db)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        request_context.RequestBudget = original_budget
+        remembered = [m.content for m in memory.get_messages() if isinstance(m, AIMessage)] == [response]
+        dangling = _dangling_tool_calls(memory.get_messages())
+
+        next_llm = _StrictFakeLLM([], "Anything else for today's service?")
+        AI_Agent_Restaurant.staff_app = _run_quietly(AI_Agent_Restaurant.create_staff_app, next_llm)
+        second = _run_quietly(AI_Agent_Restaurant.chat_with_staff_bot, "thanks", "r-emsherif", memory=memory, authenticated_client=fake_db)
+    finally:
+        AI_Agent_Restaurant.staff_app, request_context.RequestBudget = original_app, original_budget
+    return {
+        "mode": "staff_tool_budget",
+        "llm_calls": fake_llm.calls,
+        "tool_calls": created[-1].tool_calls,
+        "stopped_by": created[-1].exhausted or "-",
+        "ms": round(elapsed_ms, 1),
+        "answer": response.replace("\n", " | ")[:70],
+        "answer_remembered": remembered,
+        "dangling_in_memory": dangling,
+        "second_turn_ok": second == next_llm.final_answer,
+    }
+
+
+def benchmark_prompt_cache(rounds: int = 2) -> List[dict]:
+    """Which customer profiles can be prompt-cached, then cached vs uncached input tokens per request.
+
+    Only prefixes of at least PROMPT_CACHE_MIN_TOKENS are cached, and of the customer
+    profiles only full qualifies: on the default path (intent profiles) caching saves
+    nothing, and it only pays off for requests routed to the full profile. Each scenario
+    runs `rounds` times in a row; in simulate mode a prefix is cached from the call after
+    its first use, like a provider cache created in the background.
+    """
+    import AI_Agent
+    from agent_graph import prompt_for_mode
+    from model_router import ModelMetrics, RoutedChatModel
+    from prompt_cache import PrefixCache, prefix_tokens
+
+    fake_db = FakeSupabaseClient()
+    install_fake_backends(fake_db)
+    rows = []
+    for name, profile in AI_Agent.AGENT_PROFILES.items():
+        prompt, bound_tools = prompt_for_mode(profile.prompt), AI_Agent.tools_for_profile(profile)
+        rows.append({
+            "mode": "eligibility",
+            "profiles": name,
+            "prefix_tokens": prefix_tokens(prompt, bound_tools),
+            "cacheable": PrefixCache(mode="simulate").cacheable(prompt, bound_tools),
+        })
+    for mode, profiles in (("off", True), ("simulate", True), ("simulate", False)):
+        cache = PrefixCache(mode=mode)
+        metrics = ModelMetrics()
+        for n in range(rounds):
+            for name, message, plan, answer in CUSTOMER_SCENARIOS:
+                model = RoutedChatModel(lambda model_name: ScriptedFakeLLM(plan, answer), metrics=metrics, prompt_cache=cache)
+                before = metrics.snapshot()
+                with shortcuts_disabled(), patched_customer_agent(model, profiles=profiles):
+                    _run_quietly(AI_Agent.chat_with_bot, message, authenticated_client=fake_db)
+                after = metrics.snapshot()
+                spent = {k: sum(m[k] for m in after.values()) - sum(m[k] for m in before.values())
+                         for k in ("count", "input_tokens", "cached_input_tokens")}
+                rows.append({
+                    "mode": mode,
+                    "profiles": "intent (default)" if profiles else "full only",
+                    "request": f"{name}#{n + 1}",
+                    "llm_calls": spent["count"],
+                    "input_tokens": spent["input_tokens"],
+                    "cached": spent["cached_input_tokens"],
+                    "uncached": spent["input_tokens"] - spent["cached_input_tokens"],
+                    "cached_share": f"{spent['cached_input_tokens'] / spent['input_tokens']:.0%}" if spent["input_tokens"] else "-",
+                })
+    return rows
+
+
+def benchmark_scheduler(customers: int = 32, staff: int = 4, max_concurrent: int = 2, latency: float = 0.1,
+                        arrival_gap: float = 0.01) -> List[dict]:
+    """Dinner rush: anonymous customer chats arrive every arrival_gap seconds, staff questions arrive mid-burst.
+
+    Model calls are limited to max_concurrent at a time; compares FIFO queueing, staff-first
+    priority, and priority plus shedding of anonymous requests once 8 calls are queued. Staff
+    are verified (a current_user); the last row checks a staff chat without one queues as anonymous.
+    """
+    import AI_Agent
+    import AI_Agent_Restaurant
+    import agent_graph
+    from llm_scheduler import ANONYMOUS, STAFF, LLMScheduler, Overloaded
+
+    _, customer_message, customer_plan, customer_answer = CUSTOMER_SCENARIOS[1]
+    _, staff_message, staff_plan, staff_answer = STAFF_SCENARIOS[0]
+    fake_db = FakeSupabaseClient()
+    install_fake_backends(fake_db)
+    _run_quietly(AI_Agent.restaurant_catalog.rows)
+    modes = {
+        "fifo": ({}, True),
+        "priority": ({}, False),
+        "priority+shed": ({ANONYMOUS: 8}, False),
+    }
+    original_scheduler, original_priority = agent_graph.llm_scheduler, agent_graph._priority
+    original_staff_app = AI_Agent_Restaurant.staff_app
+    rows = []
+    with shortcuts_disabled(), patched_customer_agent(ScriptedFakeLLM(customer_plan, customer_answer, latency=latency)):
+        AI_Agent_Restaurant.staff_app = _run_quietly(AI_Agent_Restaurant.create_staff_app, ScriptedFakeLLM(staff_plan, staff_answer, latency=latency))
+        try:
+            for mode, (shed_queue, fifo) in modes.items():
+                scheduler = LLMScheduler(max_concurrent, shed_queue)
+                agent_graph.llm_scheduler = scheduler
+                agent_graph._priority = (lambda: ANONYMOUS) if fifo else original_priority
+                timings: Dict[str, List[float]] = {"customer": [], "staff": [], "shed": []}
+
+                async def customer(n: int):
+                    await asyncio.sleep(n * arrival_gap)
+                    start = time.perf_counter()
+                    try:
+                        scheduler.admit(ANONYMOUS)
+                    except Overloaded:
+                        timings["shed"].append((time.perf_counter() - start) * 1000)
+                        return
+                    await AI_Agent.achat_with_bot(customer_message, authenticated_client=fake_db)
+                    timings["customer"].append((time.perf_counter() - start) * 1000)
+
+                async def staff_member(n: int):
+                    await asyncio.sleep(customers * arrival_gap / 2 + n * arrival_gap)
+                    start = time.perf_counter()
+                    await AI_Agent_Restaurant.achat_with_staff_bot(staff_message, "r-emsherif", authenticated_client=fake_db,
+                                                                   current_user={"id": f"staff-{n}", "role": "authenticated"})
+                    timings["staff"].append((time.perf_counter() - start) * 1000)
+
+                async def run():
+                    await asyncio.gather(*(customer(n) for n in range(customers)), *(staff_member(n) for n in range(staff)))
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    asyncio.run(run())
+                stats = scheduler.snapshot()
+                rows.append({
+                    "mode": mode,
+                    "staff_avg_ms": round(sum(timings["staff"]) / len(timings["staff"]), 1),
+                    "staff_max_ms": round(max(timings["staff"]), 1),
+                    "customer_avg_ms": round(sum(timings["customer"]) / len(timings["customer"]), 1) if timings["customer"] else 0,
+                    "served": len(timings["customer"]),
+                    "shed": len(timings["shed"]),
+                    "shed_reply_ms": round(max(timings["shed"]), 2) if timings["shed"] else "-",
+                    "max_queued": stats["max_queued"],
+                })
+
+            # No verified user: the staff endpoint must not hand out STAFF (never shed, front of the queue)
+            seen = []
+            agent_graph._priority = lambda: seen.append(original_priority()) or seen[-1]
+            _run_quietly(AI_Agent_Restaurant.chat_with_staff_bot, staff_message, "r-emsherif", authenticated_client=fake_db)
+            _run_quietly(AI_Agent_Restaurant.chat_with_staff_bot, staff_message, "r-emsherif", authenticated_client=fake_db,
+                         current_user={"id": "staff-0", "role": "authenticated"})
+            rows.append({"mode": "staff_priority", "without_jwt": seen[0], "verified": seen[-1],
+                         "ok": seen[0] == ANONYMOUS and seen[-1] == STAFF})
+        finally:
+            agent_graph.llm_scheduler, agent_graph._priority = original_scheduler, original_priority
+            AI_Agent_Restaurant.staff_app = original_staff_app
+    return rows
+
+
+def benchmark_service_board(requests: int = 20, db_latency: float = 0.03) -> List[dict]:
+    """Staff tool calls during service: a query per call vs the live service board.
+
+    Each staff request asks for today's bookings, free tables tonight, the waitlist, its stats
+    and a wait estimate. After the run a guest joins the waitlist and table 3 is assigned to the
+    19:00 booking (a booking_tables row; bookings.updated_at doesn't move), and the board is
+    polled once, to check both changes show up. Then polls fail past the staleness limit, to
+    check the tools go back to querying. Last, the same staff user comes back with a refreshed
+    token (a new client), which must reuse the board (no reload) and poll with the new client.
+    """
+    import AI_Agent_Restaurant
+    from llm_scheduler import STAFF
+    from request_context import request_scope
+    from service_board import ServiceBoards
+
+    fake_db = FakeSupabaseClient(latency=db_latency)
+    install_fake_backends(fake_db)
+    now = datetime.now()
+    # With updated_at the bookings feed polls deltas; the later booking keeps b-1 behind the cursor
+    first = dict(fake_db.tables["bookings"][0], updated_at=(now - timedelta(hours=1)).isoformat())
+    later = dict(first, id="b-2", booking_time=first["booking_time"].replace("T19:00", "T21:30"), party_size=2,
+                 guest_name="Lina Saad", confirmation_code="DEF456", updated_at=(now - timedelta(minutes=10)).isoformat())
+    fake_db.tables["bookings"] = [first, later]
+    fake_db.tables["waitlist"] = [
+        {"id": f"w-{n}", "restaurant_id": "r-emsherif", "party_size": 2 + n % 3, "status": "waiting",
+         "joined_at": (now - timedelta(minutes=30 - n)).isoformat(), "quoted_wait_minutes": 15 + 5 * n, "priority": 0,
+         "notified_at": None, "updated_at": (now - timedelta(minutes=30 - n)).isoformat()}
+        for n in range(4)
+    ]
+    tonight = datetime.combine(now.date(), datetime.min.time()).replace(hour=20).isoformat()
+    calls = [
+        (AI_Agent_Restaurant.getTodaysBookings, {"restaurant_id": "r-emsherif"}),
+        (AI_Agent_Restaurant.getAvailableTables, {"restaurant_id": "r-emsherif", "desired_time": tonight, "party_size": 4}),
+        (AI_Agent_Restaurant.getWaitlist, {"restaurant_id": "r-emsherif"}),
+        (AI_Agent_Restaurant.getWaitlistStats, {"restaurant_id": "r-emsherif"}),
+        (AI_Agent_Restaurant.estimateWaitTime, {"restaurant_id": "r-emsherif", "party_size": 4}),
+    ]
+
+    staff_user = {"id": "staff-1"}
+    rows = []
+    original_boards = AI_Agent_Restaurant.service_boards
+    clock_offset = [0.0]
+    try:
+        for mode in ("query", "board"):
+            # The poller and the clock are driven by hand below
+            boards = AI_Agent_Restaurant.service_boards = ServiceBoards(poll_seconds=0 if mode == "query" else 3600, max_stale_seconds=30,
+                                                                        clock=lambda: time.monotonic() + clock_offset[0])
+            executed_before = fake_db.executed
+            timings = []
+            for n in range(requests):
+                with request_scope(client=fake_db, user=staff_user, restaurant_id="r-emsherif", priority=STAFF):
+                    for tool_fn, args in calls:
+                        start = time.perf_counter()
+                        _run_quietly(tool_fn.invoke, args)
+                        timings.append((time.perf_counter() - start) * 1000)
+            first_request = timings[:len(calls)]
+            later = timings[len(calls):]
+            queries = fake_db.executed - executed_before
+
+            fake_db.tables["waitlist"].append(
+                {"id": "w-new", "restaurant_id": "r-emsherif", "party_size": 6, "status": "waiting", "joined_at": datetime.now().isoformat(),
+                 "quoted_wait_minutes": 40, "priority": 0, "notified_at": None, "updated_at": datetime.now().isoformat()})
+            fake_db.tables["booking_tables"].append({"booking_id": "b-1", "table_id": "t-3"})
+            poll_before = fake_db.executed
+            if boards.enabled:
+                _run_quietly(boards.poll_once)
+            poll_queries = fake_db.executed - poll_before
+            with request_scope(client=fake_db, user=staff_user, restaurant_id="r-emsherif", priority=STAFF):
+                waitlist = json.loads(_run_quietly(AI_Agent_Restaurant.getWaitlist.invoke, calls[2][1]))
+                free_tables = json.loads(_run_quietly(AI_Agent_Restaurant.getAvailableTables.invoke, calls[1][1]))
+
+            # Polls fail until the board is past its staleness limit; the tools then query again
+            serves_stale = False
+            if boards.enabled:
+                working_table = fake_db.table
+                fake_db.table = lambda name: (_ for _ in ()).throw(ConnectionError("database unreachable"))
+                _run_quietly(boards.poll_once)
+                fake_db.table = working_table
+                clock_offset[0] += 31
+                fake_db.tables["waitlist"].append(dict(fake_db.tables["waitlist"][-1], id="w-stale"))
+                with request_scope(client=fake_db, user=staff_user, restaurant_id="r-emsherif", priority=STAFF):
+                    stale_waitlist = json.loads(_run_quietly(AI_Agent_Restaurant.getWaitlist.invoke, calls[2][1]))
+                serves_stale = not any(e["id"] == "w-stale" for e in stale_waitlist["entries"])
+                fake_db.tables["waitlist"].pop()
+            fake_db.tables["waitlist"].pop()
+            fake_db.tables["booking_tables"].pop()
+
+            refresh_reloads, polls_new_client, old_token_polls = "-", "-", "-"
+            if boards.enabled:
+                refreshed = FakeSupabaseClient(latency=db_latency)
+                refreshed.tables = fake_db.tables
+                _run_quietly(boards.poll_once)
+                loads_before = boards.snapshot()["loads"]
+                with request_scope(client=refreshed, user=staff_user, restaurant_id="r-emsherif", priority=STAFF):
+                    _run_quietly(AI_Agent_Restaurant.getWaitlist.invoke, calls[2][1])
+                refresh_reloads = boards.snapshot()["loads"] - loads_before
+                refreshed_before, old_before = refreshed.executed, fake_db.executed
+                _run_quietly(boards.poll_once)
+                polls_new_client = refreshed.executed > refreshed_before
+                old_token_polls = fake_db.executed - old_before
+            rows.append({
+                "mode": mode,
+                "tool_calls": len(timings),
+                "db_queries": queries,
+                "first_request_ms": round(sum(first_request), 1),
+                "tool_avg_ms_after": round(sum(later) / len(later), 3),
+                "poll_queries": poll_queries,
+                "sees_new_entry": any(e["id"] == "w-new" for e in waitlist["entries"]),
+                "sees_new_assignment": all(t["id"] != "t-3" for t in free_tables["available_tables"]),
+                "serves_stale": serves_stale,
+                "token_refresh_reloads": refresh_reloads,
+                "polls_new_client": polls_new_client,
+                "old_token_queries": old_token_polls,
+            })
+    finally:
+        AI_Agent_Restaurant.service_boards = original_boards
+    return rows
+
+
+# (message, expected dates, expected times), resolved on Monday 2026-10-19 at noon
+TEMPORAL_CASES = [
+    ("table for 2 tomorrow at 8", ["2026-10-20"], ["20:00"]),
+    ("tomorrow at 8:30", ["2026-10-20"], ["20:30"]),
+    ("tonight at 7.30", ["2026-10-19"], ["19:30"]),
+    ("at 7.30pm on friday", ["2026-10-23"], ["19:30"]),
+    ("next friday at 9:15 pm", ["2026-10-23"], ["21:15"]),
+    ("brunch at 10:30am this weekend", ["2026-10-24"], ["10:30"]),
+    ("saturday at 08:30", ["2026-10-24"], ["08:30"]),
+    ("in 3 days at 20:00", ["2026-10-22"], ["20:00"]),
+    ("lunch at noon today", ["2026-10-19"], ["12:00"]),
+    ("at 12:15", [], ["12:15"]),
+    ("at 8 people tomorrow", ["2026-10-20"], []),
+    ("places rated 4.50 or more", [], []),
+]
+
+
+def benchmark_temporal() -> List[dict]:
+    """Dates and clock times temporal_parser injects into the model's context, against the expected values."""
+    from temporal_parser import resolve_temporal_expressions
+
+    now = datetime(2026, 10, 19, 12, 0)
+    rows = []
+    for message, dates, times in TEMPORAL_CASES:
+        resolved = resolve_temporal_expressions(message, now)
+        got_dates = [iso for _, iso in resolved.dates]
+        got_times = [hhmm for _, hhmm in resolved.times]
+        rows.append({
+            "message": message,
+            "dates": ",".join(got_dates) or "-",
+            "times": ",".join(got_times) or "-",
+            "ok": got_dates == dates and got_times == times,
+        })
+    return rows
+
+
+# (message, has conversation history, expected profile)
+INTENT_CASES = [
+    ("is Em Sherif free tomorrow for 4", False, "availability"),
+    ("best italian places", False, "discovery"),
+    ("what cuisines do you have", False, "discovery"),
+    ("hi", False, "small_talk"),
+    ("thank you so much", False, "small_talk"),
+    ("find a restaurant for tonight", False, "full"),
+    ("any good places for 4 tomorrow", False, "full"),
+    ("romantic dinner on saturday", False, "full"),
+    ("hey, what about the second one?", False, "full"),
+    ("hi", True, "full"),
+    ("what about friday at 8?", True, "full"),
+]
+
+
+def benchmark_intents() -> List[dict]:
+    """Agent profile classify_intent picks per message. A restricted profile must have the tools the message needs."""
+    import AI_Agent
+    from intent_classifier import classify_intent
+
+    rows = []
+    for message, has_history, expected in INTENT_CASES:
+        intent = classify_intent(message, has_history=has_history)
+        tool_names = AI_Agent.AGENT_PROFILES[intent.intent].tool_names
+        rows.append({
+            "message": message,
+            "history": has_history,
+            "profile": intent.intent,
+            "tools": "all" if tool_names is None else len(tool_names),
+            "ok": intent.intent == expected,
+        })
+    return rows
+
+
+class _SleepingTool:
+    name = "slowLookup"
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def invoke(self, args: dict) -> str:
+        time.sleep(self.seconds)
+        return "ok"
+
+
+def benchmark_tool_timeout(calls: int = 3, tool_seconds: float = 0.2, timeout: float = 0.3) -> List[dict]:
+    """calls tool calls on a one-worker pool, each well inside the per-tool timeout.
+
+    Queued calls must not time out (only running time counts); with a request
+    deadline shorter than the queue, calls that never started are reported as
+    not run and the one it cut short as stopped, neither as a tool timeout.
+    The slow_tool row is a single call that does overrun the per-tool timeout.
+    """
+    import request_context
+    import tool_executor
+    from agent_metrics import tool_metrics
+    from concurrent.futures import ThreadPoolExecutor
+
+    modes = {
+        "no_deadline": (calls, tool_seconds, 0),
+        "request_deadline": (calls, tool_seconds, tool_seconds * 1.5),
+        "slow_tool": (1, timeout * 2, 0),
+    }
+    original_executor = tool_executor._EXECUTOR
+    rows = []
+    try:
+        for mode, (count, seconds, deadline_seconds) in modes.items():
+            message = AIMessage(content="", tool_calls=[{"name": "slowLookup", "args": {}, "id": f"call-{i}"} for i in range(count)])
+            node = tool_executor.ParallelToolNode([_SleepingTool(seconds)], timeout=timeout)
+            for run_async in (False, True):
+                tool_executor._EXECUTOR = ThreadPoolExecutor(max_workers=1)
+                tool_metrics.reset()
+                start = time.perf_counter()
+                with request_context.request_scope() as request:
+                    request.budget = request_context.RequestBudget(max_llm_calls=0, max_tool_calls=0, deadline_seconds=deadline_seconds)
+                    if run_async:
+                        result = _run_quietly(asyncio.run, node.acall({"messages": [message]}))
+                    else:
+                        result = _run_quietly(node, {"messages": [message]})
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                tool_executor._EXECUTOR.shutdown(wait=True)
+                stats = tool_metrics.get("slowLookup") or {}
+                contents = [m.content for m in result["messages"]]
+                rows.append({
+                    "mode": mode,
+                    "path": "acall" if run_async else "call",
+                    "ok": contents.count("ok"),
+                    "not_run": sum("was not run" in c for c in contents),
+                    "stopped": sum("was stopped" in c for c in contents),
+                    "tool_timeouts": stats.get("timeouts", 0),
+                    "ms": round(elapsed_ms, 1),
+                })
+    finally:
+        tool_executor._EXECUTOR = original_executor
+        tool_metrics.reset()
+    return rows
+
+
+def _tool_turn(n: int) -> List[Any]:
+    call = {"name": "getRestaurantsByName", "args": {"query": f"place {n}"}, "id": f"call-{n}"}
+    return [
+        HumanMessage(content=f"is place {n} open tonight?"),
+        AIMessage(content="", tool_calls=[call]),
+        ToolMessage(content=json.dumps([{"id": f"r-{n}", "name": f"Place {n}"}]), name=call["name"], tool_call_id=call["id"]),
+        AIMessage(content=f"Place {n} is open tonight until 23:00."),
+    ]
+
+
+def benchmark_memory() -> List[dict]:
+    """Compaction of TokenBudgetMemory: after each scenario the history (after the summary) must start
+    with a user message and hold no tool call without its result, and the newest turn must be whole."""
+    from conversation_memory import TokenBudgetMemory
+
+    chat_turns = [[HumanMessage(content=f"question {n}"), AIMessage(content=f"answer {n}")] for n in range(12)]
+    long_answer = [HumanMessage(content="describe every restaurant"), AIMessage(content="A long answer. " * 400)]
+    long_result = _tool_turn(99)
+    long_result[2] = ToolMessage(content=json.dumps([{"id": f"r-{n}", "name": f"Place {n}"} for n in range(300)]),
+                                 name="getRestaurantsByName", tool_call_id="call-99")
+    scenarios = {
+        # (memory arguments, turns added in order)
+        "count_limit": ({"max_history": 5}, chat_turns),
+        "token_budget": ({"token_budget": 200}, chat_turns),
+        "tool_turns": ({"max_history": 6}, [_tool_turn(n) for n in range(5)]),
+        "oversized_turn": ({"token_budget": 200}, chat_turns[:3] + [long_answer]),
+        "oversized_tool_result": ({"token_budget": 200}, chat_turns[:3] + [long_result]),
+    }
+    rows = []
+    for name, (kwargs, turns) in scenarios.items():
+        memory = TokenBudgetMemory(**kwargs)
+        for turn in turns:
+            for message in turn:
+                memory.add_message(message)
+        history = [m for m in memory.get_messages() if not isinstance(m, SystemMessage)]
+        calls = {c["id"] for m in history if isinstance(m, AIMessage) for c in m.tool_calls}
+        rows.append({
+            "scenario": name,
+            "kept": len(history),
+            "summarized": memory.summarized_messages,
+            "starts_with_user": bool(history) and isinstance(history[0], HumanMessage),
+            "dangling_tool_calls": _dangling_tool_calls(history),
+            "orphan_tool_results": sum(1 for m in history if isinstance(m, ToolMessage) and m.tool_call_id not in calls),
+            "newest_turn_whole": history[-len(turns[-1]):] == turns[-1],
+        })
+    return rows
+
+
+def benchmark_featured(requests: int = 20, db_latency: float = 0.03) -> List[dict]:
+    """Tail cost of the RESTAURANTS_TO_SHOW fallback: the old featured/top-rated queries vs the catalog ranking.
+
+    The scripted model answers a discovery question without tools or IDs, so chat_with_bot
+    has to add IDs itself after the answer.
+    """
+    import AI_Agent
+
+    fake_db = FakeSupabaseClient(latency=db_latency)
+    install_fake_backends(fake_db)
+    answer = "Beirut has plenty of great spots for dinner."
+
+    def query_ids() -> List[str]:
+        result = fake_db.table("restaurants").select(AI_Agent.restaurants_table_columns).eq("ai_featured", True).order("average_rating", desc=True).limit(5).execute()
+        items = result.data or []
+        if not items:
+            items = fake_db.table("restaurants").select(AI_Agent.restaurants_table_columns).order("ai_featured", desc=True).order("average_rating", desc=True).limit(5).execute().data or []
+        return [str(x["id"]) for x in items][:5]
+
+    rows = []
+    for mode in ("query", "catalog"):
+        AI_Agent.restaurant_catalog.invalidate()
+        _run_quietly(AI_Agent.restaurant_catalog.rows)
+        original = AI_Agent._featured_ids
+        if mode == "query":
+            AI_Agent._featured_ids = lambda text, limit=5: query_ids()
+        executed_before = fake_db.executed
+        timings = []
+        try:
+            with shortcuts_disabled(), patched_customer_agent(ScriptedFakeLLM([], answer)):
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    response = _run_quietly(AI_Agent.chat_with_bot, "recommend a place for dinner", authenticated_client=fake_db)
+                    timings.append(time.perf_counter() - start)
+        finally:
+            AI_Agent._featured_ids = original
+        rows.append({
+            "mode": mode,
+            "requests": requests,
+            "avg_ms": round(sum(timings) / len(timings) * 1000, 1),
+            "db_queries": fake_db.executed - executed_before,
+            "restaurants_to_show": response.partition("RESTAURANTS_TO_SHOW: ")[2],
+        })
+    return rows
+
+
+def benchmark_cards(ids_shown: int = 5, catalog_size: int = 200, rtt_ms: float = 150.0) -> List[dict]:
+    """What the app does after a discovery answer: one fetch per restaurants_to_show ID vs include_cards.
+
+    Client time is estimated as one mobile round trip (rtt_ms) per follow-up request; the
+    server cost of include_cards is measured against a catalog of catalog_size restaurants.
+    """
+    from restaurant_catalog import RestaurantCatalog
+    from restaurant_cards import restaurant_cards
+
+    rows = _synthetic_restaurants(catalog_size)
+    for row in rows:
+        row["main_image_url"] = f"https://cdn.example.com/restaurants/{row['id']}/cover.jpg"
+    catalog = RestaurantCatalog(lambda: rows)
+    catalog.rows()
+    ids = [str(r["id"]) for r in rows[:ids_shown]]
+    base_body = {"response": "Here are a few places you might like.", "restaurants_to_show": ids, "status": "success"}
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        cards = restaurant_cards(ids, catalog.by_id(ids))
+    build_ms = (time.perf_counter() - start) / 1000 * 1000
+
+    return [
+        {"mode": "ids_only", "response_bytes": len(json.dumps(base_body)), "follow_up_requests": ids_shown,
+         "est_client_ms_after_answer": round(ids_shown * rtt_ms, 1), "server_build_ms": 0.0},
+        {"mode": "include_cards", "response_bytes": len(json.dumps({**base_body, "restaurant_cards": cards})), "follow_up_requests": 0,
+         "est_client_ms_after_answer": 0.0, "server_build_ms": round(build_ms, 3)},
+    ]
+
+
+def _synthetic_restaurants(count: int) -> List[dict]:
+    cuisines = ["Lebanese", "Italian", "Japanese", "French", "Mexican", "Indian"]
+    return [
+        {"id": f"r-gen-{n}", "name": f"Restaurant {n}", "cuisine_type": cuisines[n % len(cuisines)],
+         "description": "A neighbourhood favourite with a seasonal menu, a long wine list and a terrace overlooking the street. " * 2,
+         "address": f"{n} Main Street, Hamra, Beirut, Lebanon", "tags": ["parking", "wifi", "family-friendly"],
+         "opening_time": "12:00:00", "closing_time": "23:00:00", "price_range": 1 + n % 4, "average_rating": round(3.5 + (n % 15) / 10, 1),
+         "dietary_options": ["vegetarian", "gluten-free"], "ambiance_tags": ["casual", "romantic"], "outdoor_seating": n % 2 == 0,
+         "ai_featured": n % 5 == 0, "booking_window_days": 30}
+        for n in range(count)
+    ]
+
+
+def benchmark_tool_output(catalog_size: int = 50) -> List[dict]:
+    """Full vs compact output size for each restaurant tool over a synthetic catalog."""
+    import AI_Agent
+    from tool_output import tool_output_stats
+
+    fake_db = FakeSupabaseClient()
+    fake_db.tables["restaurants"].extend(_synthetic_restaurants(catalog_size))
+    install_fake_backends(fake_db)
+    tool_output_stats.reset()
+    calls = [
+        (AI_Agent.getAllRestaurants, {}),
+        (AI_Agent.getRestaurantsByCuisineType, {"cuisineType": "italian"}),
+        (AI_Agent.getFeaturedRestaurants, {"limit": 10}),
+        (AI_Agent.getRestaurantsByName, {"query": "restaurant"}),
+        (AI_Agent.searchRestaurantsAdvanced, {"filters_json": "{}"}),
+    ]
+    for tool_fn, args in calls:
+        _run_quietly(tool_fn.invoke, args)
+    return [{"tool": name, **stats} for name, stats in tool_output_stats.snapshot().items()]
+
+
+def _print_table(rows: List[dict]):
+    if not rows:
+        return
+    headers = list(dict.fromkeys(h for r in rows for h in r))
+    widths = {h: max(len(h), *(len(str(r.get(h, ""))) for r in rows)) for h in headers}
+    print("  ".join(h.ljust(widths[h]) for h in headers))
+    for r in rows:
+        print("  ".join(str(r.get(h, "")).ljust(widths[h]) for h in headers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline agent benchmarks")
+    parser.add_argument("benchmark", choices=["llm-calls", "tokens", "tool-output", "response-cache", "coalescing", "streaming", "async-load", "isolation", "client-pool", "jwt", "profile", "speculative", "featured", "cards", "routing", "budget", "prompt-cache", "scheduler", "service-board", "temporal", "intents", "tool-timeout", "memory"])
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per LLM call")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON instead of a table")
+    args = parser.parse_args()
+
+    if args.benchmark == "llm-calls":
+        rows = benchmark_llm_calls(latency=args.llm_latency)
+    elif args.benchmark == "tokens":
+        rows = benchmark_tokens()
+    elif args.benchmark == "tool-output":
+        rows = benchmark_tool_output()
+    elif args.benchmark == "response-cache":
+        rows = benchmark_response_cache(latency=args.llm_latency or 0.2)
+    elif args.benchmark == "coalescing":
+        rows = benchmark_coalescing()
+    elif args.benchmark == "streaming":
+        rows = benchmark_streaming(latency=args.llm_latency or 0.3)
+    elif args.benchmark == "async-load":
+        rows = benchmark_async_load(latency=args.llm_latency or 0.5)
+    elif args.benchmark == "isolation":
+        rows = benchmark_isolation()
+    elif args.benchmark == "client-pool":
+        rows = benchmark_client_pool()
+    elif args.benchmark == "jwt":
+        rows = benchmark_jwt()
+    elif args.benchmark == "profile":
+        rows = benchmark_profile()
+    elif args.benchmark == "speculative":
+        rows = benchmark_speculative(latency=args.llm_latency or 0.3)
+    elif args.benchmark == "featured":
+        rows = benchmark_featured()
+    elif args.benchmark == "cards":
+        rows = benchmark_cards()
+    elif args.benchmark == "routing":
+        rows = benchmark_routing()
+    elif args.benchmark == "budget":
+        rows = benchmark_budget()
+    elif args.benchmark == "prompt-cache":
+        rows = benchmark_prompt_cache()
+    elif args.benchmark == "scheduler":
+        rows = benchmark_scheduler()
+    elif args.benchmark == "service-board":
+        rows = benchmark_service_board()
+    elif args.benchmark == "temporal":
+        rows = benchmark_temporal()
+    elif args.benchmark == "intents":
+        rows = benchmark_intents()
+    elif args.benchmark == "tool-timeout":
+        rows = benchmark_tool_timeout()
+    elif args.benchmark == "memory":
+        rows = benchmark_memory()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        _print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
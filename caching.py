@@ -0,0 +1,124 @@
+"""
+Small in-process caching primitives shared by the API and agents.
+
+- TTLCache:    thread-safe LRU map with per-entry expiry
+- SingleFlight: coalesces concurrent calls for the same key into one execution
+- AsyncSingleFlight: the same for coroutines on one event loop
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at <= self.clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Run fn once per key at a time; concurrent callers for the same key wait for and share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another caller's execution was reused."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent awaits for the same key share one execution."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Future"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another caller's execution was reused."""
+        call = self._calls.get(key)
+        if call is not None:
+            return await asyncio.shield(call), True
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            call.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            # Mark the exception retrieved when no follower was waiting
+            call.exception()
+            raise
+        finally:
+            self._calls.pop(key, None)
@@ -0,0 +1,147 @@
+"""
+Streaming variants of chat_with_bot / chat_with_staff_bot.
+
+stream_chat() runs a chat function on a background thread inside an
+event_scope, and yields events as they happen:
+
+  {"event": "start"}
+  {"event": "progress", "message": "Searching restaurants…"}
+  {"event": "tool_start", "tool": "getRestaurantsByCuisineType"}
+  {"event": "tool_end", "tool": "getRestaurantsByCuisineType", "ok": true, "ms": 182.4}
+  {"event": "token", "text": "Leonardo is a great"}
+  {"event": "done", "response": "...", "restaurants_to_show": ["r-1", "r-2"]}
+  {"event": "error", "message": "..."}
+
+Tokens come from the agent node streaming the model (agent_graph.invoke_model);
+the RESTAURANTS_TO_SHOW line is held back from the token stream and delivered
+in the terminal "done" event instead. Answers that never hit the model (fast
+path, response cache) are sent as a single token event.
+"""
+
+import contextvars
+import json
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from request_context import EventSink, event_scope
+
+RESTAURANTS_MARKER = "RESTAURANTS_TO_SHOW:"
+
+_TOOL_PROGRESS: Dict[str, str] = {
+    "getAllRestaurants": "Searching restaurants…",
+    "getRestaurantsByCuisineType": "Searching restaurants…",
+    "searchRestaurantsAdvanced": "Searching restaurants…",
+    "getRestaurantsByName": "Looking up the restaurant…",
+    "getFeaturedRestaurants": "Looking up featured restaurants…",
+    "getAllCuisineTypes": "Checking cuisines…",
+    "convertRelativeDate": "Working out the date…",
+    "checkAnyTimeSlots": "Checking availability…",
+    "getAvailableTimeSlots": "Checking availability…",
+    "getTableOptionsForSlot": "Checking table options…",
+    "searchTimeRange": "Checking availability…",
+    "getTodaysBookings": "Loading today's bookings…",
+    "getAvailableTables": "Checking tables…",
+    "getCustomerHistory": "Looking up the customer…",
+    "getWaitlist": "Checking the waitlist…",
+    "getWaitlistStats": "Checking the waitlist…",
+}
+_DEFAULT_PROGRESS = "Working on it…"
+
+
+def split_restaurants(response: str) -> Tuple[str, List[str]]:
+    """Split a chat answer into its text and the RESTAURANTS_TO_SHOW IDs."""
+    if RESTAURANTS_MARKER not in response:
+        return response, []
+    text, _, ids = response.partition(RESTAURANTS_MARKER)
+    return text.strip(), [i.strip() for i in ids.strip().split(",") if i.strip()]
+
+
+def format_sse(event: dict) -> str:
+    """Render an event as a Server-Sent Events frame."""
+    payload = {k: v for k, v in event.items() if k != "event"}
+    return f"event: {event['event']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class _TokenFilter:
+    """Pass model text through, holding back anything from the RESTAURANTS_TO_SHOW marker on."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pending = ""
+        self.stopped = False
+
+    def feed(self, text: str) -> str:
+        if self.stopped:
+            return ""
+        self.pending += text
+        index = self.pending.find(RESTAURANTS_MARKER)
+        if index >= 0:
+            self.stopped = True
+            out, self.pending = self.pending[:index], ""
+            return out.rstrip()
+        # Keep a possible partial marker at the end until the next chunk
+        keep = next((n for n in range(len(RESTAURANTS_MARKER) - 1, 0, -1) if self.pending.endswith(RESTAURANTS_MARKER[:n])), 0)
+        out, self.pending = self.pending[:len(self.pending) - keep], self.pending[len(self.pending) - keep:]
+        return out
+
+    def flush(self) -> str:
+        out, self.pending = ("" if self.stopped else self.pending), ""
+        return out
+
+
+def stream_chat(run: Callable[[], str], parse_restaurants: bool = True) -> Iterator[dict]:
+    """Run a chat function in the background and yield its progress, tokens and final answer."""
+    sink = EventSink()
+    outcome: Dict[str, str] = {}
+    ctx = contextvars.copy_context()
+
+    def target():
+        try:
+            with event_scope(sink):
+                outcome["response"] = run()
+        except Exception as e:
+            outcome["error"] = str(e)
+        finally:
+            sink.emit("_finished")
+
+    threading.Thread(target=ctx.run, args=(target,), name="chat-stream", daemon=True).start()
+    yield {"event": "start"}
+    yield {"event": "progress", "message": "Thinking…"}
+
+    token_filter = _TokenFilter()
+    streamed_any = False
+    last_progress = None
+    while True:
+        event = sink.events.get()
+        kind = event["event"]
+        if kind == "_finished":
+            break
+        if kind == "tool_start":
+            message = _TOOL_PROGRESS.get(event.get("tool"), _DEFAULT_PROGRESS)
+            if message != last_progress:
+                last_progress = message
+                yield {"event": "progress", "message": message}
+            yield event
+        elif kind == "tool_end":
+            yield event
+        elif kind == "llm_start":
+            token_filter.reset()
+        elif kind in ("token", "llm_end"):
+            text = token_filter.feed(event["text"]) if kind == "token" else token_filter.flush()
+            if text:
+                streamed_any = True
+                yield {"event": "token", "text": text}
+
+    if "error" in outcome:
+        yield {"event": "error", "message": outcome["error"]}
+        return
+    response = outcome.get("response") or ""
+    text, restaurant_ids = split_restaurants(response) if parse_restaurants else (response, [])
+    if not streamed_any and text:
+        yield {"event": "token", "text": text}
+    done = {"event": "done", "response": text}
+    if parse_restaurants:
+        done["restaurants_to_show"] = restaurant_ids
+    yield done
@@ -0,0 +1,200 @@
+"""
+Token-budgeted conversation memory shared by the customer and staff agents.
+
+Messages live in a ring buffer (deque) bounded by both a message count and an
+estimated token budget. When the buffer overflows, the oldest turns are popped
+and folded into a single rolling summary message, so the history sent to the
+model stays roughly flat in size however long the conversation runs. Turns
+(a user message and everything up to the next one, tool calls included) are
+evicted whole, so the history always starts with a user message and never
+holds a tool call without its result; the newest turn is always kept.
+
+The default summarizer is local (first line of each turn, no model call);
+pass model_summarizer(chat_model) to compact with an LLM instead.
+
+Env:
+- MEMORY_TOKEN_BUDGET:   estimated tokens kept verbatim (default 2000)
+- MEMORY_SUMMARY_TOKENS: cap for the rolling summary (default 300)
+"""
+
+import os
+import re
+import threading
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from agent_metrics import estimate_tokens
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+
+# Compact down to this fraction of the budget so we don't summarize on every turn
+_COMPACT_TARGET_RATIO = 0.6
+_SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+_MAX_LINE_CHARS = 160
+
+# (previous summary, evicted messages) -> new summary text
+Summarizer = Callable[[str, List[BaseMessage]], str]
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content or "")
+
+
+def _first_line(text: str) -> str:
+    text = re.sub(r"RESTAURANTS_TO_SHOW:.*", "", text)
+    text = " ".join(text.split())
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return sentence if len(sentence) <= _MAX_LINE_CHARS else sentence[:_MAX_LINE_CHARS - 1] + "…"
+
+
+def local_summarizer(previous: str, evicted: List[BaseMessage]) -> str:
+    """Append one short line per evicted user/assistant message to the summary."""
+    lines = previous.splitlines() if previous else []
+    for message in evicted:
+        text = _first_line(_message_text(message))
+        if not text:
+            continue
+        if isinstance(message, HumanMessage):
+            lines.append(f"- User: {text}")
+        elif isinstance(message, AIMessage):
+            lines.append(f"- Assistant: {text}")
+    return "\n".join(lines)
+
+
+def model_summarizer(chat_model) -> Summarizer:
+    """Build a summarizer that asks chat_model to compact the evicted turns."""
+    def summarize(previous: str, evicted: List[BaseMessage]) -> str:
+        transcript = "\n".join(
+            f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {_message_text(m)}"
+            for m in evicted if isinstance(m, (HumanMessage, AIMessage))
+        )
+        prompt = (
+            "Update the running summary of a restaurant assistant conversation. Keep names, dates, times, "
+            "party sizes, restaurant names/IDs and user preferences; drop pleasantries. Reply with the summary only, "
+            f"at most {MEMORY_SUMMARY_TOKENS * 3} characters.\n\n"
+            f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"
+        )
+        try:
+            return _message_text(chat_model.invoke([HumanMessage(content=prompt)])).strip()
+        except Exception as e:
+            print(f"Model summarizer failed, using local summary: {e}")
+            return local_summarizer(previous, evicted)
+    return summarize
+
+
+class TokenBudgetMemory:
+    """Conversation history bounded by message count and estimated tokens."""
+
+    def __init__(self, max_history: int = 20, token_budget: Optional[int] = None,
+                 summary_token_budget: Optional[int] = None, summarizer: Optional[Summarizer] = None):
+        self.max_history = max_history
+        self.token_budget = token_budget or MEMORY_TOKEN_BUDGET
+        self.summary_token_budget = summary_token_budget or MEMORY_SUMMARY_TOKENS
+        self.summarizer = summarizer or local_summarizer
+        self.summary = ""
+        self.summarized_messages = 0
+        self._buffer: Deque[BaseMessage] = deque()
+        self._tokens: Deque[int] = deque()
+        self._total_tokens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return list(self._buffer)
+
+    def add_message(self, message: BaseMessage):
+        """Add a message, compacting the oldest turns if over budget."""
+        with self._lock:
+            tokens = estimate_tokens(_message_text(message))
+            self._buffer.append(message)
+            self._tokens.append(tokens)
+            self._total_tokens += tokens
+            if len(self._buffer) > self.max_history or self._total_tokens > self.token_budget:
+                self._compact()
+
+    def _next_turn_start(self) -> Optional[int]:
+        """Index of the first user message after the oldest one, i.e. where the second turn starts."""
+        return next((i for i, m in enumerate(self._buffer) if i > 0 and isinstance(m, HumanMessage)), None)
+
+    def _compact(self):
+        target = int(self.token_budget * _COMPACT_TARGET_RATIO)
+        evicted: List[BaseMessage] = []
+        # Evict the oldest whole turn at a time (a leading partial turn first); the newest turn stays
+        while (
+            len(self._buffer) > self.max_history
+            or self._total_tokens > target
+            or not isinstance(self._buffer[0], HumanMessage)
+        ):
+            turn_end = self._next_turn_start()
+            if turn_end is None:
+                break
+            for _ in range(turn_end):
+                evicted.append(self._buffer.popleft())
+                self._total_tokens -= self._tokens.popleft()
+        if not evicted:
+            return
+        self.summarized_messages += len(evicted)
+        self.summary = self._trim_summary(self.summarizer(self.summary, evicted))
+
+    def _trim_summary(self, summary: str) -> str:
+        """Drop the oldest summary lines until it fits its token budget."""
+        lines = summary.splitlines()
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_token_budget:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def get_messages(self) -> List[BaseMessage]:
+        """Get the summary message (if any) followed by the recent history."""
+        with self._lock:
+            history = list(self._buffer)
+            if self.summary:
+                history.insert(0, SystemMessage(content=_SUMMARY_PREFIX + self.summary))
+            return history
+
+    def clear(self):
+        """Clear the conversation history and summary."""
+        with self._lock:
+            self._buffer.clear()
+            self._tokens.clear()
+            self._total_tokens = 0
+            self.summary = ""
+            self.summarized_messages = 0
+
+    def export_state(self) -> dict:
+        """JSON-serializable snapshot (user/assistant turns + summary) for server-side sessions."""
+        with self._lock:
+            return {
+                "messages": [
+                    {"role": "user" if isinstance(m, HumanMessage) else "assistant", "content": _message_text(m)}
+                    for m in self._buffer if isinstance(m, (HumanMessage, AIMessage))
+                ],
+                "summary": self.summary,
+                "summarized_messages": self.summarized_messages,
+            }
+
+    def load_state(self, state: dict):
+        """Restore a snapshot from export_state() without re-summarizing it."""
+        self.clear()
+        with self._lock:
+            for item in state.get("messages", []):
+                message = HumanMessage(content=item["content"]) if item.get("role") == "user" else AIMessage(content=item["content"])
+                tokens = estimate_tokens(item["content"])
+                self._buffer.append(message)
+                self._tokens.append(tokens)
+                self._total_tokens += tokens
+            self.summary = state.get("summary") or ""
+            self.summarized_messages = int(state.get("summarized_messages") or 0)
+
+    def get_context_size(self) -> int:
+        """Get the number of messages in history."""
+        return len(self._buffer)
+
+    def get_token_count(self) -> int:
+        """Estimated tokens of what get_messages() returns."""
+        return self._total_tokens + (estimate_tokens(_SUMMARY_PREFIX + self.summary) if self.summary else 0)
@@ -0,0 +1,196 @@
+"""
+Deterministic fast path for simple, high-volume customer intents.
+
+Runs in front of the LangGraph agent in chat_with_bot. Messages that fully
+match one of the handlers below are answered by calling the tools directly and
+rendering a templated response, which skips the 2-4 Gemini calls a graph run
+would cost. Anything that doesn't match exactly falls through to the agent.
+
+Handlers:
+- greeting:     "hi", "thanks", "bye", ...
+- cuisines:     "what cuisines do you have"
+- featured:     "show featured restaurants"
+- availability: "is <exact restaurant name> available tomorrow for 2"
+"""
+
+import json
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from availability_tools import expand_slot_ranges
+from request_context import tool_result_scope
+from temporal_parser import resolve_relative_date
+
+
+@dataclass
+class FastPathResult:
+    intent: str
+    response: str
+
+
+_GREETING_RE = re.compile(
+    r"^(?:hi+|hello+|hey+|hiya|yo|good (?:morning|afternoon|evening)|greetings)"
+    r"(?:\s+(?:there|dinemate))?\s*[!.]*$"
+)
+_THANKS_RE = re.compile(r"^(?:thanks|thank you|thx|ty)(?:\s+(?:so much|a lot|very much))?\s*[!.]*$")
+_BYE_RE = re.compile(r"^(?:bye|goodbye|see you|see ya|good night)\s*[!.]*$")
+_CUISINES_RE = re.compile(
+    r"^(?:what|which)\s+(?:kinds?\s+of\s+|types?\s+of\s+)?cuisines?(?:\s+types?)?\s+"
+    r"(?:do you have|are (?:there|available)|do you offer|can i choose from)\s*\??$"
+    r"|^(?:show|list)(?:\s+me)?\s+(?:all\s+)?(?:the\s+)?(?:available\s+)?cuisines?(?:\s+types?)?\s*[?.!]*$"
+)
+_FEATURED_RE = re.compile(
+    r"^(?:show|list|give)(?:\s+me)?\s+(?:the\s+)?(?:your\s+)?featured\s+restaurants?\s*[?.!]*$"
+    r"|^(?:what|which)\s+(?:are\s+)?(?:the\s+|your\s+)?featured\s+restaurants?(?:\s+do you have)?\s*\??$"
+)
+_AVAILABILITY_RE = re.compile(
+    r"^(?:is|does)\s+(?P<name>.+?)\s+(?:available|free|have (?:a table|tables|availability))"
+    r"(?:\s+for\s+(?P<party_before>\d{1,2})(?:\s+(?:people|persons|guests|pax))?)?"
+    r"\s+(?P<when>today|tonight|tomorrow)"
+    r"(?:\s+for\s+(?P<party_after>\d{1,2})(?:\s+(?:people|persons|guests|pax))?)?\s*\??$"
+)
+
+_MAX_LISTED_SLOTS = 8
+
+
+class FastPathStats:
+    """Routing hit-rate counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.hits: Dict[str, int] = {}
+
+    def record(self, intent: Optional[str]):
+        with self._lock:
+            self.total += 1
+            if intent:
+                self.hits[intent] = self.hits.get(intent, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routed = sum(self.hits.values())
+            return {
+                "total_requests": self.total,
+                "routed": routed,
+                "hit_rate": round(routed / self.total, 3) if self.total else 0.0,
+                "by_intent": dict(self.hits),
+            }
+
+
+class FastPathRouter:
+    """Deterministic router; tools is a mapping of tool name -> LangChain tool."""
+
+    def __init__(self, tools: Dict[str, Any], now: Optional[Callable[[], datetime]] = None):
+        self.tools = tools
+        self.now = now or datetime.now
+        self.stats = FastPathStats()
+        self.handlers: List[Callable[[str, Optional[dict]], Optional[FastPathResult]]] = [
+            self._handle_greeting,
+            self._handle_cuisines,
+            self._handle_featured,
+            self._handle_availability,
+        ]
+
+    def route(self, user_input: str, user_profile: Optional[dict] = None) -> Optional[FastPathResult]:
+        """Return a templated response, or None to fall through to the agent."""
+        text = " ".join((user_input or "").lower().split())
+        result = None
+        if text:
+            for handler in self.handlers:
+                try:
+                    result = handler(text, user_profile)
+                except Exception as e:
+                    print(f"Fast path handler {handler.__name__} failed: {e}")
+                    result = None
+                if result:
+                    break
+        self.stats.record(result.intent if result else None)
+        if result:
+            print(f"⚡ Fast path handled intent: {result.intent}")
+        return result
+
+    def _call_tool(self, name: str, args: dict) -> Any:
+        # Restaurant tools return a compact view to the model; read the full rows from the stash
+        with tool_result_scope() as stash:
+            output = self.tools[name].invoke(args)
+        full = stash.latest(name)
+        return full if full is not None else json.loads(output)
+
+    def _handle_greeting(self, text: str, user_profile: Optional[dict]) -> Optional[FastPathResult]:
+        first_name = ((user_profile or {}).get("full_name") or "").split(" ")[0]
+        if _GREETING_RE.match(text):
+            hello = f"Hi {first_name}!" if first_name else "Hi there!"
+            return FastPathResult("greeting", (
+                f"{hello} I'm DineMate, your restaurant assistant. I can recommend restaurants, "
+                "tell you about cuisines and check table availability. What are you in the mood for?"
+            ))
+        if _THANKS_RE.match(text):
+            return FastPathResult("greeting", "You're welcome! Let me know if you need anything else for your next meal.")
+        if _BYE_RE.match(text):
+            return FastPathResult("greeting", "Goodbye! Enjoy your meal and see you next time. 👋")
+        return None
+
+    def _handle_cuisines(self, text: str, user_profile: Optional[dict]) -> Optional[FastPathResult]:
+        if not _CUISINES_RE.match(text):
+            return None
+        cuisines = self._call_tool("getAllCuisineTypes", {})
+        if not isinstance(cuisines, list) or not cuisines:
+            return None
+        listed = ", ".join(sorted(str(c) for c in cuisines))
+        return FastPathResult("cuisines", f"We currently have restaurants serving: {listed}. Which cuisine sounds good to you?")
+
+    def _handle_featured(self, text: str, user_profile: Optional[dict]) -> Optional[FastPathResult]:
+        if not _FEATURED_RE.match(text):
+            return None
+        restaurants = self._call_tool("getFeaturedRestaurants", {"limit": 5})
+        if not isinstance(restaurants, list) or not restaurants:
+            return None
+        lines = ["Here are our featured restaurants:"]
+        for r in restaurants[:5]:
+            details = [d for d in (r.get("cuisine_type"), f"★{r['average_rating']}" if r.get("average_rating") else None) if d]
+            lines.append(f"• {r.get('name')}" + (f" ({', '.join(details)})" if details else ""))
+        ids = [str(r["id"]) for r in restaurants[:5] if r.get("id")]
+        return FastPathResult("featured", "\n".join(lines) + "\nRESTAURANTS_TO_SHOW: " + ",".join(ids))
+
+    def _handle_availability(self, text: str, user_profile: Optional[dict]) -> Optional[FastPathResult]:
+        match = _AVAILABILITY_RE.match(text)
+        if not match:
+            return None
+        name = match.group("name").strip()
+        candidates = self._call_tool("getRestaurantsByName", {"query": name})
+        exact = [r for r in candidates if isinstance(r, dict) and (r.get("name") or "").strip().lower() == name] if isinstance(candidates, list) else []
+        if len(exact) != 1:
+            return None
+        restaurant = exact[0]
+
+        party = match.group("party_before") or match.group("party_after")
+        assumed_party = party is None
+        party_size = int(party) if party else int((user_profile or {}).get("preferred_party_size") or 2)
+        date_str = resolve_relative_date(match.group("when"), self.now())
+        day = datetime.strptime(date_str, "%Y-%m-%d").date()
+
+        slots = self._call_tool("getAvailableTimeSlots", {"restaurant_id": restaurant["id"], "date": date_str, "party_size": party_size})
+        if isinstance(slots, dict) and "ranges" in slots:
+            slots = expand_slot_ranges(slots)
+        if not isinstance(slots, list):
+            return None
+
+        when = f"{match.group('when')} ({day.strftime('%A, %B')} {day.day})"
+        party_text = f"{party_size} {'person' if party_size == 1 else 'people'}"
+        assumption = f" I assumed a party of {party_size}; let me know if that's different." if assumed_party else ""
+        if not slots:
+            return FastPathResult("availability", (
+                f"Sorry, {restaurant['name']} has no availability for {party_text} {when}. "
+                f"Would you like me to check another day or suggest similar restaurants?{assumption}"
+            ))
+        times = [s["time"] for s in slots if s.get("available")]
+        listed = ", ".join(times[:_MAX_LISTED_SLOTS])
+        if len(times) > _MAX_LISTED_SLOTS:
+            listed += f" and {len(times) - _MAX_LISTED_SLOTS} more"
+        return FastPathResult("availability", (
+            f"Good news! {restaurant['name']} has tables for {party_text} {when}. Available times: {listed}.{assumption}"
+        ))
@@ -1,17 +1,33 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import os
 import logging
-import jwt
 from supabase import create_client, Client
 from functools import wraps
+from agent_metrics import tool_metrics
+from model_router import AGENT_MODEL, MODEL_ROUTES, model_metrics
+from prompt_cache import prefix_cache
+from llm_scheduler import ANONYMOUS, AUTHENTICATED, Overloaded, llm_scheduler, staff_priority
+from tool_output import tool_output_stats
+from response_cache import response_cache
+from profile_cache import profile_cache
+from service_board import service_boards
+from speculative_prefetch import speculation_stats
+from supabase_coalescing import coalescing_stats
+from session_store import InvalidSession, SessionConflict, SessionStore, is_issued_session_id, new_session_id, parse_session_version
+from supabase_pool import get_client_pool
+from jwt_auth import InvalidToken, token_verifier, user_from_claims
+from chat_stream import format_sse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+if token_verifier.config_error():
+    logger.error(token_verifier.config_error())
+
 app = Flask(__name__)
 CORS(app)
 
@@ -22,6 +38,9 @@ limiter = Limiter(
     default_limits=["200 per day", "50 per hour"],
     storage_uri="memory://",
 )
+# Per-IP limits of the chat endpoints; asgi_app applies the same ones
+CHAT_RATE_LIMIT = "30 per minute"
+STAFF_CHAT_RATE_LIMIT = "50 per minute"
 
 # Request logging middleware
 @app.before_request
@@ -41,8 +60,12 @@ def after_request(response):
 
 # Authentication helper functions
 def create_authenticated_supabase_client(jwt_token):
-    """Create a Supabase client with user authentication"""
+    """Create a Supabase client with user authentication (a pooled per-token view when SUPABASE_POOL is on)"""
     try:
+        pool = get_client_pool()
+        if pool:
+            return pool.client_for(jwt_token)
+        
         url = os.getenv("EXPO_PUBLIC_SUPABASE_URL")
         key = os.getenv("EXPO_PUBLIC_SUPABASE_ANON_KEY")
         
@@ -69,39 +92,45 @@ def extract_jwt_token():
     return None
 
 def get_user_from_token(jwt_token):
-    """Extract user info from JWT token (without verification for now)"""
+    """Verified user info from a JWT (claims cached until exp), or None if the token doesn't verify"""
     try:
-        # For Supabase, we'll let the client handle token validation
-        # The token format contains user info we can extract
-        import base64
-        import json
-        
-        # Split JWT to get payload
-        parts = jwt_token.split('.')
-        if len(parts) != 3:
-            return None
-            
-        # Decode payload (add padding if needed)
-        payload = parts[1]
-        payload += '=' * (4 - len(payload) % 4)  # Add padding
-        decoded = base64.b64decode(payload)
-        user_data = json.loads(decoded)
-        
-        return {
-            'id': user_data.get('sub'),
-            'email': user_data.get('email'),
-            'role': user_data.get('role', 'authenticated')
-        }
-    except Exception as e:
-        logger.warning(f"Failed to extract user from token: {e}")
+        return user_from_claims(token_verifier.claims(jwt_token))
+    except InvalidToken as e:
+        logger.warning(f"Rejected JWT: {e}")
         return None
 
+def invalid_token_response():
+    return jsonify({
+        'error': 'Invalid or expired token',
+        'status': 'error'
+    }), 401
+
+def overloaded_body(e: Overloaded) -> dict:
+    return {
+        'error': 'Server busy',
+        'message': 'Too many requests are waiting for the assistant, please retry shortly',
+        'retry_after': e.retry_after,
+        'status': 'error'
+    }
+
+def shed_response(priority: str):
+    """503 with a retry hint when the model queue is too deep for a request of this priority (see llm_scheduler), else None"""
+    try:
+        llm_scheduler.admit(priority)
+    except Overloaded as e:
+        logger.warning(f"{e}; retry after {e.retry_after}s")
+        response = jsonify(overloaded_body(e))
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    return None
+
 # Simple request validation
 def validate_request():
     """Simple validation to ensure requests come from expected sources"""
-    user_agent = request.headers.get('User-Agent', '')
-    referer = request.headers.get('Referer', '')
-    
+    return is_allowed_user_agent(request.headers.get('User-Agent', ''))
+
+def is_allowed_user_agent(user_agent):
+    """True for the user agents validate_request accepts (shared with the ASGI app)"""
     # Allow requests from known frontends or mobile apps
     allowed_patterns = [
         'expo',  # Expo/React Native apps
@@ -151,12 +180,130 @@ def ratelimit_handler(e):
     
     return response, 429
 
+# Server-side chat sessions: clients send only the new message plus the session_version they last saw
+SERVER_SESSIONS_DEFAULT = os.getenv('CHAT_SESSION_MODE', 'client') == 'server'
+session_store = SessionStore()
+
+def memory_from_history(conversation_history, create_memory):
+    """Convert frontend conversation_history ([{role, content}]) into a new conversation memory"""
+    from langchain_core.messages import HumanMessage, AIMessage
+    
+    memory = create_memory(max_history=20)
+    for msg in conversation_history:
+        if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
+            content = msg['content'].strip()
+            if content:  # Only add non-empty messages
+                if msg['role'] == 'user':
+                    memory.add_message(HumanMessage(content=content))
+                elif msg['role'] == 'assistant':
+                    memory.add_message(AIMessage(content=content))
+    return memory
+
+def server_session_id(scope, requested_id, current_user):
+    """
+    The session_id a server-side session is stored under. Signed-in users name their
+    own sessions (default "default" / "staff_default"). Anonymous clients only use IDs
+    the server issued: without one a new ID is issued (returned as session_id), any
+    other ID raises InvalidSession.
+    """
+    if requested_id is not None and not isinstance(requested_id, str):
+        raise InvalidSession("session_id must be a string")
+    if current_user:
+        return requested_id or ('staff_default' if scope == 'staff' else 'default')
+    if not requested_id:
+        return new_session_id()
+    if not is_issued_session_id(requested_id):
+        raise InvalidSession("Anonymous sessions need a server-issued session_id; omit session_id to start one")
+    return requested_id
+
+def open_server_session(scope, session_id, current_user, data, create_memory):
+    """
+    Load the server-side session for this request; it belongs to the verified JWT
+    subject, or to the anonymous session_id (see server_session_id).
+    Returns (memory, session_key, version). Raises SessionConflict when the client's
+    session_version doesn't match (sending conversation_history resyncs the session)
+    and InvalidSession for a malformed session_version.
+    """
+    session_key = session_store.key(scope, current_user['id'] if current_user else None, session_id)
+    state, version = session_store.load(session_key)
+    conversation_history = data.get('conversation_history')
+    client_version = data.get('session_version')
+    if client_version is not None:
+        client_version = parse_session_version(client_version)
+    
+    if conversation_history and isinstance(conversation_history, list):
+        # Resync: the client's full history replaces whatever the server has
+        logger.info(f"Resyncing session {session_key} from {len(conversation_history)} client messages")
+        return memory_from_history(conversation_history, create_memory), session_key, version
+    
+    if client_version is not None and client_version != version:
+        raise SessionConflict(version)
+    
+    memory = create_memory(max_history=20)
+    if state:
+        memory.load_state(state)
+    return memory, session_key, version
+
+def invalid_session_body(error):
+    """JSON body of the 400 for an unacceptable session_id or session_version"""
+    return {
+        'error': 'Invalid session',
+        'message': str(error),
+        'status': 'error'
+    }
+
+def invalid_session_response(error):
+    return jsonify(invalid_session_body(error)), 400
+
+def session_conflict_response(session_id, error, response_text=None):
+    """409 telling the client to resync by sending its full conversation_history"""
+    return jsonify(session_conflict_body(session_id, error, response_text)), 409
+
+def session_conflict_body(session_id, error, response_text=None):
+    """JSON body of the 409 session conflict response"""
+    body = {
+        'error': 'Session diverged',
+        'message': 'Send the full conversation_history once to resync the session',
+        'session_id': session_id,
+        'session_version': error.current_version,
+        'status': 'error'
+    }
+    if response_text is not None:
+        body['response'] = response_text
+    return body
+
+def sse_response(events, session_id, memory=None, session_key=None, session_version=None, include_cards=False):
+    """
+    Stream chat events as text/event-stream. The server-side session (if any) is
+    saved when the final "done" event arrives; its new version rides on that event,
+    as do the restaurant cards when include_cards is set.
+    """
+    def generate():
+        for event in events:
+            if event['event'] == 'done':
+                event['session_id'] = session_id
+                if include_cards:
+                    event['restaurant_cards'] = restaurant_cards_for(event.get('restaurants_to_show') or [])
+                if session_key:
+                    try:
+                        event['session_version'] = session_store.save(session_key, memory.export_state(), session_version)
+                    except SessionConflict as e:
+                        yield format_sse({'event': 'error', 'error': 'Session diverged', 'session_id': session_id,
+                                          'session_version': e.current_version, 'response': event.get('response')})
+                        return
+            yield format_sse(event)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
 # Try to import AI functionality with graceful fallback
 AI_AVAILABLE = False
 STAFF_AI_AVAILABLE = False
 
 try:
-    from AI_Agent import chat_with_bot, getAllCuisineTypes, create_conversation_memory
+    from AI_Agent import chat_with_bot, stream_chat_with_bot, getAllCuisineTypes, create_conversation_memory, fast_path_router, prefetch_user_profile, restaurant_catalog, restaurant_cards_for
     AI_AVAILABLE = True
     logger.info("AI Agent imported successfully")
 except Exception as e:
@@ -164,7 +311,7 @@ except Exception as e:
     AI_AVAILABLE = False
 
 try:
-    from AI_Agent_Restaurant import chat_with_staff_bot, create_staff_conversation_memory
+    from AI_Agent_Restaurant import chat_with_staff_bot, stream_chat_with_staff_bot, create_staff_conversation_memory
     STAFF_AI_AVAILABLE = True
     logger.info("Restaurant Staff AI Agent imported successfully")
 except Exception as e:
@@ -198,7 +345,7 @@ def health_check():
     }), 200
 
 @app.route('/api/chat', methods=['POST'])
-@limiter.limit("30 per minute")  # Allow 30 chat requests per minute per IP
+@limiter.limit(CHAT_RATE_LIMIT)  # Allow 30 chat requests per minute per IP
 @require_valid_request
 def chat():
     """
@@ -226,6 +373,7 @@ def chat():
         session_id = data.get('session_id', 'default')
         user_id = data.get('user_id')  # Optional user ID for personalization
         conversation_history = data.get('conversation_history', [])  # New parameter
+        server_session = bool(data.get('server_session', SERVER_SESSIONS_DEFAULT))
         
         if not user_message:
             return jsonify({
@@ -239,37 +387,41 @@ def chat():
         current_user = None
         
         if jwt_token:
-            authenticated_client = create_authenticated_supabase_client(jwt_token)
             current_user = get_user_from_token(jwt_token)
-            if current_user:
-                logger.info(f"Authenticated request from user {current_user['id']} (email: {current_user.get('email', 'unknown')})")
-            else:
-                logger.warning("JWT token present but user extraction failed")
+            if not current_user:
+                return invalid_token_response()
+            authenticated_client = create_authenticated_supabase_client(jwt_token)
+            logger.info(f"Authenticated request from user {current_user['id']} (email: {current_user.get('email', 'unknown')})")
         else:
             logger.info("No JWT token provided, using anonymous access")
         
+        shed = shed_response(AUTHENTICATED if current_user else ANONYMOUS)
+        if shed:
+            return shed
+        
         logger.info(f"Received message from session {session_id} (user: {user_id}): {user_message}")
         logger.info(f"Conversation history length: {len(conversation_history) if conversation_history else 0}")
         
-        # Convert conversation history to LangChain message format if provided
+        # Load the profile while the conversation is restored; chat_with_bot joins the fetch
+        prefetch_user_profile(user_id, authenticated_client)
+        
+        # Server-side session mode: history lives in the session store
         memory = None
-        if conversation_history and isinstance(conversation_history, list):
+        session_key = None
+        session_version = None
+        if server_session:
+            try:
+                session_id = server_session_id('customer', data.get('session_id'), current_user)
+                memory, session_key, session_version = open_server_session('customer', session_id, current_user, data, create_conversation_memory)
+            except InvalidSession as e:
+                return invalid_session_response(e)
+            except SessionConflict as e:
+                logger.info(f"Session {session_id} diverged (server version {e.current_version})")
+                return session_conflict_response(session_id, e)
+        # Convert conversation history to LangChain message format if provided
+        elif conversation_history and isinstance(conversation_history, list):
             try:
-                from AI_Agent import create_conversation_memory
-                from langchain_core.messages import HumanMessage, AIMessage
-                
-                memory = create_conversation_memory(max_history=20)
-                
-                # Convert frontend message format to LangChain messages
-                for msg in conversation_history:
-                    if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                        content = msg['content'].strip()
-                        if content:  # Only add non-empty messages
-                            if msg['role'] == 'user':
-                                memory.add_message(HumanMessage(content=content))
-                            elif msg['role'] == 'assistant':
-                                memory.add_message(AIMessage(content=content))
-                        
+                memory = memory_from_history(conversation_history, create_conversation_memory)
                 logger.info(f"Converted {memory.get_context_size()} messages to conversation memory")
             except Exception as e:
                 logger.warning(f"Failed to process conversation history: {e}")
@@ -286,6 +438,12 @@ def chat():
         
         logger.info(f"AI response for session {session_id}: {ai_response}")
         
+        if session_key:
+            try:
+                session_version = session_store.save(session_key, memory.export_state(), session_version)
+            except SessionConflict as e:
+                return session_conflict_response(session_id, e, ai_response)
+        
         # Check if response contains restaurant recommendations
         restaurants_to_show = []
         response_text = ai_response
@@ -297,14 +455,20 @@ def chat():
                 restaurant_ids = [id.strip() for id in parts[1].strip().split(',') if id.strip()]
                 restaurants_to_show = restaurant_ids
         
-        return jsonify({
+        response_body = {
             'response': response_text,
             'restaurants_to_show': restaurants_to_show,
             'session_id': session_id,
             'user_id': user_id,
             'authenticated': jwt_token is not None,
             'status': 'success'
-        }), 200
+        }
+        if session_key:
+            response_body['session_version'] = session_version
+        # Card data for the shown restaurants, so the app needn't fetch each one
+        if data.get('include_cards'):
+            response_body['restaurant_cards'] = restaurant_cards_for(restaurants_to_show)
+        return jsonify(response_body), 200
         
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
@@ -314,20 +478,106 @@ def chat():
             'status': 'error'
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+@limiter.limit("30 per minute")
+@require_valid_request
+def chat_stream():
+    """
+    Streaming version of /api/chat (Server-Sent Events).
+    Emits progress, tool_start/tool_end and token events while the agent works,
+    then a final "done" event with response and restaurants_to_show.
+    """
+    try:
+        if not AI_AVAILABLE:
+            return jsonify({
+                'error': 'AI functionality not available',
+                'message': 'Please check environment variables and dependencies',
+                'status': 'error'
+            }), 503
+
+        data = request.get_json()
+        user_message = (data or {}).get('message', '').strip()
+        if not user_message:
+            return jsonify({
+                'error': 'Message is required',
+                'status': 'error'
+            }), 400
+        
+        session_id = data.get('session_id', 'default')
+        user_id = data.get('user_id')
+        conversation_history = data.get('conversation_history', [])
+        server_session = bool(data.get('server_session', SERVER_SESSIONS_DEFAULT))
+        
+        jwt_token = extract_jwt_token()
+        current_user = get_user_from_token(jwt_token) if jwt_token else None
+        if jwt_token and not current_user:
+            return invalid_token_response()
+        shed = shed_response(AUTHENTICATED if current_user else ANONYMOUS)
+        if shed:
+            return shed
+        authenticated_client = create_authenticated_supabase_client(jwt_token) if jwt_token else None
+        
+        logger.info(f"Received streaming message from session {session_id} (user: {user_id}): {user_message}")
+        prefetch_user_profile(user_id, authenticated_client)
+        
+        memory = None
+        session_key = None
+        session_version = None
+        if server_session:
+            try:
+                session_id = server_session_id('customer', data.get('session_id'), current_user)
+                memory, session_key, session_version = open_server_session('customer', session_id, current_user, data, create_conversation_memory)
+            except InvalidSession as e:
+                return invalid_session_response(e)
+            except SessionConflict as e:
+                return session_conflict_response(session_id, e)
+        elif conversation_history and isinstance(conversation_history, list):
+            memory = memory_from_history(conversation_history, create_conversation_memory)
+        
+        events = stream_chat_with_bot(
+            user_message,
+            memory=memory,
+            user_id=user_id,
+            authenticated_client=authenticated_client,
+            current_user=current_user
+        )
+        return sse_response(events, session_id, memory, session_key, session_version, include_cards=bool(data.get('include_cards')))
+        
+    except Exception as e:
+        logger.error(f"Error in chat stream endpoint: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e),
+            'status': 'error'
+        }), 500
+
 @app.route('/api/chat/reset', methods=['POST'])
 def chat_reset():
     """
     Reset conversation endpoint.
-    Provides acknowledgment for conversation reset requests.
-    Note: Actual conversation history is managed by the frontend.
+    Clears the server-side session (if any) for this session_id.
+    Pass scope='staff' to reset a staff chat session.
+    A signed-in user's session needs their valid JWT; without one only an anonymous
+    (server-issued) session_id can be cleared.
     """
     try:
-        data = request.get_json()
-        session_id = data.get('session_id', 'default') if data else 'default'
-        user_id = data.get('user_id') if data else None
-        clear_history = data.get('clear_history', True) if data else True
-        
-        logger.info(f"Conversation reset requested for session {session_id} (user: {user_id}), clear_history: {clear_history}")
+        data = request.get_json(silent=True) or {}
+        scope = 'staff' if data.get('scope') == 'staff' else 'customer'
+        session_id = data.get('session_id', 'staff_default' if scope == 'staff' else 'default')
+        user_id = data.get('user_id')
+        clear_history = data.get('clear_history', True)
+        
+        logger.info(f"Conversation reset requested for {scope} session {session_id} (user: {user_id}), clear_history: {clear_history}")
+        
+        if clear_history:
+            jwt_token = extract_jwt_token()
+            current_user = get_user_from_token(jwt_token) if jwt_token else None
+            if jwt_token and not current_user:
+                return invalid_token_response()
+            if current_user:
+                session_store.delete(session_store.key(scope, current_user['id'], session_id))
+            elif is_issued_session_id(session_id):
+                session_store.delete(session_store.key(scope, None, session_id))
         
         return jsonify({
             'message': 'Conversation reset successfully',
@@ -345,6 +595,23 @@ def chat_reset():
             'status': 'error'
         }), 500
 
+@app.route('/api/profile/invalidate', methods=['POST'])
+@limiter.limit("30 per minute")
+@require_valid_request
+def invalidate_profile():
+    """Drop the caller's cached profile after the app updates it (so the next chat sees the change)"""
+    jwt_token = extract_jwt_token()
+    current_user = get_user_from_token(jwt_token) if jwt_token else None
+    if not current_user:
+        return invalid_token_response()
+    
+    profile_cache.invalidate(current_user['id'])
+    logger.info(f"Profile cache invalidated for user {current_user['id']}")
+    return jsonify({
+        'user_id': current_user['id'],
+        'status': 'success'
+    }), 200
+
 @app.route('/api/restaurants/cuisines', methods=['GET'])
 @limiter.limit("10 per minute")  # Lower limit for cuisine endpoint
 def get_cuisine_types():
@@ -397,7 +664,7 @@ def get_cuisine_types():
         }), 500
 
 @app.route('/api/staff/chat', methods=['POST'])
-@limiter.limit("50 per minute")  # Allow more requests for staff
+@limiter.limit(STAFF_CHAT_RATE_LIMIT)  # Allow more requests for staff
 @require_valid_request
 def staff_chat():
     """
@@ -427,6 +694,7 @@ def staff_chat():
         session_id = data.get('session_id', 'staff_default')
         user_id = data.get('user_id')  # Staff user ID
         conversation_history = data.get('conversation_history', [])  # New parameter
+        server_session = bool(data.get('server_session', SERVER_SESSIONS_DEFAULT))
         
         if not user_message:
             return jsonify({
@@ -440,36 +708,40 @@ def staff_chat():
         current_user = None
         
         if jwt_token:
-            authenticated_client = create_authenticated_supabase_client(jwt_token)
             current_user = get_user_from_token(jwt_token)
-            if current_user:
-                logger.info(f"Authenticated staff request from user {current_user['id']} (email: {current_user.get('email', 'unknown')})")
-            else:
-                logger.warning("JWT token present but user extraction failed")
+            if not current_user:
+                return invalid_token_response()
+            authenticated_client = create_authenticated_supabase_client(jwt_token)
+            logger.info(f"Authenticated staff request from user {current_user['id']} (email: {current_user.get('email', 'unknown')})")
         else:
             logger.info("No JWT token provided for staff request")
         
+        # Only a verified staff member gets STAFF priority (never shed); without a JWT it queues as anonymous
+        priority = staff_priority(current_user)
+        shed = shed_response(priority)
+        if shed:
+            return shed
+        
         logger.info(f"Received staff message from session {session_id}: {user_message}")
         logger.info(f"Staff conversation history length: {len(conversation_history) if conversation_history else 0}")
         
-        # Convert conversation history to LangChain message format if provided
+        # Server-side session mode: history lives in the session store
         memory = None
-        if conversation_history and isinstance(conversation_history, list):
+        session_key = None
+        session_version = None
+        if server_session:
+            try:
+                session_id = server_session_id('staff', data.get('session_id'), current_user)
+                memory, session_key, session_version = open_server_session('staff', session_id, current_user, data, create_staff_conversation_memory)
+            except InvalidSession as e:
+                return invalid_session_response(e)
+            except SessionConflict as e:
+                logger.info(f"Staff session {session_id} diverged (server version {e.current_version})")
+                return session_conflict_response(session_id, e)
+        # Convert conversation history to LangChain message format if provided
+        elif conversation_history and isinstance(conversation_history, list):
             try:
-                from langchain_core.messages import HumanMessage, AIMessage
-                
-                memory = create_staff_conversation_memory(max_history=20)
-                
-                # Convert frontend message format to LangChain messages
-                for msg in conversation_history:
-                    if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                        content = msg['content'].strip()
-                        if content:  # Only add non-empty messages
-                            if msg['role'] == 'user':
-                                memory.add_message(HumanMessage(content=content))
-                            elif msg['role'] == 'assistant':
-                                memory.add_message(AIMessage(content=content))
-                        
+                memory = memory_from_history(conversation_history, create_staff_conversation_memory)
                 logger.info(f"Converted {memory.get_context_size()} messages to staff conversation memory")
             except Exception as e:
                 logger.warning(f"Failed to process staff conversation history: {e}")
@@ -481,19 +753,29 @@ def staff_chat():
             restaurant_id, 
             memory=memory,
             authenticated_client=authenticated_client,
-            current_user=current_user
+            current_user=current_user,
+            priority=priority
         )
         
         logger.info(f"Staff AI response for session {session_id}: {staff_response}")
         
-        return jsonify({
+        if session_key:
+            try:
+                session_version = session_store.save(session_key, memory.export_state(), session_version)
+            except SessionConflict as e:
+                return session_conflict_response(session_id, e, staff_response)
+        
+        response_body = {
             'response': staff_response,
             'session_id': session_id,
             'restaurant_id': restaurant_id,
             'user_id': user_id,
             'authenticated': jwt_token is not None,
             'status': 'success'
-        }), 200
+        }
+        if session_key:
+            response_body['session_version'] = session_version
+        return jsonify(response_body), 200
         
     except Exception as e:
         logger.error(f"Error in staff chat endpoint: {str(e)}")
@@ -503,6 +785,77 @@ def staff_chat():
             'status': 'error'
         }), 500
 
+@app.route('/api/staff/chat/stream', methods=['POST'])
+@limiter.limit("50 per minute")
+@require_valid_request
+def staff_chat_stream():
+    """Streaming version of /api/staff/chat (Server-Sent Events)."""
+    try:
+        if not STAFF_AI_AVAILABLE:
+            return jsonify({
+                'error': 'Staff AI functionality not available',
+                'message': 'Please check environment variables and dependencies',
+                'status': 'error'
+            }), 503
+
+        data = request.get_json()
+        user_message = (data or {}).get('message', '').strip()
+        if not user_message:
+            return jsonify({
+                'error': 'Message is required',
+                'status': 'error'
+            }), 400
+        
+        restaurant_id = data.get('restaurant_id')
+        session_id = data.get('session_id', 'staff_default')
+        user_id = data.get('user_id')
+        conversation_history = data.get('conversation_history', [])
+        server_session = bool(data.get('server_session', SERVER_SESSIONS_DEFAULT))
+        
+        jwt_token = extract_jwt_token()
+        current_user = get_user_from_token(jwt_token) if jwt_token else None
+        if jwt_token and not current_user:
+            return invalid_token_response()
+        priority = staff_priority(current_user)
+        shed = shed_response(priority)
+        if shed:
+            return shed
+        authenticated_client = create_authenticated_supabase_client(jwt_token) if jwt_token else None
+        
+        logger.info(f"Received streaming staff message from session {session_id}: {user_message}")
+        
+        memory = None
+        session_key = None
+        session_version = None
+        if server_session:
+            try:
+                session_id = server_session_id('staff', data.get('session_id'), current_user)
+                memory, session_key, session_version = open_server_session('staff', session_id, current_user, data, create_staff_conversation_memory)
+            except InvalidSession as e:
+                return invalid_session_response(e)
+            except SessionConflict as e:
+                return session_conflict_response(session_id, e)
+        elif conversation_history and isinstance(conversation_history, list):
+            memory = memory_from_history(conversation_history, create_staff_conversation_memory)
+        
+        events = stream_chat_with_staff_bot(
+            user_message,
+            restaurant_id,
+            memory=memory,
+            authenticated_client=authenticated_client,
+            current_user=current_user,
+            priority=priority
+        )
+        return sse_response(events, session_id, memory, session_key, session_version)
+        
+    except Exception as e:
+        logger.error(f"Error in staff chat stream endpoint: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e),
+            'status': 'error'
+        }), 500
+
 @app.route('/api/test', methods=['POST'])
 @require_valid_request
 def test_endpoint():
@@ -563,7 +916,21 @@ def admin_stats():
                 'security_headers': True,
                 'request_logging': True,
                 'admin_protection': True
-            }
+            },
+            'tool_metrics': tool_metrics.snapshot(),
+            'model_routing': {'default_model': AGENT_MODEL, 'routes': MODEL_ROUTES, 'models': model_metrics.snapshot()},
+            'prompt_cache': prefix_cache.snapshot(),
+            'llm_scheduler': llm_scheduler.snapshot(),
+            'tool_output': tool_output_stats.snapshot(),
+            'response_cache': response_cache.snapshot(),
+            'supabase_coalescing': coalescing_stats.snapshot(),
+            'supabase_pool': get_client_pool().snapshot() if get_client_pool() else None,
+            'jwt_verification': token_verifier.snapshot(),
+            'profile_cache': profile_cache.snapshot(),
+            'speculative_prefetch': speculation_stats.snapshot(),
+            'restaurant_catalog': restaurant_catalog.snapshot() if AI_AVAILABLE else None,
+            'service_board': service_boards.snapshot(),
+            'fast_path': fast_path_router.stats.snapshot() if AI_AVAILABLE else None
         }), 200
         
     except Exception as e:
@@ -574,6 +941,30 @@ def admin_stats():
             'status': 'error'
         }), 500
 
+@app.route('/api/admin/cache/invalidate', methods=['POST'])
+@limiter.limit("5 per minute")
+def admin_invalidate_cache():
+    """Drop cached chat responses after restaurant catalog changes - protect this in production"""
+    admin_key = request.headers.get('X-Admin-Key')
+    expected_key = os.getenv('ADMIN_KEY', 'admin123')  # Change this in production
+    
+    if admin_key != expected_key:
+        return jsonify({
+            'error': 'Unauthorized',
+            'status': 'error'
+        }), 401
+    
+    response_cache.invalidate_catalog()
+    if AI_AVAILABLE:
+        restaurant_catalog.invalidate()
+    # Table layouts are restaurant details too
+    service_boards.resync()
+    logger.info(f"Response cache invalidated (catalog version {response_cache.catalog_version})")
+    return jsonify({
+        'catalog_version': response_cache.catalog_version,
+        'status': 'success'
+    }), 200
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
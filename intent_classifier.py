@@ -0,0 +1,105 @@
+"""
+Compiled intent classifier for customer messages.
+
+Replaces the ad-hoc keyword lists in chat_with_bot. Each marker group is
+compiled once into a single word-boundary regex, so "hi" no longer matches
+"this" and "time" no longer matches "sometimes".
+
+The primary intent selects the agent profile (prompt + tool subset):
+- availability: a specific booking/slot question
+- discovery:    finding or recommending restaurants
+- small_talk:   greetings, thanks, "what can you do"
+- full:         mixed or unrecognised requests (full prompt, all tools)
+
+The three restricted profiles can't answer what their tools don't cover, so
+anything ambiguous goes to full: any discovery marker together with an
+availability marker ("find a restaurant for tonight"), a greeting followed by
+more ("hey, what about the second one?"), and every message of a conversation
+with history (a follow-up can refer to anything said before).
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterable
+
+
+def _compile_markers(markers: Iterable[str]) -> "re.Pattern[str]":
+    alternation = "|".join(sorted((re.escape(m).replace(r"\ ", r"\s+") for m in markers), key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+
+
+_AVAILABILITY_RE = _compile_markers([
+    "available", "availability", "slot", "slots", "time", "times", "book", "booking", "reserve", "reservation",
+    "today", "tonight", "tomorrow", "opening", "openings", "free", "this weekend", "next week",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+])
+# "table for 4", "for 2 people", "at 8pm", "20:30"
+_PARTY_OR_CLOCK_RE = re.compile(
+    r"\b(?:table\s+for\s+\d{1,2}|for\s+\d{1,2}\s+(?:people|persons|guests|pax)|at\s+\d{1,2}(?::\d{2})?\s*(?:am|pm)?|\d{1,2}:\d{2})\b",
+    re.IGNORECASE,
+)
+
+# Strong markers: the user wants suggestions, not a specific restaurant
+_DISCOVERY_STRONG_RE = _compile_markers([
+    "recommend", "recommendation", "recommendations", "suggest", "suggestion", "suggestions", "best", "top",
+    "options", "looking for", "want to eat", "where to", "where should", "near", "around", "featured",
+    "cuisine", "cuisines", "italian", "chinese", "mexican", "indian", "japanese", "lebanese", "french",
+    "sushi", "pizza", "burger", "burgers", "seafood", "steak", "vegan", "vegetarian", "romantic",
+    "outdoor", "cheap", "fancy", "rated",
+])
+# Weak markers: also appear in availability questions about a named restaurant
+_DISCOVERY_WEAK_RE = _compile_markers([
+    "find", "show", "restaurant", "restaurants", "places", "place", "dinner", "lunch", "breakfast", "food",
+])
+
+_GREETING_RE = _compile_markers([
+    "hi", "hello", "hey", "good morning", "good afternoon", "good evening", "how are you",
+    "what can you do", "help", "thanks", "thank you", "bye", "goodbye",
+])
+# Words that may accompany a greeting without making it a request
+_GREETING_FILLER = {
+    "there", "again", "so", "much", "very", "and", "a", "lot", "for", "the", "your", "all", "ok", "okay",
+    "please", "bot", "assistant", "everyone", "today", "doing", "great", "good", "cool", "nice", "you",
+}
+
+
+def _only_greeting(text: str) -> bool:
+    """True when nothing but greetings and filler words is left once the greeting markers are removed."""
+    rest = re.findall(r"[a-z']+|\d+", _GREETING_RE.sub(" ", text.lower()))
+    return all(word in _GREETING_FILLER for word in rest)
+
+
+@dataclass(frozen=True)
+class IntentResult:
+    intent: str
+    is_availability: bool
+    is_discovery: bool
+    is_greeting: bool
+
+    @property
+    def needs_tools(self) -> bool:
+        return self.is_availability or self.is_discovery
+
+
+def classify_intent(user_input: str, has_history: bool = False) -> IntentResult:
+    """Classify a customer message into a primary intent plus marker flags.
+
+    has_history: the conversation has earlier turns, so only the full profile is used.
+    """
+    text = user_input or ""
+    is_availability = bool(_AVAILABILITY_RE.search(text) or _PARTY_OR_CLOCK_RE.search(text))
+    strong_discovery = bool(_DISCOVERY_STRONG_RE.search(text))
+    is_discovery = strong_discovery or bool(_DISCOVERY_WEAK_RE.search(text))
+    is_greeting = bool(_GREETING_RE.search(text))
+
+    if has_history or (is_availability and is_discovery):
+        intent = "full"
+    elif is_availability:
+        intent = "availability"
+    elif is_discovery:
+        intent = "discovery"
+    elif is_greeting and _only_greeting(text):
+        intent = "small_talk"
+    else:
+        intent = "full"
+    return IntentResult(intent, is_availability, is_discovery, is_greeting)
@@ -0,0 +1,144 @@
+"""
+Verified JWT claims for the chat endpoints.
+
+TokenVerifier checks a Supabase access token's signature, expiry and audience:
+HS256 tokens against the project JWT secret, asymmetric ones (RS256/ES256)
+against the project's JWKS, which PyJWKClient caches locally. Verified claims
+are cached per token until exp, so repeated requests from one session cost a
+dict lookup.
+
+Env:
+- SUPABASE_JWT_SECRET:  project JWT secret (HS256 tokens)
+- SUPABASE_JWKS_URL:    defaults to <EXPO_PUBLIC_SUPABASE_URL>/auth/v1/.well-known/jwks.json
+- JWT_AUDIENCE:         expected aud claim (default "authenticated")
+- JWT_JWKS_CACHE_SECONDS: how long fetched signing keys are reused (default 600)
+- JWT_VERIFY:           1 (default) / 0 to only decode tokens (local development)
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import jwt
+
+from caching import TTLCache
+
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "authenticated")
+JWT_JWKS_CACHE_SECONDS = float(os.getenv("JWT_JWKS_CACHE_SECONDS", "600"))
+JWT_VERIFY = os.getenv("JWT_VERIFY", "1") == "1"
+
+_ASYMMETRIC_ALGORITHMS = ("RS256", "ES256", "EdDSA")
+# Accept tokens this many seconds past exp (clock skew)
+_LEEWAY_SECONDS = 5
+
+
+class InvalidToken(Exception):
+    """The token is malformed, expired, or its signature doesn't verify."""
+
+
+def _default_jwks_url() -> Optional[str]:
+    url = os.getenv("SUPABASE_JWKS_URL")
+    if url:
+        return url
+    project_url = os.getenv("EXPO_PUBLIC_SUPABASE_URL")
+    return f"{project_url.rstrip('/')}/auth/v1/.well-known/jwks.json" if project_url else None
+
+
+class TokenVerifier:
+    """Verifies access tokens and caches their claims until they expire."""
+
+    def __init__(self, secret: Optional[str] = SUPABASE_JWT_SECRET, jwks_url: Optional[str] = None,
+                 audience: Optional[str] = JWT_AUDIENCE, verify: bool = JWT_VERIFY,
+                 max_tokens: int = 4096, clock: Callable[[], float] = time.time):
+        self.secret = secret
+        self.jwks_url = jwks_url or _default_jwks_url()
+        self.audience = audience
+        self.verify = verify
+        self.clock = clock
+        self._claims = TTLCache(maxsize=max_tokens, ttl=300, clock=clock)
+        self._jwks_client: Optional[jwt.PyJWKClient] = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "verified": 0, "rejected": 0}
+
+    def config_error(self) -> Optional[str]:
+        """Why HS256 tokens will all be rejected, or None when verification can work."""
+        if self.verify and not self.secret:
+            return ("JWT_VERIFY=1 but SUPABASE_JWT_SECRET is not set: every HS256 access token (the Supabase "
+                    "default) will be rejected with 401. Set SUPABASE_JWT_SECRET to the project's JWT secret "
+                    "(Project Settings > API), or JWT_VERIFY=0 for local development only.")
+        return None
+
+    def _signing_key(self, token: str, algorithm: str) -> Any:
+        if algorithm == "HS256":
+            if not self.secret:
+                raise InvalidToken("HS256 token but SUPABASE_JWT_SECRET is not set")
+            return self.secret
+        if algorithm in _ASYMMETRIC_ALGORITHMS:
+            if not self.jwks_url:
+                raise InvalidToken(f"{algorithm} token but no JWKS URL is configured")
+            if self._jwks_client is None:
+                with self._lock:
+                    if self._jwks_client is None:
+                        self._jwks_client = jwt.PyJWKClient(self.jwks_url, cache_keys=True, lifespan=JWT_JWKS_CACHE_SECONDS)
+            return self._jwks_client.get_signing_key_from_jwt(token).key
+        raise InvalidToken(f"Unsupported token algorithm {algorithm}")
+
+    def _decode(self, token: str) -> Dict[str, Any]:
+        if not self.verify:
+            return jwt.decode(token, options={"verify_signature": False})
+        algorithm = jwt.get_unverified_header(token).get("alg", "")
+        return jwt.decode(
+            token,
+            self._signing_key(token, algorithm),
+            algorithms=[algorithm],
+            audience=self.audience,
+            leeway=_LEEWAY_SECONDS,
+            options={"require": ["exp", "sub"], "verify_aud": bool(self.audience)},
+        )
+
+    def claims(self, token: str) -> Dict[str, Any]:
+        """Verified claims for token; raises InvalidToken."""
+        cached = self._claims.get(token)
+        if cached is not None:
+            self._count(hits=1)
+            return cached
+        try:
+            claims = self._decode(token)
+        except InvalidToken:
+            self._count(rejected=1)
+            raise
+        except Exception as e:
+            self._count(rejected=1)
+            raise InvalidToken(str(e)) from e
+        ttl = float(claims.get("exp", 0)) - self.clock()
+        if ttl > 0:
+            self._claims.set(token, claims, ttl=ttl)
+        self._count(verified=1)
+        return claims
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["cached_tokens"] = len(self._claims)
+        stats["verify"] = self.verify
+        stats["config_error"] = self.config_error()
+        return stats
+
+
+def user_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """The current_user dict the agents expect."""
+    return {
+        'id': claims.get('sub'),
+        'email': claims.get('email'),
+        'role': claims.get('role', 'authenticated')
+    }
+
+
+token_verifier = TokenVerifier()
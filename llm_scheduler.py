@@ -0,0 +1,204 @@
+"""
+Process-wide scheduler for model calls.
+
+Customer and staff chats share one Gemini quota and one pool of workers.
+LLMScheduler runs at most LLM_MAX_CONCURRENCY model calls at a time; the rest
+wait in a priority queue: staff first, then authenticated customers, then
+anonymous ones (FIFO within a class). Every agent model call goes through it
+(agent_graph.invoke_model / ainvoke_model), from threads and coroutines alike.
+
+When the queue is deep, new low-priority requests are turned away up front
+(admit() raises Overloaded, the API answers 503 with Retry-After) instead of
+joining a queue they would wait minutes in: anonymous requests once
+LLM_SHED_QUEUE_ANONYMOUS calls are waiting, authenticated ones at
+LLM_SHED_QUEUE_AUTHENTICATED. Staff requests are never shed, so only a staff
+chat with a verified JWT runs as STAFF (staff_priority); without one it is
+ANONYMOUS. The retry hint is the time the current queue takes to drain at the
+recent average call length.
+
+Queue time per class, shed counts and queue depth are exposed through the
+admin stats endpoint.
+
+Env:
+- LLM_MAX_CONCURRENCY:          concurrent model calls (default 8; 0 disables the scheduler)
+- LLM_SHED_QUEUE_ANONYMOUS:     queued calls at which anonymous requests are shed (default 8; 0 never)
+- LLM_SHED_QUEUE_AUTHENTICATED: queued calls at which authenticated requests are shed (default 32; 0 never)
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from agent_metrics import MetricsRegistry
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_SHED_QUEUE_ANONYMOUS = int(os.getenv("LLM_SHED_QUEUE_ANONYMOUS", "8"))
+LLM_SHED_QUEUE_AUTHENTICATED = int(os.getenv("LLM_SHED_QUEUE_AUTHENTICATED", "32"))
+
+STAFF = "staff"
+AUTHENTICATED = "authenticated"
+ANONYMOUS = "anonymous"
+
+# Lower runs first
+PRIORITIES = {STAFF: 0, AUTHENTICATED: 1, ANONYMOUS: 2}
+
+
+def staff_priority(current_user: Optional[dict]) -> str:
+    """Priority of a staff chat: STAFF for a verified user, ANONYMOUS without one (never shed must be earned)."""
+    return STAFF if current_user and current_user.get("id") else ANONYMOUS
+
+
+class Overloaded(Exception):
+    """The model queue is too deep to admit a request of this priority."""
+
+    def __init__(self, priority: str, queued: int, retry_after: int):
+        super().__init__(f"LLM queue full ({queued} waiting); {priority} request shed")
+        self.priority = priority
+        self.queued = queued
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.granted = False
+        self.abandoned = False
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class LLMScheduler:
+    """Bounded, prioritized model-call concurrency with load shedding."""
+
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENCY, shed_queue: Optional[Dict[str, int]] = None):
+        self.max_concurrent = max_concurrent
+        self.shed_queue = shed_queue if shed_queue is not None else {
+            ANONYMOUS: LLM_SHED_QUEUE_ANONYMOUS, AUTHENTICATED: LLM_SHED_QUEUE_AUTHENTICATED}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queue: List[tuple] = []
+        self._order = itertools.count()
+        # Average seconds a call holds its slot (exponential moving average), for the retry hint
+        self._avg_call_seconds = 2.0
+        self.queue_times = MetricsRegistry()
+        self._stats = {"admitted": {p: 0 for p in PRIORITIES}, "shed": {p: 0 for p in PRIORITIES}, "max_queued": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def _queued(self) -> int:
+        return sum(1 for _, _, w in self._queue if not w.abandoned)
+
+    def _retry_after(self, queued: int) -> int:
+        return max(1, math.ceil((queued + 1) * self._avg_call_seconds / max(1, self.max_concurrent)))
+
+    def admit(self, priority: str):
+        """Admit a new request of priority, or raise Overloaded if the queue is too deep for it."""
+        if not self.enabled:
+            return
+        limit = self.shed_queue.get(priority, 0)
+        with self._lock:
+            queued = self._queued()
+            if limit and queued >= limit:
+                self._stats["shed"][priority] += 1
+                raise Overloaded(priority, queued, self._retry_after(queued))
+            self._stats["admitted"][priority] += 1
+
+    def _enqueue(self, priority: str, waiter: _Waiter) -> bool:
+        """Take a free slot (True) or queue the waiter (False). Caller holds the lock."""
+        if self._running < self.max_concurrent and not self._queued():
+            self._running += 1
+            waiter.granted = True
+            return True
+        heapq.heappush(self._queue, (PRIORITIES.get(priority, PRIORITIES[ANONYMOUS]), next(self._order), waiter))
+        self._stats["max_queued"] = max(self._stats["max_queued"], self._queued())
+        return False
+
+    def _release(self, held_seconds: float):
+        with self._lock:
+            self._avg_call_seconds = 0.8 * self._avg_call_seconds + 0.2 * held_seconds
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if not waiter.abandoned:
+                    # The slot passes straight to the next waiter
+                    waiter.grant()
+                    return
+            self._running -= 1
+
+    @contextmanager
+    def slot(self, priority: str) -> Iterator[None]:
+        """Hold one model-call slot for the block, waiting by priority for it."""
+        if not self.enabled:
+            yield
+            return
+        waiter = _Waiter()
+        queued_at = time.perf_counter()
+        with self._lock:
+            granted = self._enqueue(priority, waiter)
+        if not granted:
+            waiter.event.wait()
+        self.queue_times.record(priority, (time.perf_counter() - queued_at) * 1000)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def aslot(self, priority: str):
+        """Async slot(): the coroutine awaits its turn instead of blocking a thread."""
+        if not self.enabled:
+            yield
+            return
+        waiter = _Waiter(asyncio.get_running_loop())
+        queued_at = time.perf_counter()
+        with self._lock:
+            granted = self._enqueue(priority, waiter)
+        if not granted:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    waiter.abandoned = True
+                    handed_over = waiter.granted
+                if handed_over:
+                    self._release(0.0)
+                raise
+        self.queue_times.record(priority, (time.perf_counter() - queued_at) * 1000)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = {
+                "max_concurrent": self.max_concurrent,
+                "running": self._running,
+                "queued": self._queued(),
+                "max_queued": self._stats["max_queued"],
+                "admitted": dict(self._stats["admitted"]),
+                "shed": dict(self._stats["shed"]),
+                "avg_call_seconds": round(self._avg_call_seconds, 2),
+            }
+        stats["queue_ms"] = self.queue_times.snapshot()
+        return stats
+
+
+# Shared by both agents and both APIs
+llm_scheduler = LLMScheduler()
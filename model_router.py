@@ -0,0 +1,224 @@
+"""
+Per-step model routing for the agent graphs.
+
+Every agent step used to go to the same model, including cheap steps such as
+turning a tool result into a one-sentence answer. RoutedChatModel stands in for
+the chat model of a graph and picks a model per call from a routing policy:
+
+- route keys are the graph step ("respond": no tool results yet this turn,
+  "after_tools": the last message is a tool result) and the customer intent
+  profile ("small_talk", "discovery", ...; see AI_Agent.AGENT_PROFILES), plus
+  "memory_summary" for the conversation memory summarizer
+- a key may be prefixed with the agent ("staff.after_tools"); the most
+  specific match wins: <agent>.<profile>, <profile>, <agent>.<step>, <step>
+- anything without a route goes to the default model
+
+Each call records latency and input (of which cached, see prompt_cache) and
+output tokens per model (usage_metadata when the backend reports it, otherwise
+agent_metrics.estimate_tokens) in model_metrics, exposed through the admin
+stats endpoint, and adds them to the request's ChatRequest.tokens.
+
+Env:
+- AGENT_MODEL:  default model (default "gemini-2.5-flash")
+- MODEL_ROUTES: comma-separated route=model pairs, e.g.
+  "after_tools=gemini-2.5-flash-lite,small_talk=gemini-2.5-flash-lite" (default: none)
+"""
+
+import copy
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import SystemMessage, ToolMessage
+
+from agent_metrics import LatencyStats, estimate_tokens
+from prompt_cache import PrefixCache, cached_request_messages, prefix_cache, supports_context_cache
+from request_context import current_request
+
+AGENT_MODEL = os.getenv("AGENT_MODEL", "gemini-2.5-flash")
+
+
+def parse_routes(spec: Optional[str]) -> Dict[str, str]:
+    """Parse "route=model,route=model" into a dict; malformed pairs are skipped."""
+    routes = {}
+    for pair in (spec or "").split(","):
+        route, _, model = pair.partition("=")
+        if route.strip() and model.strip():
+            routes[route.strip().lower()] = model.strip()
+    return routes
+
+
+MODEL_ROUTES = parse_routes(os.getenv("MODEL_ROUTES"))
+
+
+def _text(message: Any) -> str:
+    content = getattr(message, "content", "")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+def _usage(messages: List[Any], response: Any, prefix_tokens: int) -> Tuple[int, int, int]:
+    """(input, cached input, output) tokens of a call; prefix_tokens is what a live prefix cache covered."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("input_tokens") is not None:
+        input_tokens, output_tokens = int(usage.get("input_tokens") or 0), int(usage.get("output_tokens") or 0)
+    else:
+        output = _text(response) + "".join(str(c.get("args", "")) for c in getattr(response, "tool_calls", None) or [])
+        input_tokens, output_tokens = sum(estimate_tokens(_text(m)) for m in messages), estimate_tokens(output)
+    cache_read = (usage.get("input_token_details") or {}).get("cache_read")
+    cached = int(cache_read) if cache_read is not None else min(prefix_tokens, input_tokens)
+    return input_tokens, cached, output_tokens
+
+
+class ModelMetrics:
+    """Thread-safe latency, token and route counts per model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: Dict[str, LatencyStats] = {}
+        self._usage: Dict[str, dict] = {}
+
+    def record(self, model: str, route: str, elapsed_ms: float, input_tokens: int = 0, cached_input_tokens: int = 0,
+               output_tokens: int = 0, ok: bool = True):
+        with self._lock:
+            if model not in self._latency:
+                self._latency[model] = LatencyStats()
+                self._usage[model] = {"input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0, "routes": {}}
+            self._latency[model].record(elapsed_ms, ok=ok)
+            usage = self._usage[model]
+            usage["input_tokens"] += input_tokens
+            usage["cached_input_tokens"] += cached_input_tokens
+            usage["output_tokens"] += output_tokens
+            usage["routes"][route] = usage["routes"].get(route, 0) + 1
+        request = current_request()
+        if request is not None:
+            request.tokens.add(input_tokens, cached_input_tokens, output_tokens)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                model: {**stats.snapshot(), **{k: v for k, v in self._usage[model].items() if k != "routes"},
+                        "routes": dict(self._usage[model]["routes"])}
+                for model, stats in self._latency.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._latency.clear()
+            self._usage.clear()
+
+
+# Shared by both agents
+model_metrics = ModelMetrics()
+
+
+class RoutedChatModel:
+    """Chat model facade that sends each call to the model its route selects.
+
+    factory(name) builds the chat model for a model name (one per name, built up
+    front). bind_tools() and for_profile() return routed copies, so a graph binds
+    its tools and profile once, as with a plain chat model. Calls that start with
+    a system prompt use its context cache when there is a live one (prompt_cache).
+    """
+
+    def __init__(self, factory: Callable[[str], Any], agent: str = "customer", default_model: str = AGENT_MODEL,
+                 routes: Optional[Dict[str, str]] = None, metrics: ModelMetrics = model_metrics,
+                 prompt_cache: PrefixCache = prefix_cache):
+        self.agent = agent
+        self.default_model = default_model
+        self.routes = dict(MODEL_ROUTES if routes is None else routes)
+        self.metrics = metrics
+        self.prompt_cache = prompt_cache
+        self.profile: Optional[str] = None
+        self._base = {name: factory(name) for name in {default_model, *self.routes.values()}}
+        self._models = dict(self._base)
+        self._tools: List[Any] = []
+
+    def bind_tools(self, tools: List[Any]) -> "RoutedChatModel":
+        bound = copy.copy(self)
+        bound._models = {name: model.bind_tools(tools) for name, model in self._base.items()}
+        bound._tools = list(tools)
+        return bound
+
+    def for_profile(self, profile: Optional[str]) -> "RoutedChatModel":
+        """Copy that also routes on an intent profile (or "memory_summary")."""
+        routed = copy.copy(self)
+        routed.profile = profile
+        return routed
+
+    def route_for(self, messages: List[Any]) -> Tuple[str, str]:
+        """(route, model name) for a call with these messages."""
+        step = "after_tools" if messages and isinstance(messages[-1], ToolMessage) else "respond"
+        keys = ([f"{self.agent}.{self.profile}", self.profile] if self.profile else []) + [f"{self.agent}.{step}", step]
+        for key in keys:
+            if key in self.routes:
+                return key, self.routes[key]
+        return step, self.default_model
+
+    def _prepare(self, name: str, messages: List[Any]) -> Tuple[Any, List[Any], dict, int]:
+        """(model, messages, call kwargs, cached prefix tokens) for a call, using the prefix cache when it is live."""
+        base = self._base[name]
+        cache = self.prompt_cache
+        cacheable = cache.mode == "simulate" or (cache.mode == "provider" and supports_context_cache(base))
+        if not (cacheable and messages and isinstance(messages[0], SystemMessage) and isinstance(messages[0].content, str)):
+            return self._models[name], messages, {}, 0
+        handle, tokens = cache.handle(name, base, messages[0].content, self._tools)
+        if handle is None:
+            return self._models[name], messages, {}, 0
+        if cache.mode == "simulate":
+            return self._models[name], messages, {}, tokens
+        return base, cached_request_messages(messages), {"cached_content": handle}, tokens
+
+    def invoke(self, messages: List[Any], *args, **kwargs) -> Any:
+        route, name = self.route_for(messages)
+        model, call_messages, cache_kwargs, cached = self._prepare(name, messages)
+        start = time.perf_counter()
+        try:
+            response = model.invoke(call_messages, *args, **cache_kwargs, **kwargs)
+        except Exception:
+            self.metrics.record(name, route, (time.perf_counter() - start) * 1000, ok=False)
+            raise
+        self.metrics.record(name, route, (time.perf_counter() - start) * 1000, *_usage(messages, response, cached))
+        return response
+
+    async def ainvoke(self, messages: List[Any], *args, **kwargs) -> Any:
+        route, name = self.route_for(messages)
+        model, call_messages, cache_kwargs, cached = self._prepare(name, messages)
+        start = time.perf_counter()
+        try:
+            response = await model.ainvoke(call_messages, *args, **cache_kwargs, **kwargs)
+        except Exception:
+            self.metrics.record(name, route, (time.perf_counter() - start) * 1000, ok=False)
+            raise
+        self.metrics.record(name, route, (time.perf_counter() - start) * 1000, *_usage(messages, response, cached))
+        return response
+
+    def stream(self, messages: List[Any], *args, **kwargs):
+        route, name = self.route_for(messages)
+        model, call_messages, cache_kwargs, cached = self._prepare(name, messages)
+        start = time.perf_counter()
+        merged = None
+        try:
+            for chunk in model.stream(call_messages, *args, **cache_kwargs, **kwargs):
+                merged = chunk if merged is None else merged + chunk
+                yield chunk
+        except Exception:
+            self.metrics.record(name, route, (time.perf_counter() - start) * 1000, ok=False)
+            raise
+        self.metrics.record(name, route, (time.perf_counter() - start) * 1000, *_usage(messages, merged, cached))
+
+    async def astream(self, messages: List[Any], *args, **kwargs):
+        route, name = self.route_for(messages)
+        model, call_messages, cache_kwargs, cached = self._prepare(name, messages)
+        start = time.perf_counter()
+        merged = None
+        try:
+            async for chunk in model.astream(call_messages, *args, **cache_kwargs, **kwargs):
+                merged = chunk if merged is None else merged + chunk
+                yield chunk
+        except Exception:
+            self.metrics.record(name, route, (time.perf_counter() - start) * 1000, ok=False)
+            raise
+        self.metrics.record(name, route, (time.perf_counter() - start) * 1000, *_usage(messages, merged, cached))
@@ -0,0 +1,95 @@
+"""
+Per-user profile cache for fetch_user_profile.
+
+The customer agent reads the caller's profile before its first model call on
+every request that carries a user_id. ProfileCache keeps each profile for a
+short TTL, keyed by user and RLS identity (client_identity), so a profile read
+under one user's token is never served to a different caller. Concurrent
+fetches for the same key share one query (SingleFlight, also with the cache
+disabled), which lets the API start the fetch early and the agent join it.
+
+invalidate(user_id) drops a user's cached profile (after a profile edit); the
+app calls it through POST /api/profile/invalidate.
+
+Env:
+- PROFILE_CACHE_TTL:       seconds (default 60; 0 disables)
+- PROFILE_CACHE_MAX_USERS: LRU size (default 5000)
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from caching import SingleFlight, TTLCache
+from supabase_coalescing import client_identity
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+PROFILE_CACHE_MAX_USERS = int(os.getenv("PROFILE_CACHE_MAX_USERS", "5000"))
+
+# Stored for users without a profile row, so they aren't re-queried every request
+_NO_PROFILE: Dict[str, Any] = {}
+
+
+class ProfileCache:
+    """TTL cache of user profiles with per-user invalidation and hit statistics."""
+
+    def __init__(self, ttl: float = PROFILE_CACHE_TTL, max_users: int = PROFILE_CACHE_MAX_USERS):
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=max_users, ttl=ttl or 1)
+        # Bumped by invalidate(); part of the key, so older entries are never read again
+        self._generations = TTLCache(maxsize=max_users, ttl=ttl or 1)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "coalesced": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _key(self, user_id: str, client: Any) -> tuple:
+        return (user_id, client_identity(client), self._generations.get(user_id, 0))
+
+    def get_or_fetch(self, user_id: str, client: Any, fetch: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """Cached profile for user_id as seen by client; fetch() returns the row or None and raises on errors."""
+        key = self._key(user_id, client)
+        cached = self._cache.get(key) if self.enabled else None
+        if cached is not None:
+            self._count(hits=1)
+            return cached or None
+
+        def load():
+            profile = fetch()
+            if self.enabled:
+                self._cache.set(key, profile or _NO_PROFILE)
+            return profile
+
+        profile, shared = self._flight.do(key, load)
+        self._count(**({"coalesced": 1} if shared else {"misses": 1}))
+        return profile
+
+    def invalidate(self, user_id: str):
+        """Forget user_id's profile for every client identity."""
+        with self._lock:
+            self._generations.set(user_id, self._generations.get(user_id, 0) + 1)
+            self._stats["invalidations"] += 1
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["coalesced"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["coalesced"]) / lookups, 3) if lookups else 0.0
+        stats["enabled"] = self.enabled
+        stats["ttl"] = self.ttl
+        stats["cached"] = len(self._cache)
+        return stats
+
+    def clear(self):
+        self._cache.clear()
+
+
+profile_cache = ProfileCache()
@@ -0,0 +1,175 @@
+"""
+Context caching for the agents' static prompt prefix.
+
+Every model call of both agents starts with the same large system prompt and
+tool declarations. PrefixCache keeps one provider-side context cache per
+(model, system prompt, tools) prefix, and RoutedChatModel (model_router) sends
+calls that start with a cached prefix as "cached_content" plus the rest of the
+conversation. The cache is created in the background on first use (that call
+goes out uncached) and its TTL is extended shortly before it expires;
+prefixes the provider won't cache (too short, unsupported model, API error)
+are retried after PROMPT_CACHE_RETRY_SECONDS and sent uncached meanwhile.
+
+Only prefixes of at least PROMPT_CACHE_MIN_TOKENS are cached. With the
+shipped prompts that is the customer agent's full profile and the staff
+agent; the intent profiles (discovery, availability, small_talk) that serve
+most customer messages are below Gemini's minimum and always go uncached
+(AI_Agent logs the cached profiles at startup).
+
+A cached request can't carry its own system instruction, so the per-request
+system messages (user profile, guidance, memory summary) are sent as context
+notes in user turns instead.
+
+PROMPT_CACHE=simulate keeps the calls unchanged and only does the accounting:
+input tokens covered by a live (simulated) prefix are counted as cached, so
+cached vs uncached input tokens per request can be measured offline.
+
+Env:
+- PROMPT_CACHE:                  provider (default) | simulate | off
+- PROMPT_CACHE_TTL:              cache lifetime in seconds (default 3600)
+- PROMPT_CACHE_REFRESH_SECONDS:  extend the TTL this long before expiry (default 300)
+- PROMPT_CACHE_MIN_TOKENS:       shortest prefix worth caching (default 1024, Gemini's minimum)
+- PROMPT_CACHE_RETRY_SECONDS:    retry delay after a failed create (default 600)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from agent_metrics import estimate_tokens
+
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "provider").strip().lower()
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+PROMPT_CACHE_REFRESH_SECONDS = float(os.getenv("PROMPT_CACHE_REFRESH_SECONDS", "300"))
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+PROMPT_CACHE_RETRY_SECONDS = float(os.getenv("PROMPT_CACHE_RETRY_SECONDS", "600"))
+
+
+def supports_context_cache(model: Any) -> bool:
+    """True for chat models with provider-side context caching (ChatGoogleGenerativeAI)."""
+    return hasattr(model, "cached_content") and getattr(model, "client", None) is not None
+
+
+def prefix_tokens(prompt: str, tools: List[Any]) -> int:
+    """Estimated tokens of a system prompt plus its tool declarations."""
+    return estimate_tokens(prompt) + sum(estimate_tokens(json.dumps(convert_to_openai_tool(t))) for t in tools)
+
+
+def cached_request_messages(messages: List[Any]) -> List[Any]:
+    """The messages after the cached system prompt, with the remaining system messages as user-turn notes."""
+    return [HumanMessage(content=f"[Context] {m.content}") if isinstance(m, SystemMessage) else m for m in messages[1:]]
+
+
+class _Prefix:
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.handle: Optional[str] = None
+        self.expires_at = 0.0
+        self.retry_at = 0.0
+        self.busy = False
+
+
+class PrefixCache:
+    """Context cache handles per static prefix, created in the background and extended before expiry."""
+
+    def __init__(self, mode: str = PROMPT_CACHE, ttl: int = PROMPT_CACHE_TTL, refresh_seconds: float = PROMPT_CACHE_REFRESH_SECONDS,
+                 min_tokens: int = PROMPT_CACHE_MIN_TOKENS, retry_seconds: float = PROMPT_CACHE_RETRY_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.mode = mode
+        self.ttl = ttl
+        self.refresh_seconds = refresh_seconds
+        self.min_tokens = min_tokens
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self._prefixes: Dict[str, _Prefix] = {}
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "extended": 0, "failed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("provider", "simulate")
+
+    def cacheable(self, prompt: str, tools: List[Any]) -> bool:
+        """Whether calls starting with this prefix can ever be served from the cache."""
+        return self.enabled and prefix_tokens(prompt, tools) >= self.min_tokens
+
+    def _key(self, model_name: str, prompt: str, tools: List[Any]) -> str:
+        names = ",".join(sorted(getattr(t, "name", str(t)) for t in tools))
+        return hashlib.sha256(f"{model_name}\x00{names}\x00{prompt}".encode("utf-8")).hexdigest()[:32]
+
+    def handle(self, model_name: str, model: Any, prompt: str, tools: List[Any]) -> Tuple[Optional[str], int]:
+        """(live cache handle or None, prefix tokens) for a call starting with this prefix; schedules create/extend."""
+        key = self._key(model_name, prompt, tools)
+        now = self.clock()
+        with self._lock:
+            prefix = self._prefixes.get(key)
+            if prefix is None:
+                prefix = self._prefixes[key] = _Prefix(prefix_tokens(prompt, tools))
+            live = prefix.handle if prefix.handle and now < prefix.expires_at else None
+            due = prefix.tokens >= self.min_tokens and not prefix.busy and now >= prefix.retry_at and (
+                live is None or prefix.expires_at - now <= self.refresh_seconds)
+            if due:
+                prefix.busy = True
+        if due:
+            if self.mode == "simulate":
+                # No round trip to wait for; like a real cache, it covers the calls after this one
+                self._refresh(prefix, key, model, prompt, tools, live)
+            else:
+                threading.Thread(target=self._refresh, args=(prefix, key, model, prompt, tools, live),
+                                 name="prompt-cache-refresh", daemon=True).start()
+        return live, prefix.tokens
+
+    def _refresh(self, prefix: _Prefix, key: str, model: Any, prompt: str, tools: List[Any], live: Optional[str]):
+        try:
+            if self.mode == "simulate":
+                handle, stat = f"simulated/{key}", "created" if live is None else "extended"
+            elif live is not None:
+                handle, stat = self._extend(model, live), "extended"
+            else:
+                handle, stat = self._create(model, prompt, tools), "created"
+        except Exception as e:
+            print(f"Prompt cache refresh failed for {getattr(model, 'model', 'model')}: {e}")
+            with self._lock:
+                prefix.retry_at = self.clock() + self.retry_seconds
+                prefix.busy = False
+                self._stats["failed"] += 1
+            return
+        with self._lock:
+            prefix.handle = handle
+            prefix.expires_at = self.clock() + self.ttl
+            prefix.busy = False
+            self._stats[stat] += 1
+
+    def _create(self, model: Any, prompt: str, tools: List[Any]) -> str:
+        from langchain_google_genai import create_context_cache
+
+        return create_context_cache(model, [SystemMessage(content=prompt)], tools=tools or None, ttl=f"{self.ttl}s")
+
+    def _extend(self, model: Any, handle: str) -> str:
+        from google.genai import types
+
+        model.client.caches.update(name=handle, config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"))
+        return handle
+
+    def snapshot(self) -> dict:
+        now = self.clock()
+        with self._lock:
+            stats = dict(self._stats)
+            stats["live"] = sum(1 for p in self._prefixes.values() if p.handle and now < p.expires_at)
+            stats["prefixes"] = len(self._prefixes)
+        stats["mode"] = self.mode
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._prefixes.clear()
+
+
+# Shared by both agents
+prefix_cache = PrefixCache()
@@ -0,0 +1,344 @@
+"""
+Per-request state shared between chat_with_bot and the tools it runs.
+
+Held in contextvars so it follows the request into ParallelToolNode workers
+(each tool call runs in a copy of the caller's context) without touching
+module globals.
+
+Env (RequestBudget defaults; 0 disables a limit):
+- AGENT_MAX_LLM_CALLS:    model calls per request (default 8)
+- AGENT_MAX_TOOL_CALLS:   tool calls per request (default 16)
+- AGENT_DEADLINE_SECONDS: wall-clock seconds per request (default 45)
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Set
+
+from llm_scheduler import ANONYMOUS, AUTHENTICATED
+
+AGENT_MAX_LLM_CALLS = int(os.getenv("AGENT_MAX_LLM_CALLS", "8"))
+AGENT_MAX_TOOL_CALLS = int(os.getenv("AGENT_MAX_TOOL_CALLS", "16"))
+AGENT_DEADLINE_SECONDS = float(os.getenv("AGENT_DEADLINE_SECONDS", "45"))
+
+
+class ToolResultStash:
+    """Full tool payloads from the current request, keyed by tool name in call order,
+    the names of every tool the request called, and those that failed or timed out."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results: Dict[str, List[list]] = {}
+        self._called: Set[str] = set()
+        self._failed: Set[str] = set()
+
+    def note_call(self, tool_name: str):
+        with self._lock:
+            self._called.add(tool_name)
+
+    def note_failure(self, tool_name: str):
+        with self._lock:
+            self._failed.add(tool_name)
+
+    @property
+    def had_failures(self) -> bool:
+        """True if a tool call of the request errored or timed out."""
+        with self._lock:
+            return bool(self._failed)
+
+    def called_any(self, tool_names) -> bool:
+        """True if the request called any of tool_names."""
+        with self._lock:
+            return not self._called.isdisjoint(tool_names)
+
+    def put(self, tool_name: str, rows: list):
+        with self._lock:
+            self._results.setdefault(tool_name, []).append(rows)
+
+    def latest(self, tool_name: str) -> Optional[list]:
+        with self._lock:
+            calls = self._results.get(tool_name)
+            return calls[-1] if calls else None
+
+    def rows(self) -> List[dict]:
+        """All stashed rows, in call order."""
+        with self._lock:
+            return [row for calls in self._results.values() for rows in calls for row in rows if isinstance(row, dict)]
+
+    def restaurant_ids(self, limit: Optional[int] = None) -> List[str]:
+        """Unique restaurant IDs from the stashed rows, first seen first."""
+        ids = list(dict.fromkeys(str(row["id"]) for row in self.rows() if row.get("id")))
+        return ids[:limit] if limit else ids
+
+
+_tool_results: ContextVar[Optional[ToolResultStash]] = ContextVar("tool_results", default=None)
+
+
+def current_tool_results() -> Optional[ToolResultStash]:
+    """The stash for the request being served, or None outside chat_with_bot."""
+    return _tool_results.get()
+
+
+@contextmanager
+def tool_result_scope() -> Iterator[ToolResultStash]:
+    """Install a fresh ToolResultStash for the duration of a request."""
+    stash = ToolResultStash()
+    token = _tool_results.set(stash)
+    try:
+        yield stash
+    finally:
+        _tool_results.reset(token)
+
+
+class CallCounter:
+    """Thread-safe counter for model calls made while serving a request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+
+_llm_calls: ContextVar[Optional[CallCounter]] = ContextVar("llm_calls", default=None)
+
+
+def count_llm_call():
+    """Count one model call against the current llm_call_scope, if any."""
+    counter = _llm_calls.get()
+    if counter is not None:
+        counter.increment()
+
+
+@contextmanager
+def llm_call_scope() -> Iterator[CallCounter]:
+    """Count the model calls made inside the block."""
+    counter = CallCounter()
+    token = _llm_calls.set(counter)
+    try:
+        yield counter
+    finally:
+        _llm_calls.reset(token)
+
+
+class EventSink:
+    """Thread-safe queue of progress events for a streaming request."""
+
+    def __init__(self):
+        self.events: "queue.Queue[dict]" = queue.Queue()
+
+    def emit(self, event: str, **data):
+        self.events.put({"event": event, **data})
+
+
+_event_sink: ContextVar[Optional[EventSink]] = ContextVar("event_sink", default=None)
+
+
+def emit_event(event: str, **data):
+    """Send a progress event to the current streaming request, if any."""
+    sink = _event_sink.get()
+    if sink is not None:
+        sink.emit(event, **data)
+
+
+def streaming_requested() -> bool:
+    """True while serving a streaming request (the agent node then streams model tokens)."""
+    return _event_sink.get() is not None
+
+
+@contextmanager
+def event_scope(sink: EventSink) -> Iterator[EventSink]:
+    """Route emit_event() calls made inside the block to sink."""
+    token = _event_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _event_sink.reset(token)
+
+
+class RequestMemo:
+    """Results of read-only lookups made while serving one request.
+
+    A speculative prefetch and the tool call that later asks for the same key
+    share one computation: the second caller waits for the first one's result.
+    A failed computation is retried by the next caller instead of re-raising.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Dict[Hashable, Future] = {}
+        self._speculative: Set[Hashable] = set()
+        self.stats = {"computed": 0, "reused": 0, "speculative": 0, "speculative_used": 0}
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], speculative: bool = False) -> Any:
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None or (future.done() and future.exception() is not None)
+            if owner:
+                future = self._futures[key] = Future()
+                self.stats["speculative" if speculative else "computed"] += 1
+                if speculative:
+                    self._speculative.add(key)
+            elif not speculative:
+                self.stats["reused"] += 1
+                if key in self._speculative:
+                    self._speculative.discard(key)
+                    self.stats["speculative_used"] += 1
+        if not owner:
+            if speculative:
+                return None
+            try:
+                return future.result()
+            except Exception:
+                return compute()
+        try:
+            result = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+
+class RequestBudget:
+    """Model calls, tool calls and wall-clock time one request may spend in the agent loop.
+
+    The graphs check it between steps (agent_graph) and stop the loop once a
+    limit is reached; the answer is then built from the tool results so far.
+    exhausted names the first limit that stopped a step.
+    """
+
+    def __init__(self, max_llm_calls: int = AGENT_MAX_LLM_CALLS, max_tool_calls: int = AGENT_MAX_TOOL_CALLS,
+                 deadline_seconds: float = AGENT_DEADLINE_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.max_llm_calls = max_llm_calls
+        self.max_tool_calls = max_tool_calls
+        self.clock = clock
+        self.deadline = clock() + deadline_seconds if deadline_seconds > 0 else None
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.exhausted: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def remaining_seconds(self) -> Optional[float]:
+        """Seconds until the deadline (never negative), or None without one."""
+        return None if self.deadline is None else max(0.0, self.deadline - self.clock())
+
+    def _stop(self, reason: str) -> bool:
+        with self._lock:
+            self.exhausted = self.exhausted or reason
+        return False
+
+    def allows_llm_call(self) -> bool:
+        if self.max_llm_calls and self.llm_calls >= self.max_llm_calls:
+            return self._stop("llm_calls")
+        if self.remaining_seconds() == 0:
+            return self._stop("deadline")
+        return True
+
+    def allows_tool_calls(self, count: int) -> bool:
+        if self.max_tool_calls and self.tool_calls + count > self.max_tool_calls:
+            return self._stop("tool_calls")
+        if self.remaining_seconds() == 0:
+            return self._stop("deadline")
+        return True
+
+    def charge(self, llm_calls: int = 0, tool_calls: int = 0):
+        with self._lock:
+            self.llm_calls += llm_calls
+            self.tool_calls += tool_calls
+
+
+class TokenUsage:
+    """Model tokens spent while serving one request; cached_input is the part a prompt cache covered."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.input = 0
+        self.cached_input = 0
+        self.output = 0
+
+    def add(self, input_tokens: int, cached_input_tokens: int, output_tokens: int):
+        with self._lock:
+            self.input += input_tokens
+            self.cached_input += cached_input_tokens
+            self.output += output_tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"input_tokens": self.input, "cached_input_tokens": self.cached_input,
+                    "uncached_input_tokens": self.input - self.cached_input, "output_tokens": self.output}
+
+
+class ChatRequest:
+    """Who a chat request runs as: its Supabase client (RLS), authenticated user and staff restaurant."""
+
+    def __init__(self, client: Any = None, user: Optional[dict] = None, restaurant_id: Optional[str] = None,
+                 priority: Optional[str] = None):
+        self.client = client
+        self.user = user
+        self.restaurant_id = restaurant_id
+        # Scheduling class of the request's model calls (llm_scheduler): staff / authenticated / anonymous
+        self.priority = priority or (AUTHENTICATED if self.user_id else ANONYMOUS)
+        self.memo = RequestMemo()
+        self.budget = RequestBudget()
+        self.tokens = TokenUsage()
+
+    @property
+    def user_id(self) -> Optional[str]:
+        return (self.user or {}).get("id")
+
+
+_chat_request: ContextVar[Optional[ChatRequest]] = ContextVar("chat_request", default=None)
+
+
+def current_request() -> Optional[ChatRequest]:
+    """The chat request being served, or None outside request_scope()."""
+    return _chat_request.get()
+
+
+def memoized(key: Hashable, compute: Callable[[], Any], speculative: bool = False) -> Any:
+    """compute() at most once per request for key (see RequestMemo); outside a request just compute()."""
+    request = _chat_request.get()
+    if request is None:
+        return None if speculative else compute()
+    return request.memo.get_or_compute(key, compute, speculative=speculative)
+
+
+def current_budget() -> Optional[RequestBudget]:
+    """The step budget of the request being served, if any."""
+    request = _chat_request.get()
+    return request.budget if request else None
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline; None outside a request or without one."""
+    budget = current_budget()
+    return budget.remaining_seconds() if budget else None
+
+
+def current_supabase_client() -> Optional[Any]:
+    """The Supabase client of the request being served, if any."""
+    request = _chat_request.get()
+    return request.client if request else None
+
+
+@contextmanager
+def request_scope(client: Any = None, user: Optional[dict] = None, restaurant_id: Optional[str] = None,
+                  priority: Optional[str] = None) -> Iterator[ChatRequest]:
+    """Serve one chat request as client/user/restaurant_id inside the block.
+
+    Replaces passing the client on the thread object or swapping module
+    globals; concurrent requests (threads or coroutines) each see their own.
+    """
+    token = _chat_request.set(ChatRequest(client, user, restaurant_id, priority))
+    try:
+        yield _chat_request.get()
+    finally:
+        _chat_request.reset(token)
@@ -0,0 +1,158 @@
+"""
+Response cache for stateless customer requests.
+
+chat_with_bot consults it when no conversation history is passed. Entries are
+keyed by the normalized query, every profile field the prompt carries (name,
+allergies, dietary restrictions, favorite cuisines, party size, loyalty
+points), the local date and the catalog version, and expire after a TTL. Identical concurrent
+misses share one agent run (SingleFlight, or AsyncSingleFlight for the ASGI path).
+
+Availability answers depend on live bookings and are not cached unless
+RESPONSE_CACHE_AVAILABILITY_TTL is set (seconds, keep it short). The intent
+classifier misses some availability questions, so chat_with_bot also skips
+storing any answer whose run called a live availability tool.
+
+Env:
+- RESPONSE_CACHE_ENABLED:           1 (default) / 0
+- RESPONSE_CACHE_TTL:               seconds for discovery/small-talk answers (default 600)
+- RESPONSE_CACHE_AVAILABILITY_TTL:  seconds for availability answers (default 0 = not cached)
+- RESPONSE_CACHE_MAX_ENTRIES:       LRU size (default 1024)
+"""
+
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Awaitable, Callable, Hashable, Optional, Tuple
+
+from caching import AsyncSingleFlight, SingleFlight, TTLCache
+from request_context import llm_call_scope
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+RESPONSE_CACHE_AVAILABILITY_TTL = float(os.getenv("RESPONSE_CACHE_AVAILABILITY_TTL", "0"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+# Words that don't change the answer to a stateless query
+_FILLER_WORDS = {
+    "a", "an", "the", "please", "pls", "me", "can", "could", "would", "you", "i", "want", "like", "to", "some",
+    "show", "give", "tell", "list", "what", "which", "are", "is", "do", "have", "any", "of", "us", "for",
+}
+# Every profile field AI_Agent._agent_input puts in the prompt; a field missing here would serve one user's answer to another
+_PROFILE_FIELDS = ("full_name", "allergies", "dietary_restrictions", "favorite_cuisines", "preferred_party_size", "loyalty_points")
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, strip punctuation and filler words, and sort the remaining words."""
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    return " ".join(sorted({w for w in words if w not in _FILLER_WORDS}))
+
+
+def profile_fingerprint(user_profile: Optional[dict]) -> tuple:
+    """The profile fields the prompt carries, in a hashable form."""
+    if not user_profile:
+        return ()
+    fingerprint = []
+    for field in _PROFILE_FIELDS:
+        value = user_profile.get(field)
+        if isinstance(value, list):
+            value = tuple(sorted(str(v).lower() for v in value))
+        fingerprint.append(value)
+    return tuple(fingerprint)
+
+
+class ResponseCache:
+    """TTL cache of final chat answers with in-flight coalescing and hit statistics."""
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, availability_ttl: float = RESPONSE_CACHE_AVAILABILITY_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.ttl = ttl
+        self.availability_ttl = availability_ttl
+        self.enabled = enabled
+        self.catalog_version = 0
+        self._cache = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._flight = SingleFlight()
+        self._async_flight = AsyncSingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "coalesced": 0, "misses": 0, "stores": 0, "saved_llm_calls": 0}
+
+    def ttl_for(self, is_availability: bool) -> float:
+        return self.availability_ttl if is_availability else self.ttl
+
+    def key_for(self, user_input: str, user_profile: Optional[dict], intent: str, now: datetime) -> Hashable:
+        return (normalize_query(user_input), profile_fingerprint(user_profile), intent, now.date().isoformat(), self.catalog_version)
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], str], ttl: float,
+                       cacheable: Callable[[str], bool] = bool) -> str:
+        """Return the cached answer for key, or run compute once (shared by concurrent identical misses)."""
+        self._count(lookups=1)
+        entry: Optional[Tuple[str, int]] = self._cache.get(key)
+        if entry is not None:
+            self._count(hits=1, saved_llm_calls=entry[1])
+            return entry[0]
+
+        def run() -> Tuple[str, int]:
+            with llm_call_scope() as llm_calls:
+                response = compute()
+            if cacheable(response):
+                self._cache.set(key, (response, llm_calls.count), ttl=ttl)
+                self._count(stores=1)
+            return response, llm_calls.count
+
+        (response, llm_calls), shared = self._flight.do(key, run)
+        if shared:
+            self._count(coalesced=1, saved_llm_calls=llm_calls)
+        else:
+            self._count(misses=1)
+        return response
+
+    async def aget_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[str]], ttl: float,
+                              cacheable: Callable[[str], bool] = bool) -> str:
+        """Async get_or_compute; concurrent identical misses on the event loop share one compute()."""
+        self._count(lookups=1)
+        entry: Optional[Tuple[str, int]] = self._cache.get(key)
+        if entry is not None:
+            self._count(hits=1, saved_llm_calls=entry[1])
+            return entry[0]
+
+        async def run() -> Tuple[str, int]:
+            with llm_call_scope() as llm_calls:
+                response = await compute()
+            if cacheable(response):
+                self._cache.set(key, (response, llm_calls.count), ttl=ttl)
+                self._count(stores=1)
+            return response, llm_calls.count
+
+        (response, llm_calls), shared = await self._async_flight.do(key, run)
+        if shared:
+            self._count(coalesced=1, saved_llm_calls=llm_calls)
+        else:
+            self._count(misses=1)
+        return response
+
+    def invalidate_catalog(self):
+        """Drop every entry; call when restaurants or their details change."""
+        with self._lock:
+            self.catalog_version += 1
+        self._cache.clear()
+
+    def clear(self):
+        self._cache.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["catalog_version"] = self.catalog_version
+        served = stats["hits"] + stats["coalesced"]
+        stats["hit_rate"] = round(served / stats["lookups"], 3) if stats["lookups"] else 0.0
+        stats["entries"] = len(self._cache)
+        stats["enabled"] = self.enabled
+        return stats
+
+
+response_cache = ResponseCache()
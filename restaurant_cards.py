@@ -0,0 +1,45 @@
+"""
+Compact restaurant cards for chat responses.
+
+The app renders every restaurants_to_show ID as a card. With "include_cards":
+true the customer chat endpoints return those cards next to the IDs
+(restaurant_cards, same order), built from the in-memory restaurant catalog,
+so the app doesn't fetch each restaurant after the answer. IDs the catalog
+doesn't have yet (added since its last reload) are fetched in one query.
+
+Card fields: id, name, cuisine_type, price_range, average_rating, address,
+plus whichever image columns from RESTAURANT_CARD_IMAGE_FIELDS the row has.
+
+Env:
+- RESTAURANT_CARD_IMAGE_FIELDS: comma-separated image columns
+  (default "main_image_url,image_url,image_urls,thumbnail_url")
+"""
+
+import os
+from typing import Callable, Dict, List, Optional
+
+CARD_FIELDS = ("id", "name", "cuisine_type", "price_range", "average_rating", "address")
+CARD_IMAGE_FIELDS = tuple(
+    f.strip() for f in os.getenv("RESTAURANT_CARD_IMAGE_FIELDS", "main_image_url,image_url,image_urls,thumbnail_url").split(",") if f.strip()
+)
+
+
+def restaurant_card(row: dict) -> dict:
+    """The card payload for one restaurant row."""
+    card = {field: row.get(field) for field in CARD_FIELDS}
+    card["id"] = str(card["id"])
+    card.update({field: row[field] for field in CARD_IMAGE_FIELDS if row.get(field)})
+    return card
+
+
+def restaurant_cards(ids: List[str], known: Dict[str, dict],
+                     fetch_missing: Optional[Callable[[List[str]], List[dict]]] = None) -> List[dict]:
+    """Cards for ids, in order, from known rows (by ID); the rest via one fetch_missing call. Unknown IDs are skipped."""
+    rows = dict(known)
+    missing = [i for i in ids if i not in rows]
+    if missing and fetch_missing:
+        try:
+            rows.update({str(r["id"]): r for r in fetch_missing(missing) or [] if r.get("id")})
+        except Exception as e:
+            print(f"Error fetching restaurant cards for {missing}: {e}")
+    return [restaurant_card(rows[i]) for i in ids if i in rows]
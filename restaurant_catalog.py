@@ -0,0 +1,156 @@
+"""
+In-memory copy of the restaurant catalog for request-path lookups.
+
+RestaurantCatalog keeps the restaurant rows loaded by its loader and reloads
+them every CATALOG_TTL seconds, so code in front of or after the model (name
+matching for speculative prefetch, the featured list behind
+getFeaturedRestaurants and the RESTAURANTS_TO_SHOW fallback, restaurant cards)
+can read the
+catalog without a database round trip. The first use loads synchronously;
+later reloads run in the background while the previous copy keeps being
+served, and a failed reload keeps it too.
+
+Each load precomputes the ranking the featured queries used (ai_featured
+first, then average_rating), overall and per cuisine, so top() is a slice.
+
+Env:
+- CATALOG_TTL: seconds between reloads (default 300)
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))
+
+# Names shorter than this are too ambiguous to spot in free text
+_MIN_NAME_LENGTH = 3
+
+
+def normalize_name(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse spaces."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def _rank_key(row: dict):
+    return (not row.get("ai_featured"), -float(row.get("average_rating") or 0))
+
+
+class RestaurantCatalog:
+    """Periodically refreshed restaurant rows with a name index."""
+
+    def __init__(self, loader: Callable[[], List[dict]], ttl: float = CATALOG_TTL, clock: Callable[[], float] = time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        self.clock = clock
+        self._rows: Optional[List[dict]] = None
+        self._names: Dict[str, dict] = {}
+        self._by_id: Dict[str, dict] = {}
+        # Ranked rows keyed by normalized cuisine ("" = all cuisines)
+        self._ranked: Dict[str, List[dict]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._stats = {"loads": 0, "failed_loads": 0}
+
+    def _load(self):
+        try:
+            rows = [r for r in (self.loader() or []) if isinstance(r, dict) and r.get("id")]
+        except Exception as e:
+            print(f"Restaurant catalog load failed: {e}")
+            with self._lock:
+                self._stats["failed_loads"] += 1
+                self._refreshing = False
+            return
+        names = {}
+        for row in rows:
+            name = normalize_name(row.get("name") or "")
+            if len(name) >= _MIN_NAME_LENGTH:
+                names.setdefault(name, row)
+        ranked: Dict[str, List[dict]] = {"": sorted(rows, key=_rank_key)}
+        for row in ranked[""]:
+            cuisine = normalize_name(row.get("cuisine_type") or "")
+            if cuisine:
+                ranked.setdefault(cuisine, []).append(row)
+        by_id = {str(row["id"]): row for row in rows}
+        with self._lock:
+            self._rows, self._names, self._by_id, self._ranked = rows, names, by_id, ranked
+            self._loaded_at = self.clock()
+            self._stats["loads"] += 1
+            self._refreshing = False
+
+    def rows(self) -> List[dict]:
+        """The catalog rows; empty if it has never loaded."""
+        with self._lock:
+            loaded = self._rows is not None
+            stale = loaded and self.clock() - self._loaded_at >= self.ttl
+            refresh = stale and not self._refreshing
+            if refresh:
+                self._refreshing = True
+        if not loaded:
+            self._load()
+        elif refresh:
+            threading.Thread(target=self._load, name="catalog-refresh", daemon=True).start()
+        with self._lock:
+            return self._rows or []
+
+    def match_names(self, text: str, limit: int = 2) -> List[dict]:
+        """Restaurants whose full name appears in text, longest names first."""
+        self.rows()
+        haystack = f" {normalize_name(text)} "
+        with self._lock:
+            found = [name for name in self._names if f" {name} " in haystack]
+            names = self._names
+        # "Em Sherif Cafe" wins over "Em Sherif" when both appear
+        found.sort(key=len, reverse=True)
+        kept: List[str] = []
+        for name in found:
+            if not any(name in longer for longer in kept):
+                kept.append(name)
+        return [names[name] for name in kept[:limit]]
+
+    def by_id(self, ids: List[str]) -> Dict[str, dict]:
+        """Catalog rows for the given IDs that it has."""
+        self.rows()
+        with self._lock:
+            index = self._by_id
+        return {i: index[i] for i in ids if i in index}
+
+    def top(self, limit: int = 5, cuisine: Optional[str] = None, featured_only: bool = False) -> List[dict]:
+        """Best restaurants, featured first then by rating; optionally one cuisine or featured ones only."""
+        self.rows()
+        with self._lock:
+            ranked = self._ranked.get(normalize_name(cuisine or ""), [])
+        if featured_only:
+            # Featured rows sort first, so they are a prefix of the ranking
+            return [r for r in ranked[:limit] if r.get("ai_featured")]
+        return ranked[:limit]
+
+    def cuisine_in(self, text: str) -> Optional[str]:
+        """A catalog cuisine named in text ("italian places" -> "Italian"), if any."""
+        self.rows()
+        haystack = f" {normalize_name(text)} "
+        with self._lock:
+            ranked = self._ranked
+        for cuisine, rows in ranked.items():
+            if cuisine and f" {cuisine} " in haystack:
+                return rows[0].get("cuisine_type")
+        return None
+
+    def invalidate(self):
+        """Refresh on next use; call when restaurants or their details change."""
+        with self._lock:
+            self._loaded_at = float("-inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["restaurants"] = len(self._rows or [])
+            fresh = self._rows is not None and self._loaded_at != float("-inf")
+            stats["age_seconds"] = round(self.clock() - self._loaded_at, 1) if fresh else None
+        return stats
@@ -0,0 +1,408 @@
+"""
+Live per-restaurant service board for the staff tools.
+
+During service the staff agent asks for today's bookings, the tables and the
+waitlist over and over, and each tool call used to re-query them. A
+ServiceBoard holds those three sets for one restaurant in memory: it loads
+them on first use, and a background poller keeps them current by fetching only
+the rows whose updated_at moved past the newest one it has seen (delta
+polling). getTodaysBookings, getAvailableTables (for times within today),
+getWaitlist, getWaitlistStats and estimateWaitTime read from the board.
+
+- Deltas can't see deleted rows, so every SERVICE_BOARD_RESYNC_SECONDS the
+  poller reloads each set in full; it also reloads the bookings when the day
+  changes.
+- Assigning a table writes booking_tables and leaves bookings.updated_at
+  alone, so each poll also re-reads booking_tables for today's bookings (one
+  query) and merges changed assignments into the booking rows.
+- A table without an updated_at column is reloaded in full on every poll;
+  that is still off the request path.
+- Boards are keyed by restaurant and staff user (the JWT's sub), so rows read
+  under one staff member's token are never served to another caller, and a
+  refreshed token reuses the board: it keeps polling with the newest client.
+  Callers without a user fall back to the client's RLS identity
+  (client_identity).
+- A board nobody has read for SERVICE_BOARD_IDLE_SECONDS is dropped and stops
+  being polled.
+- If the first load fails, or no poll has succeeded for
+  SERVICE_BOARD_MAX_STALE_SECONDS, get() returns None and the tools query the
+  database directly; the board keeps polling and is used again once it syncs.
+
+Env:
+- SERVICE_BOARD_POLL_SECONDS:   seconds between delta polls (default 5; 0 disables the board)
+- SERVICE_BOARD_RESYNC_SECONDS: seconds between full reloads (default 300)
+- SERVICE_BOARD_IDLE_SECONDS:   drop boards unread for this long (default 900)
+- SERVICE_BOARD_MAX_STALE_SECONDS: stop serving a board this long after its last successful sync (default 30)
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from caching import SingleFlight
+from supabase_coalescing import client_identity
+
+SERVICE_BOARD_POLL_SECONDS = float(os.getenv("SERVICE_BOARD_POLL_SECONDS", "5"))
+SERVICE_BOARD_RESYNC_SECONDS = float(os.getenv("SERVICE_BOARD_RESYNC_SECONDS", "300"))
+SERVICE_BOARD_IDLE_SECONDS = float(os.getenv("SERVICE_BOARD_IDLE_SECONDS", "900"))
+SERVICE_BOARD_MAX_STALE_SECONDS = float(os.getenv("SERVICE_BOARD_MAX_STALE_SECONDS", "30"))
+
+# What getTodaysBookings returns
+BOOKING_FIELDS = (
+    "id", "user_id", "booking_time", "party_size", "status", "special_requests",
+    "occasion", "dietary_notes", "guest_name", "guest_email", "guest_phone",
+    "confirmation_code", "checked_in_at", "seated_at", "profiles",
+)
+BOOKING_COLUMNS = (
+    ", ".join(BOOKING_FIELDS[:-1])
+    + ", profiles!bookings_user_id_fkey(full_name, phone_number, allergies, dietary_restrictions), booking_tables(table_id)"
+)
+TABLE_COLUMNS = "id, table_number, table_type, capacity, min_capacity, max_capacity, features, is_active, x_position, y_position"
+# What the waitlist tools return
+WAITLIST_FIELDS = ("id", "restaurant_id", "party_size", "status", "joined_at", "quoted_wait_minutes", "priority", "notified_at")
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """A database timestamp as naive UTC (naive input is taken as UTC, like PostgREST filters); None if unparseable."""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def project(row: dict, fields: Tuple[str, ...]) -> dict:
+    """The fields of row that it has, in field order."""
+    return {f: row[f] for f in fields if f in row}
+
+
+def _sort_key(value: Any):
+    return (value is None, value if value is not None else "")
+
+
+def _table_ids(links: Any) -> List[str]:
+    return sorted(str(link.get("table_id")) for link in links or [])
+
+
+class _Feed:
+    """One table's rows for a restaurant by ID, plus its updated_at cursor."""
+
+    def __init__(self, table: str, columns: str, keep: Callable[[dict], bool] = lambda row: True):
+        self.table = table
+        self.columns = columns
+        self.keep = keep
+        self.rows: Dict[str, dict] = {}
+        self.cursor: Optional[str] = None
+        # False once a select including updated_at has failed; the feed then reloads in full
+        self.has_updated_at = True
+        self.synced_at = 0.0
+
+    def _select(self, client: Any, restaurant_id: str, since: Optional[str] = None):
+        columns = self.columns if self.columns == "*" or not self.has_updated_at else f"{self.columns}, updated_at"
+        query = client.table(self.table).select(columns).eq("restaurant_id", restaurant_id)
+        return query.gte("updated_at", since) if since else query
+
+    def load(self, client: Any, restaurant_id: str, scope: Callable[[Any], Any], now: float) -> int:
+        """Replace the rows with a full load; returns the row count."""
+        try:
+            data = scope(self._select(client, restaurant_id)).execute().data or []
+        except Exception:
+            if not self.has_updated_at or self.columns == "*":
+                raise
+            self.has_updated_at = False
+            data = scope(self._select(client, restaurant_id)).execute().data or []
+        self.rows = {str(r["id"]): r for r in data if r.get("id") is not None and self.keep(r)}
+        self.cursor = max((str(r["updated_at"]) for r in data if r.get("updated_at")), default=None)
+        self.synced_at = now
+        return len(data)
+
+    def delta(self, client: Any, restaurant_id: str) -> int:
+        """Merge the rows changed since the cursor; returns the number fetched."""
+        data = self._select(client, restaurant_id, since=self.cursor).execute().data or []
+        # Readers iterate the current dict; swap in a merged copy
+        rows = dict(self.rows)
+        for row in data:
+            if row.get("id") is None:
+                continue
+            if self.keep(row):
+                rows[str(row["id"])] = row
+            else:
+                # e.g. a booking moved to another day
+                rows.pop(str(row["id"]), None)
+        self.rows = rows
+        self.cursor = max([self.cursor or ""] + [str(r["updated_at"]) for r in data if r.get("updated_at")]) or None
+        return len(data)
+
+    @property
+    def supports_delta(self) -> bool:
+        return self.has_updated_at and self.cursor is not None
+
+
+class ServiceBoard:
+    """Today's bookings, the tables and the waitlist of one restaurant, kept current by poll()."""
+
+    def __init__(self, restaurant_id: str, client: Any, resync_seconds: float = SERVICE_BOARD_RESYNC_SECONDS,
+                 clock: Callable[[], float] = time.monotonic, today: Callable[[], date] = date.today):
+        self.restaurant_id = restaurant_id
+        self.client = client
+        self.resync_seconds = resync_seconds
+        self.clock = clock
+        self.today = today
+        self.day = today()
+        self.bookings_feed = _Feed("bookings", BOOKING_COLUMNS, keep=self._is_today)
+        self.tables_feed = _Feed("restaurant_tables", TABLE_COLUMNS)
+        self.waitlist_feed = _Feed("waitlist", "*")
+        self.feeds = (self.bookings_feed, self.tables_feed, self.waitlist_feed)
+        self.last_read = clock()
+        # Last load or poll that completed
+        self.last_synced = float("-inf")
+        self._lock = threading.Lock()
+        self._stats = {"loads": 0, "polls": 0, "rows_fetched": 0, "resyncs": 0, "failed_polls": 0}
+
+    def _day_bounds(self) -> Tuple[datetime, datetime]:
+        return datetime.combine(self.day, dt_time.min), datetime.combine(self.day, dt_time.max)
+
+    def _is_today(self, row: dict) -> bool:
+        booked = parse_timestamp(row.get("booking_time"))
+        start, end = self._day_bounds()
+        return booked is not None and start <= booked <= end
+
+    def _scope(self, feed: _Feed) -> Callable[[Any], Any]:
+        if feed is not self.bookings_feed:
+            return lambda query: query
+        start, end = self._day_bounds()
+        return lambda query: query.gte("booking_time", start.isoformat()).lte("booking_time", end.isoformat())
+
+    def load(self):
+        """Full load of all three sets; raises if any query fails."""
+        now = self.clock()
+        for feed in self.feeds:
+            feed.load(self.client, self.restaurant_id, self._scope(feed), now)
+        self.last_synced = now
+        with self._lock:
+            self._stats["loads"] += 1
+
+    def poll(self):
+        """Bring the board up to date: deltas, or full reloads when due. Errors keep the current rows."""
+        now = self.clock()
+        fetched, resyncs = 0, 0
+        try:
+            if self.today() != self.day:
+                self.day = self.today()
+                self.bookings_feed.synced_at = float("-inf")
+            for feed in self.feeds:
+                if not feed.supports_delta or now - feed.synced_at >= self.resync_seconds:
+                    fetched += feed.load(self.client, self.restaurant_id, self._scope(feed), now)
+                    resyncs += 1
+                else:
+                    fetched += feed.delta(self.client, self.restaurant_id)
+            fetched += self._refresh_assignments()
+        except Exception as e:
+            print(f"Service board poll failed for restaurant {self.restaurant_id}: {e}")
+            with self._lock:
+                self._stats["failed_polls"] += 1
+            return
+        self.last_synced = now
+        with self._lock:
+            self._stats["polls"] += 1
+            self._stats["rows_fetched"] += fetched
+            self._stats["resyncs"] += resyncs
+
+    def _refresh_assignments(self) -> int:
+        """Merge today's booking_tables into the booking rows; returns the number of links fetched."""
+        booking_ids = list(self.bookings_feed.rows)
+        if not booking_ids:
+            return 0
+        links = self.client.table("booking_tables").select("booking_id, table_id").in_("booking_id", booking_ids).execute().data or []
+        assigned: Dict[str, List[dict]] = {}
+        for link in links:
+            assigned.setdefault(str(link.get("booking_id")), []).append({"table_id": link.get("table_id")})
+        rows = dict(self.bookings_feed.rows)
+        changed = False
+        for booking_id, row in rows.items():
+            tables = assigned.get(booking_id, [])
+            if _table_ids(row.get("booking_tables")) != _table_ids(tables):
+                rows[booking_id] = {**row, "booking_tables": tables}
+                changed = True
+        if changed:
+            self.bookings_feed.rows = rows
+        return len(links)
+
+    def stale(self, max_stale_seconds: float) -> bool:
+        """True when no load or poll has succeeded for max_stale_seconds (0 never goes stale)."""
+        return max_stale_seconds > 0 and self.clock() - self.last_synced > max_stale_seconds
+
+    def resync(self):
+        """Reload every set in full on the next poll; call after writes the board should see at once."""
+        for feed in self.feeds:
+            feed.synced_at = float("-inf")
+
+    def _read(self, feed: _Feed) -> List[dict]:
+        self.last_read = self.clock()
+        return list(feed.rows.values())
+
+    def bookings(self) -> List[dict]:
+        """Today's bookings, by booking time."""
+        return sorted(self._read(self.bookings_feed), key=lambda b: _sort_key(b.get("booking_time")))
+
+    def bookings_between(self, start: datetime, end: datetime, statuses: Optional[set] = None) -> Optional[List[dict]]:
+        """Today's bookings with booking_time in [start, end] (naive UTC), optionally by status; None if the range isn't today."""
+        day_start, day_end = self._day_bounds()
+        if start < day_start or end > day_end:
+            return None
+        found = []
+        for booking in self._read(self.bookings_feed):
+            booked = parse_timestamp(booking.get("booking_time"))
+            if booked is not None and start <= booked <= end and (statuses is None or booking.get("status") in statuses):
+                found.append(booking)
+        return found
+
+    def tables(self, active_only: bool = True) -> List[dict]:
+        """The restaurant's tables, by table number."""
+        rows = [t for t in self._read(self.tables_feed) if t.get("is_active") or not active_only]
+        return sorted(rows, key=lambda t: _sort_key(t.get("table_number")))
+
+    def waitlist(self, status: Optional[str] = None) -> List[dict]:
+        """Waitlist entries, by joined_at; optionally one status."""
+        rows = [e for e in self._read(self.waitlist_feed) if status is None or e.get("status") == status]
+        return sorted(rows, key=lambda e: _sort_key(e.get("joined_at")))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            "bookings": len(self.bookings_feed.rows),
+            "tables": len(self.tables_feed.rows),
+            "waitlist": len(self.waitlist_feed.rows),
+            "delta_feeds": [f.table for f in self.feeds if f.supports_delta],
+            "idle_seconds": round(self.clock() - self.last_read, 1),
+            "seconds_since_sync": round(self.clock() - self.last_synced, 1),
+        })
+        return stats
+
+
+class ServiceBoards:
+    """Service boards per (restaurant, staff user), loaded on first use and polled in the background."""
+
+    def __init__(self, poll_seconds: float = SERVICE_BOARD_POLL_SECONDS, resync_seconds: float = SERVICE_BOARD_RESYNC_SECONDS,
+                 idle_seconds: float = SERVICE_BOARD_IDLE_SECONDS, max_stale_seconds: float = SERVICE_BOARD_MAX_STALE_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.poll_seconds = poll_seconds
+        self.resync_seconds = resync_seconds
+        self.idle_seconds = idle_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.clock = clock
+        self._boards: Dict[Tuple[str, str], ServiceBoard] = {}
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._poller: Optional[threading.Thread] = None
+        self._stats = {"reads": 0, "loads": 0, "failed_loads": 0, "stale_reads": 0, "dropped": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.poll_seconds > 0
+
+    def get(self, restaurant_id: str, client: Any, user_id: Optional[str] = None) -> Optional[ServiceBoard]:
+        """The live board for restaurant_id as user_id sees it through client, loading it on first use.
+
+        Without a user_id the board is keyed by the client's RLS identity instead.
+        None if disabled, the load failed, or the board hasn't synced within max_stale_seconds.
+        """
+        if not self.enabled or not restaurant_id or client is None:
+            return None
+        key = (str(restaurant_id), f"user:{user_id}" if user_id else client_identity(client))
+        with self._lock:
+            board = self._boards.get(key)
+            if board is not None:
+                # Same user, possibly a refreshed token; keep polling with the newest client
+                board.client = client
+                if board.stale(self.max_stale_seconds):
+                    self._stats["stale_reads"] += 1
+                    return None
+                self._stats["reads"] += 1
+                return board
+
+        def load() -> ServiceBoard:
+            board = ServiceBoard(str(restaurant_id), client, resync_seconds=self.resync_seconds, clock=self.clock)
+            board.load()
+            return board
+
+        try:
+            board, shared = self._flight.do(key, load)
+        except Exception as e:
+            print(f"Service board load failed for restaurant {restaurant_id}: {e}")
+            with self._lock:
+                self._stats["failed_loads"] += 1
+            return None
+        with self._lock:
+            if shared:
+                self._stats["reads"] += 1
+            else:
+                self._boards[key] = board
+                self._stats["loads"] += 1
+            self._start_poller()
+        return board
+
+    def _start_poller(self):
+        """Start the poll thread if it isn't running. Caller holds the lock."""
+        if self._poller is None or not self._poller.is_alive():
+            self._poller = threading.Thread(target=self._poll_loop, name="service-board-poll", daemon=True)
+            self._poller.start()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            if not self.poll_once():
+                with self._lock:
+                    if not self._boards:
+                        # get() starts a new poller with the next board
+                        self._poller = None
+                        return
+
+    def poll_once(self) -> int:
+        """Poll every board, dropping idle ones; returns how many were polled."""
+        now = self.clock()
+        with self._lock:
+            idle = [k for k, b in self._boards.items() if now - b.last_read >= self.idle_seconds]
+            for key in idle:
+                del self._boards[key]
+            self._stats["dropped"] += len(idle)
+            boards = list(self._boards.values())
+        for board in boards:
+            board.poll()
+        return len(boards)
+
+    def resync(self, restaurant_id: Optional[str] = None):
+        """Full reload on the next poll for one restaurant's boards (or all)."""
+        with self._lock:
+            boards = [b for (rid, _), b in self._boards.items() if restaurant_id is None or rid == str(restaurant_id)]
+        for board in boards:
+            board.resync()
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            boards = list(self._boards.values())
+        stats["poll_seconds"] = self.poll_seconds
+        stats["max_stale_seconds"] = self.max_stale_seconds
+        stats["boards"] = {}
+        for board in boards:
+            # Boards per staff identity; counts add up per restaurant
+            totals = stats["boards"].setdefault(board.restaurant_id, {"identities": 0})
+            totals["identities"] += 1
+            for name, value in board.snapshot().items():
+                if name != "idle_seconds" and isinstance(value, int):
+                    totals[name] = totals.get(name, 0) + value
+        return stats
+
+
+# Shared by the staff agent's tools
+service_boards = ServiceBoards()
@@ -0,0 +1,229 @@
+"""
+Server-side chat sessions, so clients can send only the new message.
+
+A session is the exported ConversationMemory state plus a version number that
+increases by one on every saved turn. Clients echo back the session_version
+they last received; a mismatch means the client and server histories have
+diverged (another tab, a lost response, a reset) and the API answers 409 so
+the client can resync by sending its full conversation_history once.
+
+Signed-in users' sessions are keyed by the verified JWT subject, never by a
+user_id from the request body. Anonymous sessions live in a separate
+namespace and only under IDs the server issued (new_session_id()), so one
+anonymous client can't pick another's session or share a default one.
+
+Backends (SESSION_BACKEND):
+- memory: in-process LRU with TTL (default; lost on restart, per worker)
+- sqlite: single file at SESSION_SQLITE_PATH, shared by local workers
+- redis:  SESSION_REDIS_URL (needs the optional redis package)
+
+Env:
+- SESSION_TTL_SECONDS:  idle expiry (default 86400)
+- SESSION_MAX_SESSIONS: memory backend LRU size (default 10000)
+"""
+
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+from caching import TTLCache
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "86400"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "chat_sessions.db")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+
+class SessionConflict(Exception):
+    """The client's session_version doesn't match the stored session."""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Session diverged; server is at version {current_version}")
+        self.current_version = current_version
+
+
+class InvalidSession(ValueError):
+    """The request's session_id or session_version can't be accepted."""
+
+
+_ISSUED_SESSION_ID = re.compile(r"s_[A-Za-z0-9_-]{32}")
+
+
+def new_session_id() -> str:
+    """An unguessable session_id for a new anonymous session."""
+    return "s_" + secrets.token_urlsafe(24)
+
+
+def is_issued_session_id(session_id) -> bool:
+    """True if session_id has the form of one new_session_id() issued."""
+    return isinstance(session_id, str) and _ISSUED_SESSION_ID.fullmatch(session_id) is not None
+
+
+def parse_session_version(value) -> int:
+    """The client's session_version as an int; raises InvalidSession for anything but an integer."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and re.fullmatch(r"\d{1,12}", value.strip()):
+        return int(value)
+    raise InvalidSession("session_version must be an integer")
+
+
+class MemorySessionBackend:
+    """In-process LRU of serialized sessions."""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, ttl: int = SESSION_TTL_SECONDS):
+        self._cache = TTLCache(maxsize=max_sessions, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def compare_and_set(self, key: str, expected_version: int, value: str) -> Optional[int]:
+        """Store value if the stored version equals expected_version; return the stored version on conflict."""
+        with self._lock:
+            current = _version_of(self._cache.get(key))
+            if current != expected_version:
+                return current
+            self._cache.set(key, value)
+            return None
+
+    def delete(self, key: str):
+        self._cache.pop(key)
+
+
+class SQLiteSessionBackend:
+    """Sessions in a local SQLite file; safe across threads and local worker processes."""
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH, ttl: int = SESSION_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                "key TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT value FROM chat_sessions WHERE key = ? AND updated_at > ?", (key, time.time() - self.ttl)
+        ).fetchone()
+        return row[0] if row else None
+
+    def compare_and_set(self, key: str, expected_version: int, value: str) -> Optional[int]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT version FROM chat_sessions WHERE key = ? AND updated_at > ?", (key, time.time() - self.ttl)
+            ).fetchone()
+            current = row[0] if row else 0
+            if current != expected_version:
+                conn.execute("ROLLBACK")
+                return current
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (key, version, value, updated_at) VALUES (?, ?, ?, ?)",
+                (key, _version_of(value), value, time.time()),
+            )
+            conn.execute("COMMIT")
+            return None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, key: str):
+        self._connect().execute("DELETE FROM chat_sessions WHERE key = ?", (key,))
+
+
+class RedisSessionBackend:
+    """Sessions in Redis with WATCH-based compare-and-set."""
+
+    def __init__(self, url: str = SESSION_REDIS_URL, ttl: int = SESSION_TTL_SECONDS):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_BACKEND=redis requires the redis package (pip install redis)") from e
+        self._redis = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._redis.get(f"chat_session:{key}")
+        return value.decode("utf-8") if value is not None else None
+
+    def compare_and_set(self, key: str, expected_version: int, value: str) -> Optional[int]:
+        redis_key = f"chat_session:{key}"
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(redis_key)
+                stored = pipe.get(redis_key)
+                current = _version_of(stored.decode("utf-8") if stored is not None else None)
+                if current != expected_version:
+                    return current
+                pipe.multi()
+                pipe.set(redis_key, value, ex=self.ttl)
+                pipe.execute()
+                return None
+            except self._watch_error:
+                return _version_of(self.get(key))
+
+    def delete(self, key: str):
+        self._redis.delete(f"chat_session:{key}")
+
+
+def _version_of(serialized: Optional[str]) -> int:
+    return int(json.loads(serialized).get("version", 0)) if serialized else 0
+
+
+class SessionStore:
+    """Versioned ConversationMemory snapshots keyed by scope, user and session_id."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or _backend_from_env()
+
+    @staticmethod
+    def key(scope: str, user_id: Optional[str], session_id: str) -> str:
+        """Storage key; user_id must be the verified JWT subject (None for anonymous sessions)."""
+        if user_id:
+            return f"{scope}:auth:{user_id}:{session_id}"
+        return f"{scope}:anon:{session_id}"
+
+    def load(self, key: str) -> Tuple[Optional[dict], int]:
+        """Return (memory state or None, version); version 0 means no session yet."""
+        serialized = self.backend.get(key)
+        if not serialized:
+            return None, 0
+        session = json.loads(serialized)
+        return session.get("memory"), int(session.get("version", 0))
+
+    def save(self, key: str, memory_state: dict, expected_version: int) -> int:
+        """Store the state as the next version; raises SessionConflict if someone else saved first."""
+        version = expected_version + 1
+        serialized = json.dumps({"version": version, "memory": memory_state, "updated_at": time.time()})
+        current = self.backend.compare_and_set(key, expected_version, serialized)
+        if current is not None:
+            raise SessionConflict(current)
+        return version
+
+    def delete(self, key: str):
+        self.backend.delete(key)
+
+
+def _backend_from_env():
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionBackend()
+    if SESSION_BACKEND == "redis":
+        return RedisSessionBackend()
+    return MemorySessionBackend()
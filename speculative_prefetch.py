@@ -0,0 +1,104 @@
+"""
+Speculative prefetch of restaurant and availability lookups.
+
+For "is Em Sherif free tomorrow for 4" the agent runs model ->
+getRestaurantsByName -> model -> getAvailableTimeSlots (the date itself is
+already resolved locally, see temporal_parser). SpeculativePrefetcher spots
+catalog restaurant names and resolved dates in the message and starts those
+lookups on the tool pool while the first model call is in flight. Results land
+in the request memo (request_context.RequestMemo), so the tool calls that
+follow return without another database round trip; a tool call that arrives
+while its lookup is still running waits for it instead of starting over.
+
+Lookups the model never asks for are wasted work, bounded by max_restaurants
+name lookups (plus one availability computation each) per request. The agent
+only starts them once a model call is certain: after the fast path and the
+response cache have missed.
+
+Env:
+- SPECULATIVE_PREFETCH: 1 (default) / 0
+"""
+
+import contextvars
+import os
+import re
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+from request_context import RequestMemo
+from restaurant_catalog import RestaurantCatalog
+from temporal_parser import TemporalResolution
+from tool_executor import get_tool_executor
+
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "1") == "1"
+
+_PARTY_RE = re.compile(
+    r"\bfor\s+(\d{1,2})\b(?!\s*(?::|am|pm|a\.m\.|p\.m\.|o'?clock))"
+    r"|\b(\d{1,2})\s+(?:people|persons|guests|pax)\b"
+)
+
+
+def party_size_from_text(text: str) -> Optional[int]:
+    """Party size stated in a message ("for 4", "6 people"), if any."""
+    match = _PARTY_RE.search((text or "").lower())
+    if not match:
+        return None
+    size = int(match.group(1) or match.group(2))
+    return size if 1 <= size <= 30 else None
+
+
+class SpeculationStats:
+    """Speculative lookups started vs later used by a tool call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "lookups": 0, "used": 0}
+
+    def record(self, memo: RequestMemo):
+        with self._lock:
+            if memo.stats["speculative"]:
+                self._stats["requests"] += 1
+            self._stats["lookups"] += memo.stats["speculative"]
+            self._stats["used"] += memo.stats["speculative_used"]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["enabled"] = SPECULATIVE_PREFETCH
+        stats["hit_rate"] = round(stats["used"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+        return stats
+
+
+speculation_stats = SpeculationStats()
+
+
+class SpeculativePrefetcher:
+    """Starts likely tool lookups for a message in the background."""
+
+    def __init__(self, catalog: RestaurantCatalog, lookup_by_name: Callable[[str], None],
+                 lookup_time_slots: Callable[[str, str, int], None], max_restaurants: int = 2,
+                 enabled: bool = SPECULATIVE_PREFETCH):
+        self.catalog = catalog
+        self.lookup_by_name = lookup_by_name
+        self.lookup_time_slots = lookup_time_slots
+        self.max_restaurants = max_restaurants
+        self.enabled = enabled
+
+    def start(self, user_input: str, temporal: TemporalResolution, user_profile: Optional[dict] = None) -> Optional[Future]:
+        """Match the message and fan its lookups out on the tool pool; returns at once."""
+        if not self.enabled:
+            return None
+        party_size = party_size_from_text(user_input) or int((user_profile or {}).get("preferred_party_size") or 2)
+        return get_tool_executor().submit(contextvars.copy_context().run, self._run, user_input, temporal.first_date, party_size)
+
+    def _run(self, user_input: str, date: Optional[str], party_size: int) -> List[str]:
+        restaurants = self.catalog.match_names(user_input, limit=self.max_restaurants)
+        executor = get_tool_executor()
+        for restaurant in restaurants:
+            executor.submit(contextvars.copy_context().run, self.lookup_by_name, restaurant["name"])
+            if date:
+                executor.submit(contextvars.copy_context().run, self.lookup_time_slots, str(restaurant["id"]), date, party_size)
+        if restaurants:
+            print(f"Speculatively prefetching {', '.join(r['name'] for r in restaurants)}" + (f" for {date}, party of {party_size}" if date else ""))
+        return [str(r["id"]) for r in restaurants]
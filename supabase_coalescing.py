@@ -0,0 +1,166 @@
+"""
+Singleflight coalescing for identical concurrent Supabase reads.
+
+coalescing(client) wraps a supabase Client. Query builders obtained through
+table()/from_()/rpc() record their chain (table, select, filters, order, ...);
+on execute() a read whose chain and RLS identity (the Authorization header)
+match a request already in flight waits for that request and shares its
+result instead of issuing another network call.
+
+Only reads are coalesced: table chains that select and never insert, update,
+upsert or delete, and RPCs listed in COALESCE_RPCS. Nothing is cached after
+the call completes.
+
+Env:
+- SUPABASE_COALESCE:       1 (default) / 0
+- SUPABASE_COALESCE_RPCS:  extra comma-separated read-only RPC names
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from caching import SingleFlight
+
+SUPABASE_COALESCE = os.getenv("SUPABASE_COALESCE", "1") == "1"
+
+COALESCE_RPCS = frozenset({
+    "get_turn_time",
+    "quick_availability_check",
+    "get_available_tables",
+    "check_booking_overlap",
+    "suggest_optimal_tables",
+    "validate_table_combination",
+    "get_table_availability_by_hour",
+} | {name.strip() for name in os.getenv("SUPABASE_COALESCE_RPCS", "").split(",") if name.strip()})
+
+_WRITE_METHODS = frozenset({"insert", "update", "upsert", "delete"})
+
+
+class CoalescingStats:
+    """Executed vs coalesced query counts, per table/RPC."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, name: str, shared: bool):
+        with self._lock:
+            stats = self._stats.setdefault(name, {"executed": 0, "coalesced": 0})
+            stats["coalesced" if shared else "executed"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            by_source = {name: dict(s) for name, s in self._stats.items()}
+        executed = sum(s["executed"] for s in by_source.values())
+        coalesced = sum(s["coalesced"] for s in by_source.values())
+        return {
+            "enabled": SUPABASE_COALESCE,
+            "executed": executed,
+            "coalesced": coalesced,
+            "coalesced_rate": round(coalesced / (executed + coalesced), 3) if executed + coalesced else 0.0,
+            "by_source": by_source,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+coalescing_stats = CoalescingStats()
+_flight = SingleFlight()
+
+
+def _freeze(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def client_identity(client: Any) -> str:
+    """RLS identity of a client: a hash of its Authorization header, else the client object itself."""
+    if isinstance(client, CoalescingClient):
+        client = client.wrapped
+    try:
+        # postgrest.auth(token) sets the client's headers; the httpx session keeps the anon key
+        auth = client.postgrest.headers.get("Authorization")
+    except Exception:
+        auth = None
+    if auth:
+        return hashlib.sha256(auth.encode("utf-8")).hexdigest()[:16]
+    return f"client-{id(client)}"
+
+
+class _CoalescingQuery:
+    """Proxy for a postgrest builder that records its chain and coalesces execute()."""
+
+    def __init__(self, builder: Any, source: str, chain: List[tuple], read_only: bool):
+        self._builder = builder
+        self._source = source
+        self._chain = chain
+        self._read_only = read_only
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            read_only = self._read_only and name not in _WRITE_METHODS
+            step = (name, _freeze(args), _freeze(kwargs))
+            if result is self._builder:
+                # postgrest filters mutate the builder and return it; mirror that on the proxy
+                self._chain.append(step)
+                self._read_only = read_only
+                return self
+            if hasattr(result, "execute"):
+                return _CoalescingQuery(result, self._source, self._chain + [step], read_only)
+            return result
+        return call
+
+    def _coalescible(self) -> bool:
+        if not (SUPABASE_COALESCE and self._read_only):
+            return False
+        methods = {step[0] for step in self._chain}
+        return "rpc" in methods or "select" in methods
+
+    def execute(self) -> Any:
+        if not self._coalescible():
+            return self._builder.execute()
+        result, shared = _flight.do(tuple(self._chain), self._builder.execute)
+        coalescing_stats.record(self._source, shared)
+        return result
+
+
+class CoalescingClient:
+    """Supabase client proxy whose table()/from_()/rpc() reads are coalesced."""
+
+    def __init__(self, client: Any):
+        self._client = client
+        self._identity = client_identity(client)
+
+    @property
+    def wrapped(self) -> Any:
+        return self._client
+
+    def table(self, name: str) -> _CoalescingQuery:
+        return _CoalescingQuery(self._client.table(name), name, [("identity", self._identity, ""), ("table", name, "")], True)
+
+    def from_(self, name: str) -> _CoalescingQuery:
+        return _CoalescingQuery(self._client.from_(name), name, [("identity", self._identity, ""), ("table", name, "")], True)
+
+    def rpc(self, name: str, params: Optional[dict] = None, *args, **kwargs) -> _CoalescingQuery:
+        builder = self._client.rpc(name, params, *args, **kwargs)
+        chain = [("identity", self._identity, ""), ("rpc", name, _freeze(params)), ("rpc_args", _freeze(args), _freeze(kwargs))]
+        return _CoalescingQuery(builder, f"rpc:{name}", chain, name in COALESCE_RPCS)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+def coalescing(client: Any) -> Any:
+    """Wrap client for query coalescing (idempotent; None passes through)."""
+    if client is None or isinstance(client, CoalescingClient):
+        return client
+    return CoalescingClient(client)
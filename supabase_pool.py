@@ -0,0 +1,145 @@
+"""
+Pooled authenticated Supabase clients.
+
+create_client() per request builds a full Client (auth, storage, functions,
+a fresh httpx.Client) and so pays client construction plus a new TCP/TLS
+handshake on every chat. SupabaseClientPool keeps one keep-alive
+httpx.HTTPTransport (the connection pool) and hands out lightweight per-token
+views: a PostgREST client with its own httpx.Client on that transport. The
+user's Authorization header lives only on the view's client, never on anything
+shared, so it doesn't depend on how postgrest treats a passed-in http_client.
+Views are kept in an LRU keyed by token and expire with the JWT.
+
+The views only expose what the chat path uses: table() / from_() / rpc() and
+.postgrest.
+
+Env:
+- SUPABASE_POOL:             1 (default) / 0 to create a client per request
+- SUPABASE_POOL_MAX_TOKENS:  LRU size (default 1024)
+- SUPABASE_POOL_CONNECTIONS: max pooled connections (default 50)
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+import jwt
+from postgrest import SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
+
+from caching import TTLCache
+
+SUPABASE_POOL = os.getenv("SUPABASE_POOL", "1") == "1"
+SUPABASE_POOL_MAX_TOKENS = int(os.getenv("SUPABASE_POOL_MAX_TOKENS", "1024"))
+SUPABASE_POOL_CONNECTIONS = int(os.getenv("SUPABASE_POOL_CONNECTIONS", "50"))
+
+# Tokens without a readable exp claim are kept this long
+_DEFAULT_TOKEN_TTL = 300.0
+
+
+class AuthenticatedClient:
+    """Per-token Supabase view: PostgREST on the pool's shared transport."""
+
+    def __init__(self, postgrest: SyncPostgrestClient):
+        self.postgrest = postgrest
+
+    def table(self, name: str):
+        return self.postgrest.from_(name)
+
+    def from_(self, name: str):
+        return self.postgrest.from_(name)
+
+    def rpc(self, name: str, params: Optional[dict] = None, *args, **kwargs):
+        return self.postgrest.rpc(name, params or {}, *args, **kwargs)
+
+
+def token_expiry(jwt_token: str) -> Optional[float]:
+    """The exp claim of a JWT (not verified here), or None."""
+    try:
+        exp = jwt.decode(jwt_token, options={"verify_signature": False}).get("exp")
+        return float(exp) if exp else None
+    except Exception:
+        return None
+
+
+class SupabaseClientPool:
+    """Authenticated per-token views sharing one keep-alive HTTP connection pool."""
+
+    def __init__(self, url: str, key: str, max_tokens: int = SUPABASE_POOL_MAX_TOKENS,
+                 transport: Optional[httpx.BaseTransport] = None, clock: Callable[[], float] = time.time):
+        self.rest_url = f"{url.rstrip('/')}/rest/v1"
+        self.key = key
+        self.clock = clock
+        self._transport = transport or httpx.HTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=SUPABASE_POOL_CONNECTIONS, max_keepalive_connections=SUPABASE_POOL_CONNECTIONS),
+        )
+        self._views = TTLCache(maxsize=max_tokens, ttl=_DEFAULT_TOKEN_TTL, clock=clock)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired_tokens": 0, "setup_ms": 0.0}
+
+    def client_for(self, jwt_token: str) -> AuthenticatedClient:
+        """The view for jwt_token, built on first use and cached until the token expires."""
+        view = self._views.get(jwt_token)
+        if view is not None:
+            self._count(hits=1)
+            return view
+
+        start = time.perf_counter()
+        headers = {"apikey": self.key, "Authorization": f"Bearer {jwt_token}"}
+        # Never closed: closing an httpx.Client closes its transport, which is shared
+        http_client = httpx.Client(
+            base_url=self.rest_url,
+            headers=headers,
+            timeout=DEFAULT_POSTGREST_CLIENT_TIMEOUT,
+            follow_redirects=True,
+            transport=self._transport,
+        )
+        view = AuthenticatedClient(SyncPostgrestClient(self.rest_url, headers=headers, http_client=http_client))
+        expiry = token_expiry(jwt_token)
+        ttl = expiry - self.clock() if expiry else _DEFAULT_TOKEN_TTL
+        if ttl > 0:
+            self._views.set(jwt_token, view, ttl=ttl)
+        else:
+            # Let Supabase reject it, but don't keep it around
+            self._count(expired_tokens=1)
+        self._count(misses=1, setup_ms=(time.perf_counter() - start) * 1000)
+        return view
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["avg_setup_ms"] = round(stats.pop("setup_ms") / stats["misses"], 3) if stats["misses"] else 0.0
+        stats["cached_tokens"] = len(self._views)
+        return stats
+
+    def close(self):
+        self._views.clear()
+        self._transport.close()
+
+
+_POOL: Optional[SupabaseClientPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_client_pool() -> Optional[SupabaseClientPool]:
+    """The process-wide pool, or None when disabled or Supabase isn't configured."""
+    global _POOL
+    if _POOL is None and SUPABASE_POOL:
+        url = os.getenv("EXPO_PUBLIC_SUPABASE_URL")
+        key = os.getenv("EXPO_PUBLIC_SUPABASE_ANON_KEY")
+        if not (url and key):
+            return None
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = SupabaseClientPool(url, key)
+    return _POOL
@@ -0,0 +1,175 @@
+"""
+Local relative-date and clock-time resolution for customer messages.
+
+Resolves phrases such as "tomorrow at 8", "next Friday", "in 3 days",
+"this weekend" or "20:30" against the restaurant timezone, so chat_with_bot
+can annotate the user message with ISO dates/times before the agent runs and
+the model doesn't spend a tool turn on convertRelativeDate.
+
+Conventions:
+- "<weekday>" / "this <weekday>": the next occurrence, today included
+- "next <weekday>": the next occurrence strictly after today
+- "this weekend": the coming Saturday (next week's once Saturday evening or Sunday)
+- a time without am/pm and an hour of 1-11 is read as pm, i.e. dinner time:
+  "at 8" = 20:00, "8:30" / "at 7.30" = 20:30 / 19:30; a leading zero ("08:30")
+  is read as 24-hour
+- "." separates minutes only after "at" or before am/pm ("at 7.30", "7.30pm"),
+  so prices and ratings such as "20.50" are left alone
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "a": 1, "an": 1,
+}
+_NUMBER = r"(\d{1,2}|" + "|".join(_NUMBER_WORDS) + r")"
+
+_DATE_PATTERNS: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("day_after_tomorrow", re.compile(r"\b(?:the\s+)?day\s+after\s+tomorrow\b|\bovermorrow\b")),
+    ("tomorrow", re.compile(r"\b(?:tomorrow|tmrw?|tmr)\b")),
+    ("today", re.compile(r"\b(?:today|tonight|tod|this\s+evening)\b")),
+    ("yesterday", re.compile(r"\b(?:yesterday|yest)\b")),
+    ("in_days", re.compile(rf"\bin\s+{_NUMBER}\s+days?\b")),
+    ("in_weeks", re.compile(rf"\bin\s+{_NUMBER}\s+weeks?\b")),
+    ("next_week", re.compile(r"\bnext\s+week\b")),
+    ("weekend", re.compile(r"\b(?:this\s+)?weekend\b")),
+    ("next_weekday", re.compile(r"\bnext\s+(" + "|".join(_WEEKDAYS) + r")\b")),
+    ("weekday", re.compile(r"\b(?:this\s+|on\s+)?(" + "|".join(_WEEKDAYS) + r")\b")),
+]
+
+_TIME_PATTERNS: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("ampm", re.compile(r"\b(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)(?=\W|$)")),
+    ("clock", re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)\b")),
+    ("dotted", re.compile(r"\bat\s+([01]?\d|2[0-3])\.([0-5]\d)\b")),
+    ("noon", re.compile(r"\b(?:noon|midday)\b")),
+    ("bare", re.compile(r"\bat\s+(\d{1,2})\b(?!\s*(?::|\.\d|am|pm|a\.m\.|p\.m\.|people|persons|guests|pax))")),
+]
+
+
+@dataclass
+class TemporalResolution:
+    """Dates and times found in a message, as (phrase, ISO value) pairs."""
+    dates: List[Tuple[str, str]] = field(default_factory=list)
+    times: List[Tuple[str, str]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.dates or self.times)
+
+    @property
+    def first_date(self) -> Optional[str]:
+        return self.dates[0][1] if self.dates else None
+
+    @property
+    def first_time(self) -> Optional[str]:
+        return self.times[0][1] if self.times else None
+
+    def annotation(self) -> str:
+        """Render the note appended to the user message."""
+        parts = []
+        for phrase, iso in self.dates:
+            weekday = datetime.strptime(iso, "%Y-%m-%d").strftime("%A")
+            parts.append(f'"{phrase}" = {iso} ({weekday})')
+        for phrase, hhmm in self.times:
+            parts.append(f'"{phrase}" = {hhmm}')
+        return "[Resolved date/time: " + "; ".join(parts) + "]"
+
+
+def _to_int(token: str) -> int:
+    return int(token) if token.isdigit() else _NUMBER_WORDS[token]
+
+
+def _next_weekday(today: date, weekday: int, include_today: bool) -> date:
+    days_ahead = (weekday - today.weekday()) % 7
+    if days_ahead == 0 and not include_today:
+        days_ahead = 7
+    return today + timedelta(days=days_ahead)
+
+
+def _resolve_date_match(kind: str, match: "re.Match[str]", now: datetime) -> date:
+    today = now.date()
+    if kind == "day_after_tomorrow":
+        return today + timedelta(days=2)
+    if kind == "tomorrow":
+        return today + timedelta(days=1)
+    if kind == "today":
+        return today
+    if kind == "yesterday":
+        return today - timedelta(days=1)
+    if kind == "in_days":
+        return today + timedelta(days=_to_int(match.group(1)))
+    if kind == "in_weeks":
+        return today + timedelta(weeks=_to_int(match.group(1)))
+    if kind == "next_week":
+        return today + timedelta(days=7)
+    if kind == "weekend":
+        days_until_saturday = (5 - today.weekday()) % 7
+        if days_until_saturday == 0 and now.hour > 18:  # Saturday evening: next weekend
+            days_until_saturday = 7
+        return today + timedelta(days=days_until_saturday)
+    if kind == "next_weekday":
+        return _next_weekday(today, _WEEKDAYS.index(match.group(1)), include_today=False)
+    return _next_weekday(today, _WEEKDAYS.index(match.group(1)), include_today=True)
+
+
+def _resolve_time_match(kind: str, match: "re.Match[str]") -> Optional[str]:
+    if kind == "noon":
+        return "12:00"
+    hour = int(match.group(1))
+    minute = int(match.group(2)) if kind in ("ampm", "clock", "dotted") and match.group(2) else 0
+    if kind == "ampm":
+        if not 1 <= hour <= 12:
+            return None
+        is_pm = match.group(3).startswith("p")
+        hour = (hour % 12) + (12 if is_pm else 0)
+    elif kind in ("clock", "dotted"):
+        # Same dinner-time default as a bare hour; "08:30" is explicit 24-hour time
+        if 1 <= hour <= 11 and not match.group(1).startswith("0"):
+            hour += 12
+    elif kind == "bare":
+        if not 1 <= hour <= 23:
+            return None
+        if hour <= 11:
+            hour += 12
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _claim(spans: List[Tuple[int, int]], match: "re.Match[str]") -> bool:
+    """Record a match span unless it overlaps one already used."""
+    start, end = match.span()
+    if any(start < s_end and s_start < end for s_start, s_end in spans):
+        return False
+    spans.append((start, end))
+    return True
+
+
+def resolve_temporal_expressions(text: str, now: datetime) -> TemporalResolution:
+    """Find relative dates and clock times in text and resolve them against now."""
+    lowered = (text or "").lower()
+    resolution = TemporalResolution()
+    spans: List[Tuple[int, int]] = []
+
+    found = []
+    for kind, pattern in _DATE_PATTERNS:
+        for match in pattern.finditer(lowered):
+            if _claim(spans, match):
+                found.append((match.start(), match.group(0).strip(), _resolve_date_match(kind, match, now).strftime("%Y-%m-%d")))
+    resolution.dates = [(phrase, iso) for _, phrase, iso in sorted(found)]
+
+    found = []
+    for kind, pattern in _TIME_PATTERNS:
+        for match in pattern.finditer(lowered):
+            hhmm = _resolve_time_match(kind, match)
+            if hhmm and _claim(spans, match):
+                found.append((match.start(), match.group(0).strip(), hhmm))
+    resolution.times = [(phrase, hhmm) for _, phrase, hhmm in sorted(found)]
+    return resolution
+
+
+def resolve_relative_date(phrase: str, now: datetime) -> Optional[str]:
+    """Resolve a single relative-date phrase to YYYY-MM-DD, or None if not recognised."""
+    return resolve_temporal_expressions(phrase, now).first_date
@@ -0,0 +1,222 @@
+"""
+Parallel tool execution for the LangGraph agents.
+
+Replaces the prebuilt ToolNode so that several tool calls emitted in a single
+AIMessage (e.g. availability for three restaurants) run concurrently on a
+bounded worker pool, each with its own timeout. Every execution is recorded in
+agent_metrics.tool_metrics. Under app.ainvoke() (acall) the same pool runs the
+tools while the event loop awaits them.
+
+The per-tool timeout runs from when a worker starts the call, so time spent
+queued behind other requests' tools isn't charged to the tool (or recorded as
+a tool timeout). Tool calls count against the request's step budget, and
+nothing waits past the request deadline (request_context.RequestBudget),
+whether the call is running or still queued.
+
+Env:
+  TOOL_MAX_WORKERS=8          (size of the shared worker pool)
+  TOOL_TIMEOUT_SECONDS=20     (per-tool timeout, from the moment the call starts)
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from agent_metrics import tool_metrics
+from request_context import current_budget, current_tool_results, emit_event
+
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "8"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "20"))
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """Return the shared, bounded worker pool used for tool calls."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="agent-tool")
+    return _EXECUTOR
+
+
+def _seconds_until(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else max(0.0, deadline - time.perf_counter())
+
+
+class _CallState:
+    """When a worker picked up one tool call, and whether the caller gave up on it."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.abandoned = threading.Event()
+        self.started = threading.Event()
+        self.started_at: Optional[float] = None
+        self.loop = loop
+        self.started_future = loop.create_future() if loop is not None else None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.started.set()
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(lambda: self.started_future.done() or self.started_future.set_result(None))
+            except RuntimeError:
+                pass  # loop already closed; nobody is waiting
+
+
+class ParallelToolNode:
+    """Graph node that executes all tool calls of the last AIMessage concurrently.
+
+    Each call runs in a copy of the caller's context, so tools see the
+    request_scope() (client, user, restaurant) of the request that made it.
+    """
+
+    def __init__(self, tools: List[Any], timeout: Optional[float] = None, name: str = "tools"):
+        self.tools_by_name: Dict[str, Any] = {t.name: t for t in tools}
+        self.timeout = timeout if timeout is not None else TOOL_TIMEOUT_SECONDS
+        self.name = name
+
+    @staticmethod
+    def _note_failure(tool_name: str):
+        stash = current_tool_results()
+        if stash is not None:
+            stash.note_failure(tool_name)
+
+    def _run_tool(self, call: dict, state: _CallState) -> ToolMessage:
+        state.start()
+        tool_name = call["name"]
+        start = state.started_at
+        ok = True
+        emit_event("tool_start", tool=tool_name)
+        stash = current_tool_results()
+        if stash is not None:
+            stash.note_call(tool_name)
+        try:
+            selected = self.tools_by_name.get(tool_name)
+            if selected is None:
+                ok = False
+                content = f"Error: {tool_name} is not a valid tool, try one of [{', '.join(self.tools_by_name)}]."
+            else:
+                output = selected.invoke(call.get("args") or {})
+                content = output if isinstance(output, str) else json.dumps(output, default=str)
+        except Exception as e:
+            ok = False
+            content = f"Error running {tool_name}: {str(e)}"
+        # Tools catch their own exceptions and answer "Error ..." or {"error": ...}
+        if not ok or content.lstrip().startswith(("Error", '{"error"')):
+            self._note_failure(tool_name)
+        if not state.abandoned.is_set():
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            tool_metrics.record(tool_name, elapsed_ms, ok=ok)
+            emit_event("tool_end", tool=tool_name, ok=ok, ms=round(elapsed_ms, 1))
+        return ToolMessage(content=content, name=tool_name, tool_call_id=call["id"], status="success" if ok else "error")
+
+    def _tool_calls(self, state: dict) -> List[dict]:
+        last_message = state["messages"][-1]
+        return (getattr(last_message, "tool_calls", None) or []) if isinstance(last_message, AIMessage) else []
+
+    def _request_deadline(self, tool_calls: List[dict]) -> Optional[float]:
+        """Charge the calls to the request budget; returns its deadline (perf_counter time), or None."""
+        budget = current_budget()
+        if budget is None:
+            return None
+        budget.charge(tool_calls=len(tool_calls))
+        remaining = budget.remaining_seconds()
+        return None if remaining is None else time.perf_counter() + remaining
+
+    def _run_deadline(self, state: _CallState, request_deadline: Optional[float]) -> float:
+        """The call's own timeout from when it started, capped at the request deadline."""
+        deadline = state.started_at + self.timeout
+        return deadline if request_deadline is None else min(deadline, request_deadline)
+
+    def _abandon(self, call: dict, future: Any, state: _CallState) -> ToolMessage:
+        # The worker can't be interrupted; mark it so its late completion isn't double-counted
+        state.abandoned.set()
+        future.cancel()
+        name = call["name"]
+        timed_out = False
+        if state.started_at is None:
+            # Queued until the request ran out of time: not the tool's timeout
+            print(f"Tool {name} didn't start before the request deadline")
+            error = f"{name} was not run: the request ran out of time"
+        else:
+            seconds = time.perf_counter() - state.started_at
+            timed_out = seconds >= self.timeout
+            tool_metrics.record(name, seconds * 1000, ok=False, timed_out=timed_out)
+            if timed_out:
+                print(f"Tool {name} timed out after {seconds:.3g}s")
+                error = f"{name} timed out after {seconds:.3g} seconds"
+            else:
+                print(f"Tool {name} stopped at the request deadline after {seconds:.3g}s")
+                error = f"{name} was stopped after {seconds:.3g} seconds: the request ran out of time"
+        self._note_failure(name)
+        emit_event("tool_end", tool=name, ok=False, timed_out=timed_out)
+        return ToolMessage(content=json.dumps({"error": error}), name=name, tool_call_id=call["id"], status="error")
+
+    def _submit(self, tool_calls: List[dict], loop: Optional[asyncio.AbstractEventLoop] = None) -> List[Tuple[Any, _CallState]]:
+        executor = get_tool_executor()
+        futures = []
+        for call in tool_calls:
+            # Each task gets its own context copy; a Context can't be entered by two threads at once
+            ctx = contextvars.copy_context()
+            state = _CallState(loop)
+            if loop is None:
+                future = executor.submit(ctx.run, self._run_tool, call, state)
+            else:
+                future = loop.run_in_executor(executor, ctx.run, self._run_tool, call, state)
+            futures.append((future, state))
+        if len(tool_calls) > 1:
+            print(f"Running {len(tool_calls)} tool calls in parallel")
+        return futures
+
+    def __call__(self, state: dict) -> dict:
+        tool_calls = self._tool_calls(state)
+        if not tool_calls:
+            return {"messages": []}
+
+        request_deadline = self._request_deadline(tool_calls)
+        futures = self._submit(tool_calls)
+
+        messages: List[ToolMessage] = []
+        for call, (future, state) in zip(tool_calls, futures):
+            # Queue time only counts against the request deadline
+            if not state.started.wait(_seconds_until(request_deadline)):
+                messages.append(self._abandon(call, future, state))
+                continue
+            try:
+                messages.append(future.result(timeout=_seconds_until(self._run_deadline(state, request_deadline))))
+            except FutureTimeoutError:
+                messages.append(self._abandon(call, future, state))
+        return {"messages": messages}
+
+    async def acall(self, state: dict) -> dict:
+        """Async __call__: awaits the pooled tool calls without blocking the event loop."""
+        tool_calls = self._tool_calls(state)
+        if not tool_calls:
+            return {"messages": []}
+
+        request_deadline = self._request_deadline(tool_calls)
+        futures = self._submit(tool_calls, asyncio.get_running_loop())
+
+        messages: List[ToolMessage] = []
+        for call, (future, state) in zip(tool_calls, futures):
+            try:
+                # Queue time only counts against the request deadline
+                await asyncio.wait_for(asyncio.shield(state.started_future), _seconds_until(request_deadline))
+            except asyncio.TimeoutError:
+                messages.append(self._abandon(call, future, state))
+                continue
+            try:
+                messages.append(await asyncio.wait_for(asyncio.shield(future), _seconds_until(self._run_deadline(state, request_deadline))))
+            except asyncio.TimeoutError:
+                messages.append(self._abandon(call, future, state))
+        return {"messages": messages}
@@ -0,0 +1,134 @@
+"""
+Compact, LLM-facing views of customer tool outputs.
+
+Restaurant search tools used to return json.dumps of full rows (up to 50),
+and that JSON is re-read by every following agent_node call. The compact view
+is a header + rows table with short field names, truncated descriptions and a
+top-k cap:
+
+  {"fields": ["id", "name", ...], "rows": [["r-1", "Em Sherif", ...]], "total": 12}
+
+The full rows are stashed in the request's ToolResultStash (request_context)
+so RESTAURANTS_TO_SHOW fallbacks, the fast path and card rendering still have
+every column. Byte/token savings per tool are kept in tool_output_stats.
+
+Env:
+- TOOL_OUTPUT_MODE:       compact (default) or full (previous behaviour)
+- TOOL_OUTPUT_TOP_K:      max rows shown to the model (default 10)
+- TOOL_OUTPUT_DESC_CHARS: description truncation (default 80)
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from agent_metrics import estimate_tokens
+from request_context import current_tool_results
+
+TOOL_OUTPUT_MODE = os.getenv("TOOL_OUTPUT_MODE", "compact").lower()
+TOOL_OUTPUT_TOP_K = int(os.getenv("TOOL_OUTPUT_TOP_K", "10"))
+TOOL_OUTPUT_DESC_CHARS = int(os.getenv("TOOL_OUTPUT_DESC_CHARS", "80"))
+
+RESTAURANT_FIELDS = ["id", "name", "cuisine", "price", "rating", "featured", "outdoor", "hours", "tags", "addr", "desc"]
+_MAX_TAGS = 6
+_ADDRESS_CHARS = 40
+
+
+def _truncate(text: Any, limit: int) -> str:
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _as_list(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [str(v) for v in value if v]
+    if isinstance(value, str) and value.strip():
+        return [v.strip() for v in value.strip("{}").split(",") if v.strip()]
+    return []
+
+
+def _compact_restaurant(row: dict, desc_chars: int) -> list:
+    tags = list(dict.fromkeys(_as_list(row.get("tags")) + _as_list(row.get("ambiance_tags")) + _as_list(row.get("dietary_options"))))
+    opening, closing = (str(row.get("opening_time") or "")[:5], str(row.get("closing_time") or "")[:5])
+    rating = row.get("average_rating")
+    return [
+        row.get("id"),
+        row.get("name"),
+        row.get("cuisine_type"),
+        row.get("price_range"),
+        round(float(rating), 1) if isinstance(rating, (int, float)) else rating,
+        bool(row.get("ai_featured")),
+        bool(row.get("outdoor_seating")),
+        f"{opening}-{closing}" if opening and closing else None,
+        ",".join(tags[:_MAX_TAGS]),
+        _truncate(row.get("address"), _ADDRESS_CHARS),
+        _truncate(row.get("description"), desc_chars),
+    ]
+
+
+def compact_restaurants(rows: List[dict], top_k: Optional[int] = None, desc_chars: Optional[int] = None) -> dict:
+    """Project full restaurant rows onto the compact table view."""
+    top_k = top_k or TOOL_OUTPUT_TOP_K
+    desc_chars = desc_chars or TOOL_OUTPUT_DESC_CHARS
+    shown = [r for r in rows if isinstance(r, dict)][:top_k]
+    return {
+        "fields": RESTAURANT_FIELDS,
+        "rows": [_compact_restaurant(r, desc_chars) for r in shown],
+        "total": len(rows),
+    }
+
+
+def expand_compact(payload: Any) -> Any:
+    """Turn a compact table view back into a list of dicts (short field names); other payloads pass through."""
+    if isinstance(payload, dict) and isinstance(payload.get("fields"), list) and isinstance(payload.get("rows"), list):
+        return [dict(zip(payload["fields"], row)) for row in payload["rows"]]
+    return payload
+
+
+class ToolOutputStats:
+    """Per-tool full vs compact output size counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, tool_name: str, full_text: str, compact_text: str):
+        with self._lock:
+            stats = self._stats.setdefault(tool_name, {"calls": 0, "full_bytes": 0, "compact_bytes": 0, "full_tokens": 0, "compact_tokens": 0})
+            stats["calls"] += 1
+            stats["full_bytes"] += len(full_text.encode("utf-8"))
+            stats["compact_bytes"] += len(compact_text.encode("utf-8"))
+            stats["full_tokens"] += estimate_tokens(full_text)
+            stats["compact_tokens"] += estimate_tokens(compact_text)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            result = {}
+            for name, s in self._stats.items():
+                result[name] = dict(s)
+                result[name]["bytes_saved"] = s["full_bytes"] - s["compact_bytes"]
+                result[name]["tokens_saved"] = s["full_tokens"] - s["compact_tokens"]
+                result[name]["saved_pct"] = round(100 * (1 - s["compact_bytes"] / s["full_bytes"]), 1) if s["full_bytes"] else 0.0
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+tool_output_stats = ToolOutputStats()
+
+
+def restaurants_for_llm(tool_name: str, rows: List[dict], top_k: Optional[int] = None) -> str:
+    """Stash the full rows for the request and return the model-facing JSON for a restaurant tool."""
+    stash = current_tool_results()
+    if stash is not None:
+        stash.put(tool_name, rows)
+    full_text = json.dumps(rows)
+    if TOOL_OUTPUT_MODE == "full":
+        tool_output_stats.record(tool_name, full_text, full_text)
+        return full_text
+    compact_text = json.dumps(compact_restaurants(rows, top_k=top_k), ensure_ascii=False, separators=(",", ":"))
+    tool_output_stats.record(tool_name, full_text, compact_text)
+    return compact_text